@@ -0,0 +1,95 @@
+"""Benchmark event loop lag and throughput of Retrieval with hashing done inline on
+the event loop compared to hashing on a thread pool. A local server in a separate
+process streams large files from a different loopback address per file so that the
+per host connection limit and rate limiter do not serialise the downloads.
+
+Usage: python benchmarks/benchmark_hashing.py [--files 40] [--size-mb 64]
+"""
+
+import argparse
+import asyncio
+import statistics
+from multiprocessing import Process
+from time import sleep
+from timeit import default_timer as timer
+
+from aiohttp import web
+
+from hdx.freshness.utils.retrieval import Retrieval
+
+PORT = 8765
+CHUNK = b"0123456789abcdef" * 4096
+
+
+def serve(size: int) -> None:
+    async def handler(request):
+        response = web.StreamResponse(headers={"Content-Type": "text/csv"})
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        for _ in range(size // len(CHUNK)):
+            await response.write(CHUNK)
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/{name}", handler)
+    web.run_app(app, host="0.0.0.0", port=PORT, print=None)
+
+
+async def measure(retrieval: Retrieval, urls, interval: float = 0.01):
+    lags = []
+    done = False
+
+    async def monitor():
+        loop = asyncio.get_running_loop()
+        while not done:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            lags.append(loop.time() - start - interval)
+
+    monitor_task = asyncio.create_task(monitor())
+    start = timer()
+    results = await retrieval.check_urls(urls)
+    elapsed = timer() - start
+    done = True
+    await monitor_task
+    return results, elapsed, lags
+
+
+def main(files: int, size_mb: int, threads: int) -> None:
+    size = size_mb * 1024 * 1024
+    server = Process(target=serve, args=(size,), daemon=True)
+    server.start()
+    sleep(2)
+    urls = [
+        (f"http://127.0.0.{i + 1}:{PORT}/file{i}.csv", str(i), "csv")
+        for i in range(files)
+    ]
+    total_mb = files * size_mb
+    try:
+        hashes = None
+        for name, hashing_threads in (("inline", 0), ("executor", threads)):
+            retrieval = Retrieval("benchmark", hashing_threads=hashing_threads)
+            results, elapsed, lags = asyncio.run(measure(retrieval, urls))
+            if hashes is None:
+                hashes = {k: v[4] for k, v in results.items()}
+            else:
+                assert hashes == {k: v[4] for k, v in results.items()}
+            lags_ms = sorted(x * 1000 for x in lags)
+            p99 = lags_ms[int(len(lags_ms) * 0.99)]
+            print(
+                f"{name:>8}: {elapsed:6.2f}s {total_mb / elapsed:8.1f} MB/s, "
+                f"loop lag mean {statistics.mean(lags_ms):6.2f}ms "
+                f"p99 {p99:6.2f}ms max {lags_ms[-1]:6.2f}ms"
+            )
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hashing benchmark")
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+    main(args.files, args.size_mb, args.threads)
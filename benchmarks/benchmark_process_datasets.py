@@ -0,0 +1,199 @@
+"""Benchmark the metadata stage (process_datasets) against a synthetic sqlite
+database holding a previous run. Reports the wall time and the number of SQL
+statements executed.
+
+Usage: python benchmarks/benchmark_process_datasets.py [--datasets 30000]
+    [--resources 200000] [--organizations 1500]
+"""
+
+import argparse
+from datetime import timedelta
+from os import remove
+from os.path import join
+from tempfile import gettempdir
+from timeit import default_timer as timer
+
+from sqlalchemy import event, insert
+
+from hdx.api.configuration import Configuration
+from hdx.data.dataset import Dataset
+from hdx.database import Database
+from hdx.freshness.app.__main__ import main as freshness_main
+from hdx.freshness.app.datafreshness import DataFreshness
+from hdx.freshness.database import Base
+from hdx.freshness.database.dbdataset import DBDataset
+from hdx.freshness.database.dbinfodataset import DBInfoDataset
+from hdx.freshness.database.dborganization import DBOrganization
+from hdx.freshness.database.dbresource import DBResource
+from hdx.freshness.database.dbrun import DBRun
+from hdx.utilities.dateparse import parse_date
+from hdx.utilities.path import script_dir_plus_file
+
+BATCH = 10000
+FREQUENCIES = (1, 7, 30, 90, 365, -1, -2)
+
+
+def generate(session, datasets: int, resources: int, organizations: int, now):
+    previous = now - timedelta(days=1)
+    modified = now - timedelta(days=10)
+    session.execute(insert(DBRun), [{"run_number": 0, "run_date": previous}])
+    session.execute(
+        insert(DBOrganization),
+        [
+            {"id": f"org{i}", "name": f"org{i}", "title": f"Org {i}"}
+            for i in range(organizations)
+        ],
+    )
+    infodatasets = []
+    dbdatasets = []
+    hdxdatasets = []
+    for i in range(datasets):
+        dataset_id = f"dataset{i}"
+        organization_id = f"org{i % organizations}"
+        infodatasets.append(
+            {
+                "id": dataset_id,
+                "name": dataset_id,
+                "title": f"Dataset {i}",
+                "private": False,
+                "organization_id": organization_id,
+                "maintainer": "maintainer",
+                "location": "afg",
+            }
+        )
+        update_frequency = FREQUENCIES[i % len(FREQUENCIES)]
+        dbdatasets.append(
+            {
+                "run_number": 0,
+                "id": dataset_id,
+                "update_frequency": update_frequency,
+                "last_modified": modified,
+                "metadata_modified": modified,
+                "latest_of_modifieds": modified,
+                "what_updated": "firstrun",
+                "last_resource_updated": f"resource{i}",
+                "last_resource_modified": modified,
+                "fresh": 0,
+                "error": False,
+            }
+        )
+        hdxdatasets.append(
+            {
+                "id": dataset_id,
+                "name": dataset_id,
+                "title": f"Dataset {i}",
+                "private": False,
+                "maintainer": "maintainer",
+                "organization": {
+                    "id": organization_id,
+                    "name": organization_id,
+                    "title": f"Org {i % organizations}",
+                },
+                "groups": [{"name": "afg"}],
+                "data_update_frequency": str(update_frequency),
+                "metadata_modified": modified.isoformat(),
+                "last_modified": modified.isoformat(),
+                "resources": [],
+            }
+        )
+    for start in range(0, datasets, BATCH):
+        session.execute(insert(DBInfoDataset), infodatasets[start : start + BATCH])
+        session.execute(insert(DBDataset), dbdatasets[start : start + BATCH])
+    dbresources = []
+    for i in range(resources):
+        resource_id = f"resource{i}"
+        dataset = hdxdatasets[i % datasets]
+        url = f"https://example.org/{resource_id}.csv"
+        dbresources.append(
+            {
+                "run_number": 0,
+                "id": resource_id,
+                "name": resource_id,
+                "dataset_id": dataset["id"],
+                "url": url,
+                "last_modified": modified,
+                "metadata_modified": modified,
+                "latest_of_modifieds": modified,
+                "what_updated": "firstrun",
+                "md5_hash": "0123456789abcdef",
+                "when_checked": previous,
+                "api": False,
+            }
+        )
+        dataset["resources"].append(
+            {
+                "id": resource_id,
+                "name": resource_id,
+                "url": url,
+                "format": "csv",
+                "last_modified": modified.isoformat(),
+                "metadata_modified": modified.isoformat(),
+            }
+        )
+        if len(dbresources) == BATCH:
+            session.execute(insert(DBResource), dbresources)
+            dbresources = []
+    if dbresources:
+        session.execute(insert(DBResource), dbresources)
+    session.commit()
+    return [Dataset(x) for x in hdxdatasets]
+
+
+def main(datasets: int, resources: int, organizations: int) -> None:
+    project_config_yaml = script_dir_plus_file(
+        "project_configuration.yaml", freshness_main
+    )
+    Configuration._create(
+        hdx_site="prod",
+        user_agent="benchmark",
+        hdx_read_only=True,
+        project_config_yaml=project_config_yaml,
+    )
+    configuration = Configuration.read()
+    dbpath = join(gettempdir(), "benchmark_process_datasets.db")
+    try:
+        remove(dbpath)
+    except FileNotFoundError:
+        pass
+    now = parse_date("2024-01-02 12:00:00", include_microseconds=True)
+    with Database(database=dbpath, dialect="sqlite", table_base=Base) as database:
+        session = database.get_session()
+        start = timer()
+        hdxdatasets = generate(session, datasets, resources, organizations, now)
+        print(f"generated database in {timer() - start:.1f}s")
+        statements = 0
+
+        def count(*args):
+            nonlocal statements
+            statements += 1
+
+        event.listen(session.get_bind(), "before_cursor_execute", count)
+        freshness = DataFreshness(
+            configuration=configuration,
+            session=session,
+            datasets=hdxdatasets,
+            now=now,
+            do_touch=False,
+            dont_hash=True,
+        )
+        freshness.spread_datasets()
+        freshness.add_new_run()
+        statements = 0
+        start = timer()
+        freshness.process_datasets()
+        session.commit()
+        elapsed = timer() - start
+        print(
+            f"process_datasets: {datasets} datasets, {resources} resources in "
+            f"{elapsed:.1f}s with {statements} SQL statements"
+        )
+    remove(dbpath)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="process_datasets benchmark")
+    parser.add_argument("--datasets", type=int, default=30000)
+    parser.add_argument("--resources", type=int, default=200000)
+    parser.add_argument("--organizations", type=int, default=1500)
+    args = parser.parse_args()
+    main(args.datasets, args.resources, args.organizations)
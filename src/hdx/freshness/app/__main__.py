@@ -2,11 +2,16 @@
 
 import argparse
 import logging
+from contextlib import ExitStack
 from os import getenv
 from typing import Optional
 
 from .. import __version__
+from ..catalogue import Base as CatalogueBase
+from ..catalogue.cataloguecache import CatalogueCache
 from ..database import Base
+from ..database.compacttypes import set_compact_types
+from ..database.partitions import partition_tables
 from .datafreshness import DataFreshness
 from hdx.api.configuration import Configuration
 from hdx.database import Database
@@ -26,17 +31,24 @@ def main(
     db_params: Optional[str] = None,
     do_touch: bool = False,
     save: bool = False,
+    catalogue_cache: Optional[str] = None,
     **ignore,
 ) -> None:
     """Run freshness. Either a database connection string (db_uri) or database
     connection parameters (db_params) can be supplied. If neither is supplied, a local
-    SQLite database with filename "freshness.db" is assumed.
+    SQLite database with filename "freshness.db" is assumed. If partition_by_run is
+    set in the configuration, a new Postgres database is created with the dataset and
+    resource tables partitioned by run number. If compact_types is set in the
+    configuration, ids and hashes are stored compactly in Postgres. If a catalogue
+    cache filename is supplied, datasets are read from a local SQLite cache of the HDX
+    catalogue that is updated incrementally at the start of the run.
 
     Args:
         db_uri (Optional[str]): Database connection URI. Defaults to None.
         db_params (Optional[str]): Database connection parameters. Defaults to None.
         do_touch (bool): Touch HDX datasets if files change. Defaults to False.
         save (bool): Whether to save state for testing. Defaults to False.
+        catalogue_cache (Optional[str]): Catalogue cache filename. Defaults to None.
 
     Returns:
         None
@@ -50,17 +62,33 @@ def main(
     else:
         params = {"dialect": "sqlite", "database": "freshness.db"}
     logger.info(f"> Database parameters: {params}")
-    with Database(**params, table_base=Base) as database:
+    if configuration.get("partition_by_run", False):
+        params["prepare_fn"] = partition_tables
+    set_compact_types(configuration.get("compact_types", False))
+    with ExitStack() as stack:
+        database = stack.enter_context(Database(**params, table_base=Base))
         testsession = None
         if save:
             testsession = Database.get_session("sqlite:///test_serialize.db")
-        # Setup including reading all datasets from HDX and setting threshold for how
-        # many resources to force hash
+            stack.callback(testsession.close)
+        catalogue = None
+        if catalogue_cache:
+            cataloguedatabase = stack.enter_context(
+                Database(
+                    dialect="sqlite",
+                    database=catalogue_cache,
+                    table_base=CatalogueBase,
+                )
+            )
+            catalogue = CatalogueCache(cataloguedatabase.get_session(), configuration)
+        # Setup including reading all datasets from HDX (unless they are to be read in
+        # pages) and setting threshold for how many resources to force hash
         freshness = DataFreshness(
             configuration=configuration,
             session=database.get_session(),
             testsession=testsession,
             do_touch=do_touch,
+            catalogue=catalogue,
         )
         # Arrange order of list of datasets so that datasets from the same organisation
         # are moved away from each other
@@ -81,10 +109,9 @@ def main(
         freshness.update_dataset_latest_of_modifieds(
             datasets_to_check, datasets_resourcesinfo
         )
-        # Display output string
+        # Display output string and store counts for the run
         freshness.output_counts()
-        if testsession:
-            testsession.close()
+        freshness.write_counts()
     logger.info("Freshness completed!")
 
 
@@ -110,6 +137,12 @@ if __name__ == "__main__":
         action="store_true",
         help="Don't touch datasets",
     )
+    parser.add_argument(
+        "-cc",
+        "--catalogue_cache",
+        default=None,
+        help="Filename of local cache of HDX catalogue",
+    )
     parser.add_argument(
         "-s",
         "--save",
@@ -149,4 +182,5 @@ if __name__ == "__main__":
         db_params=args.db_params,
         do_touch=not args.donttouch,
         save=args.save,
+        catalogue_cache=args.catalogue_cache,
     )
@@ -3,33 +3,46 @@
 import logging
 import re
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List, Optional, Tuple, Union
+from functools import partial
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 from urllib.parse import urlparse
 
 from dateutil.parser import ParserError
-from sqlalchemy import exists, select
-from sqlalchemy.exc import NoResultFound
+from sqlalchemy import case, insert, literal, null, select
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 
+from ..catalogue.cataloguecache import CatalogueCache
 from ..database.dbdataset import DBDataset
 from ..database.dbinfodataset import DBInfoDataset
 from ..database.dborganization import DBOrganization
 from ..database.dbresource import DBResource
 from ..database.dbrun import DBRun
+from ..database.dbwhatupdatedcount import DBWhatUpdatedCount
+from ..database.partitions import create_run_partitions
+from ..database.whatupdated import WhatUpdated
 from ..testdata.serialize import (
     serialize_datasets,
     serialize_hashresults,
     serialize_now,
     serialize_results,
 )
+from ..utils.bulkwriter import BulkWriter
+from ..utils.pagefetcher import PageFetcher
 from ..utils.retrieval import Retrieval
+from ..utils.writeback import WriteBackQueue
+from .freshnessengine import FreshnessEngine
+from .hashhistory import HashHistory
+from .hashpolicy import HashPolicy
+from .runregistry import RunRegistry
+from .whatupdatedcounts import WhatUpdatedCounts
 from hdx.api.configuration import Configuration
 from hdx.data.dataset import Dataset
 from hdx.data.hdxobject import HDXError
 from hdx.data.resource import Resource
 from hdx.utilities.dateparse import now_utc, parse_date
 from hdx.utilities.dictandlist import (
-    dict_of_lists_add,
     list_distribute_contents,
 )
 
@@ -48,6 +61,7 @@ class DataFreshness:
         now (datetime): Date to use or take current time if None
         do_touch (bool): Whether to touch HDX resources whose hash has changed
         dont_hash (bool): Whether to hash HDX resources
+        catalogue (Optional[CatalogueCache]): Catalogue cache to read datasets from
     """
 
     bracketed_date = re.compile(r"\((.*)\)")
@@ -61,6 +75,7 @@ class DataFreshness:
         now: datetime = None,
         do_touch: bool = False,
         dont_hash: bool = True,
+        catalogue: Optional[CatalogueCache] = None,
     ) -> None:
         """"""
         self.session = session
@@ -69,23 +84,37 @@ class DataFreshness:
         self.never_update = 0
         self.live_update = 0
         self.asneeded_update = 0
-        self.dataset_what_updated = {}
-        self.resource_what_updated = {}
+        sample_size = configuration.get("what_updated_sample_size", 0)
+        self.dataset_what_updated = WhatUpdatedCounts(sample_size)
+        self.resource_what_updated = WhatUpdatedCounts(sample_size)
         self.resource_last_modified_count = 0
         self.resource_broken_count = 0
+        self.previous_dbdatasets: Dict[str, Row] = {}
+        self.previous_dbresources: Dict[str, Row] = {}
+        self.bulkwriter = BulkWriter(session)
+        self.incremental = configuration.get("incremental", False)
+        self.run_partition_size = configuration.get("run_partition_size", 30)
+        self.carried_dataset_ids: List[str] = []
+        self.carried_resource_ids: List[str] = []
         self.do_touch = do_touch
         self.dont_hash = dont_hash
 
         self.url_internal = "data.humdata.org"
 
-        self.freshness_by_frequency = {}
-        for key, value in configuration["aging"].items():
-            update_frequency = int(key)
-            freshness_frequency = {}
-            for status in value:
-                nodays = value[status]
-                freshness_frequency[status] = timedelta(days=nodays)
-            self.freshness_by_frequency[update_frequency] = freshness_frequency
+        self.freshness_engine = FreshnessEngine(configuration["aging"])
+        self.freshness_by_frequency = self.freshness_engine.freshness_by_frequency
+        self.max_sizes = configuration.get("max_sizes")
+        self.hashing_threads = configuration.get("hashing_threads", 0)
+        self.writeback_threads = configuration.get("writeback_threads", 4)
+        self.writeback_rate = configuration.get("writeback_rate", 4)
+        self.writeback_retries = configuration.get("writeback_retries", 2)
+        self.writeback_batch = configuration.get("writeback_batch", False)
+        hash_policy = configuration.get("hash_policy")
+        if hash_policy is None:
+            self.hash_policy: Optional[HashPolicy] = None
+        else:
+            self.hash_policy: Optional[HashPolicy] = HashPolicy(session, **hash_policy)
+        self.hash_history = HashHistory(session)
         self.freshness_statuses = {
             0: "0: Fresh",
             1: "1: Due",
@@ -94,7 +123,18 @@ class DataFreshness:
             None: "Freshness Unavailable",
         }
         self.testsession: Optional[Session] = testsession
-        if datasets is None:  # pragma: no cover
+        self.page_size = configuration.get("dataset_page_size", 0)
+        self.page_threads = configuration.get("dataset_page_threads", 1)
+        self.page_rate = configuration.get("dataset_page_rate", 4)
+        self.catalogue = catalogue
+        if datasets is None and catalogue is not None:
+            logger.info("Updating catalogue cache from HDX")
+            catalogue.sync()
+            self.datasets: Optional[List[Dataset]] = None
+        elif datasets is None and self.page_size:
+            logger.info(f"Will retrieve datasets from HDX in pages of {self.page_size}")
+            self.datasets: Optional[List[Dataset]] = None
+        elif datasets is None:  # pragma: no cover
             Configuration.read().set_read_only(
                 True
             )  # so that we only get public datasets
@@ -128,6 +168,7 @@ class DataFreshness:
             self.previous_run_number = None
             self.run_number = 0
             self.no_urls_to_check = default_no_urls_to_check
+        self.registry = RunRegistry(session, self.run_number)
 
         logger.info(f"Will force hash {self.no_urls_to_check} resources")
 
@@ -160,43 +201,199 @@ class DataFreshness:
 
     def spread_datasets(self) -> None:
         """Try to arrange the list of datasets so that downloads don't keep hitting the
-        same server by moving apart datasets from the same organisation
+        same server by moving apart datasets from the same organisation. When datasets
+        are retrieved from HDX in pages, each page is spread as it is retrieved.
 
         Returns:
             None
         """
+        if self.datasets is None:
+            return
         self.datasets: List[Dataset] = list_distribute_contents(
             self.datasets, lambda x: x["organization"]["name"]
         )
 
+    def get_dataset_pages(self) -> Iterator[List[Dataset]]:
+        """Get pages of HDX datasets. If a list of datasets was supplied or all
+        datasets were retrieved up front, it is returned as a single page. Otherwise
+        pages of datasets are read from the catalogue cache if there is one or are
+        retrieved from HDX with package_search, each being spread by organisation as
+        it arrives. The total count is obtained first and if dataset_page_threads is
+        more than 1, pages are fetched concurrently while earlier pages are being
+        processed. A warning is logged if the number of datasets retrieved differs
+        from the count.
+
+        Returns:
+            Iterator[List[Dataset]]: Pages of HDX datasets
+        """
+        if self.datasets is not None:
+            yield self.datasets
+            return
+        if self.catalogue is not None:
+            page_size = self.page_size if self.page_size else 1000
+            for datasets in self.catalogue.get_pages(page_size):
+                if self.testsession:
+                    serialize_datasets(self.testsession, datasets)
+                yield list_distribute_contents(
+                    datasets, lambda x: x["organization"]["name"]
+                )
+            return
+        configuration = Configuration.read()
+
+        def get_page(start: int, rows: int) -> List[Dataset]:
+            # one package_search per page (search_in_hdx makes another for full pages)
+            result = configuration.call_remoteckan(
+                "package_search",
+                {
+                    "q": "*:*",
+                    "rows": rows,
+                    "start": start,
+                    "sort": "metadata_created asc",
+                },
+            )
+            datasets = []
+            for datasetdict in result["results"]:
+                dataset = Dataset(datasetdict, configuration=configuration)
+                dataset.separate_resources()
+                datasets.append(dataset)
+            return datasets
+
+        configuration.set_read_only(True)  # so that we only get public datasets
+        try:
+            result = configuration.call_remoteckan(
+                "package_search", {"q": "*:*", "rows": 0}
+            )
+            count = result["count"]
+            logger.info(f"Retrieving {count} datasets from HDX")
+            pages = PageFetcher(
+                get_page,
+                count,
+                self.page_size,
+                threads=max(self.page_threads, 1),
+                rate=self.page_rate,
+            )
+            dataset_ids = set()
+            for datasets in pages:
+                # a dataset can appear again if one is added before it during paging
+                datasets = [x for x in datasets if x["id"] not in dataset_ids]
+                dataset_ids.update(x["id"] for x in datasets)
+                if not datasets:
+                    continue
+                if self.testsession:
+                    serialize_datasets(self.testsession, datasets)
+                yield list_distribute_contents(
+                    datasets, lambda x: x["organization"]["name"]
+                )
+            # a dataset is skipped if it moves back a page because one before it is
+            # deleted during paging
+            if len(dataset_ids) != count:
+                logger.warning(
+                    f"Retrieved {len(dataset_ids)} datasets from HDX but expected "
+                    f"{count} so datasets may have been skipped!"
+                )
+        finally:
+            configuration.set_read_only(False)
+
+    def prefetch(self, datasets: Optional[List[Dataset]] = None) -> None:
+        """Load the datasets and resources of the previous run into dictionaries
+        keyed by id using bulk queries rather than one query per dataset and resource.
+        They are read only so they are loaded as rows rather than database objects. If
+        datasets are given, only rows for those datasets and their resources are
+        loaded.
+
+        Args:
+            datasets (Optional[List[Dataset]]): Datasets to load. Defaults to all.
+
+        Returns:
+            None
+        """
+        self.previous_dbdatasets = {}
+        self.previous_dbresources = {}
+        if self.previous_run_number is None:
+            return
+        dataset_filters = [DBDataset.run_number == self.previous_run_number]
+        resource_filters = [DBResource.run_number == self.previous_run_number]
+        if datasets is None:
+            logger.info("Loading previous run")
+            dataset_chunks = [dataset_filters]
+            resource_chunks = [resource_filters]
+        else:
+            dataset_ids = [x["id"] for x in datasets]
+            resource_ids = [
+                x["id"] for dataset in datasets for x in dataset.get_resources()
+            ]
+            dataset_chunks = [
+                dataset_filters + [DBDataset.id.in_(ids)]
+                for ids in self.chunk(dataset_ids)
+            ]
+            resource_chunks = [
+                resource_filters + [DBResource.id.in_(ids)]
+                for ids in self.chunk(resource_ids)
+            ]
+        for filters in dataset_chunks:
+            for row in self.session.execute(
+                select(DBDataset.__table__).where(*filters)
+            ):
+                self.previous_dbdatasets[row.id] = row
+        for filters in resource_chunks:
+            for row in self.session.execute(
+                select(DBResource.__table__).where(*filters)
+            ):
+                self.previous_dbresources[row.id] = row
+
+    @staticmethod
+    def chunk(ids: List[str], size: int = 10000) -> Iterator[List[str]]:
+        """Split list of ids into chunks small enough for an IN clause
+
+        Args:
+            ids (List[str]): List of ids
+            size (int): Maximum size of chunk. Defaults to 10000.
+
+        Returns:
+            Iterator[List[str]]: Chunks of ids
+        """
+        for start in range(0, len(ids), size):
+            yield ids[start : start + size]
+
     def add_new_run(self) -> None:
-        """Add a new run number with corresponding date
+        """Add a new run number with corresponding date. If the dataset and resource
+        tables are partitioned, create the partitions for the run if needed.
 
         Returns:
             None
         """
         dbrun = DBRun(run_number=self.run_number, run_date=self.now)
         self.session.add(dbrun)
+        create_run_partitions(self.session, self.run_number, self.run_partition_size)
         self.session.commit()
 
     @staticmethod
-    def prefix_what_updated(dbresource: DBResource, prefix: str) -> None:
-        """Prefix the what_updated field of resource
+    def set_what_updated(
+        dbobject: Union[DBDataset, DBResource, Dict[str, Any]],
+        what_updated: WhatUpdated,
+    ) -> None:
+        """Set the what_updated flags of a database object or row along with the
+        equivalent text for display
 
         Args:
-            dbresource (DBResource): DBResource object to change
-            prefix (str): Prefix to prepend
+            dbobject (Union[DBDataset, DBResource, Dict[str, Any]]): Object or row
+            what_updated (WhatUpdated): What updated flags
 
         Returns:
             None
         """
-        what_updated = f"{prefix}-{dbresource.what_updated}"
-        dbresource.what_updated = what_updated
+        what_updated = WhatUpdated(what_updated)
+        if isinstance(dbobject, dict):
+            dbobject["what_updated_flags"] = int(what_updated)
+            dbobject["what_updated"] = what_updated.render()
+        else:
+            dbobject.what_updated_flags = int(what_updated)
+            dbobject.what_updated = what_updated.render()
 
     def process_resources(
         self,
         dataset_id: str,
-        previous_dbdataset: DBDataset,
+        previous_dbdataset: Optional[Row],
         resources: List[Resource],
         updated_by_script: Optional[datetime],
         hash_ids: List[str] = None,
@@ -207,7 +404,7 @@ class DataFreshness:
 
         Args:
             dataset_id (str): Dataset id
-            previous_dbdataset (DBDataset): DBDataset object from previous run
+            previous_dbdataset (Optional[Row]): Dataset row from previous run or None
             resources (List[Resource]): HDX resources to process
             updated_by_script (Optional[datetime]): Time script updated or None
             hash_ids (Optional[List[str]]): Resource ids to hash for testing purposes
@@ -221,7 +418,7 @@ class DataFreshness:
         dataset_resources = []
         for resource in resources:
             resource_id = resource["id"]
-            dict_of_lists_add(self.resource_what_updated, "total", resource_id)
+            self.resource_what_updated.add("total", resource_id)
             url = resource["url"]
             name = resource["name"]
             metadata_modified = parse_date(
@@ -237,82 +434,80 @@ class DataFreshness:
             else:
                 last_resource_updated = resource_id
                 last_resource_modified = last_modified
-            dbresource = DBResource(
-                run_number=self.run_number,
-                id=resource_id,
-                name=name,
-                dataset_id=dataset_id,
-                url=url,
-                last_modified=last_modified,
-                metadata_modified=metadata_modified,
-                latest_of_modifieds=last_modified,
-                what_updated="firstrun",
-            )
+            dbresource = {
+                "run_number": self.run_number,
+                "id": resource_id,
+                "name": name,
+                "dataset_id": dataset_id,
+                "url": url,
+                "last_modified": last_modified,
+                "metadata_modified": metadata_modified,
+                "latest_of_modifieds": last_modified,
+            }
+            self.set_what_updated(dbresource, WhatUpdated.FIRSTRUN)
             if previous_dbdataset is not None:
-                try:
-                    previous_dbresource = self.session.execute(
-                        select(DBResource).where(
-                            DBResource.run_number == previous_dbdataset.run_number,
-                            DBResource.id == resource_id,
-                        )
-                    ).scalar_one()
+                previous_dbresource = self.previous_dbresources.get(resource_id)
+                if previous_dbresource is not None:
                     if last_modified > previous_dbresource.last_modified:
-                        dbresource.what_updated = "filestore"
+                        self.set_what_updated(dbresource, WhatUpdated.FILESTORE)
                     else:
-                        dbresource.last_modified = previous_dbresource.last_modified
-                        dbresource.what_updated = "nothing"
+                        dbresource["last_modified"] = previous_dbresource.last_modified
+                        self.set_what_updated(dbresource, WhatUpdated.NOTHING)
                     if last_modified <= previous_dbresource.latest_of_modifieds:
-                        dbresource.latest_of_modifieds = (
+                        dbresource["latest_of_modifieds"] = (
                             previous_dbresource.latest_of_modifieds
                         )
-                    dbresource.http_last_modified = (
+                    dbresource["http_last_modified"] = (
                         previous_dbresource.http_last_modified
                     )
-                    dbresource.md5_hash = previous_dbresource.md5_hash
-                    dbresource.hash_last_modified = (
+                    dbresource["md5_hash"] = previous_dbresource.md5_hash
+                    dbresource["hash_last_modified"] = (
                         previous_dbresource.hash_last_modified
                     )
-                    dbresource.when_checked = previous_dbresource.when_checked
-
-                except NoResultFound:
-                    pass
-            self.session.add(dbresource)
+                    dbresource["when_checked"] = previous_dbresource.when_checked
+            self.bulkwriter.add(DBResource, dbresource)
 
             if self.dont_hash:
-                dict_of_lists_add(
-                    self.resource_what_updated,
-                    dbresource.what_updated,
-                    resource_id,
-                )
+                self.resource_what_updated.add(dbresource["what_updated"], resource_id)
                 continue
             else:
+                if (
+                    not hash_ids
+                    and self.hash_policy
+                    and self.hash_policy.skip_hash(
+                        resource_id, dbresource["when_checked"], self.now
+                    )
+                ):  # known API checked recently
+                    self.resource_what_updated.add(
+                        dbresource["what_updated"], resource_id
+                    )
+                    continue
                 should_hash = False
                 if updated_by_script:
                     netloc = urlparse(url).netloc
                     if netloc in self.updated_by_script_netlocs_checked:
-                        dict_of_lists_add(
-                            self.resource_what_updated,
-                            dbresource.what_updated,
-                            resource_id,
+                        self.resource_what_updated.add(
+                            dbresource["what_updated"], resource_id
                         )
                         continue
                     else:
                         should_hash = True
                         self.updated_by_script_netlocs_checked.add(netloc)
                 if self.url_internal in url:
-                    self.prefix_what_updated(dbresource, "internal")
-                    dict_of_lists_add(
-                        self.resource_what_updated,
-                        dbresource.what_updated,
-                        resource_id,
+                    what_updated = WhatUpdated(dbresource["what_updated_flags"])
+                    self.set_what_updated(
+                        dbresource, what_updated | WhatUpdated.INTERNAL
+                    )
+                    self.resource_what_updated.add(
+                        dbresource["what_updated"], resource_id
                     )
                     continue
                 if hash_ids:
                     should_hash = resource_id in hash_ids
                 elif not should_hash:
                     should_hash = self.urls_to_check_count < self.no_urls_to_check and (
-                        dbresource.when_checked is None
-                        or self.now - dbresource.when_checked > timedelta(days=30)
+                        dbresource["when_checked"] is None
+                        or self.now - dbresource["when_checked"] > timedelta(days=30)
                     )
             resource_format = resource["format"].lower()
             dataset_resources.append(
@@ -320,8 +515,9 @@ class DataFreshness:
                     url,
                     resource_id,
                     resource_format,
-                    dbresource.what_updated,
+                    dbresource["what_updated"],
                     should_hash,
+                    dbresource,
                 )
             )
         return dataset_resources, last_resource_updated, last_resource_modified
@@ -337,6 +533,7 @@ class DataFreshness:
         For datasets that are not initially fresh or which have resources that have not
         been checked in the last 30 days (up to the threshold for the number of
         resources to check), the resources are flagged to be downloaded and hashed.
+        Datasets are processed and written to the database a page at a time.
 
         Args:
             hash_ids (Optional[List[str]]): Resource ids to hash for testing purposes
@@ -346,246 +543,470 @@ class DataFreshness:
         """
         resources_to_check = []
         datasets_to_check = {}
+        if self.hash_policy:
+            self.hash_policy.load(self.previous_run_number)
         logger.info("Processing datasets")
-        for dataset in self.datasets:
-            resources = dataset.get_resources()
-            if dataset.is_requestable():  # ignore requestable
-                continue
-            dataset_id = dataset["id"]
-            dict_of_lists_add(self.dataset_what_updated, "total", dataset_id)
-            organization_id = dataset["organization"]["id"]
-            organization_name = dataset["organization"]["name"]
-            organization_title = dataset["organization"]["title"]
-            try:
-                dborganization = self.session.execute(
-                    select(DBOrganization).where(DBOrganization.id == organization_id)
-                ).scalar_one()
-                dborganization.name = organization_name
-                dborganization.title = organization_title
-            except NoResultFound:
-                dborganization = DBOrganization(
-                    name=organization_name,
-                    id=organization_id,
-                    title=organization_title,
-                )
-                self.session.add(dborganization)
-            dataset_name = dataset["name"]
-            dataset_title = dataset["title"]
-            dataset_private = dataset["private"]
-            dataset_maintainer = dataset["maintainer"]
-            dataset_location = ",".join([x["name"] for x in dataset["groups"]])
-            try:
-                dbinfodataset = self.session.execute(
-                    select(DBInfoDataset).where(DBInfoDataset.id == dataset_id)
-                ).scalar_one()
-                dbinfodataset.name = dataset_name
-                dbinfodataset.title = dataset_title
-                dbinfodataset.private = dataset_private
-                dbinfodataset.organization_id = organization_id
-                dbinfodataset.maintainer = dataset_maintainer
-                dbinfodataset.location = dataset_location
-            except NoResultFound:
-                dbinfodataset = DBInfoDataset(
-                    name=dataset_name,
-                    id=dataset_id,
-                    title=dataset_title,
-                    private=dataset_private,
-                    organization_id=organization_id,
-                    maintainer=dataset_maintainer,
-                    location=dataset_location,
+        for datasets in self.get_dataset_pages():
+            if self.datasets is None:
+                self.prefetch(datasets)
+            else:
+                self.prefetch()
+            for dataset in datasets:
+                self.process_dataset(
+                    dataset, datasets_to_check, resources_to_check, hash_ids
                 )
-                self.session.add(dbinfodataset)
-            try:
-                previous_dbdataset = self.session.execute(
-                    select(DBDataset).where(
-                        DBDataset.run_number == self.previous_run_number,
-                        DBDataset.id == dataset_id,
-                    )
-                ).scalar_one()
-            except NoResultFound:
-                previous_dbdataset = None
-
-            update_frequency = dataset.get("data_update_frequency")
-            updated_by_script = None
-            if update_frequency is not None:
-                update_frequency = int(update_frequency)
-                updated_by_script = dataset.get("updated_by_script")
-                if updated_by_script:
-                    if "freshness_ignore" in updated_by_script:
-                        updated_by_script = None
-                    else:
-                        match = self.bracketed_date.search(updated_by_script)
-                        if match is None:
-                            updated_by_script = None
-                        else:
-                            try:
-                                updated_by_script = parse_date(
-                                    match.group(1), include_microseconds=True
-                                )
-                            except ParserError:
-                                updated_by_script = None
-            (
-                dataset_resources,
-                last_resource_updated,
-                last_resource_modified,
-            ) = self.process_resources(
-                dataset_id,
-                previous_dbdataset,
-                resources,
-                updated_by_script,
-                hash_ids=hash_ids,
+            self.bulkwriter.write()
+            self.write_carried_forward()
+            self.session.commit()
+        return datasets_to_check, resources_to_check
+
+    def carry_forward(
+        self,
+        dataset: Dataset,
+        previous_dbdataset: Optional[Row],
+        resources: List[Resource],
+        hash_ids: Optional[List[str]] = None,
+    ) -> bool:
+        """In incremental mode, datasets whose metadata is unchanged since the
+        previous run and none of whose resources need hashing are not processed in
+        Python. Instead, their rows from the previous run are copied into the new run
+        in SQL by write_carried_forward. This is only done where the result is the
+        same as processing the dataset would give: its fields are those of the
+        previous run apart from what_updated, which becomes "nothing", and freshness,
+        which is recomputed for the new run date.
+
+        Args:
+            dataset (Dataset): HDX dataset
+            previous_dbdataset (Optional[Row]): Dataset row from previous run or None
+            resources (List[Resource]): HDX resources of dataset
+            hash_ids (Optional[List[str]]): Resource ids to hash for testing purposes
+
+        Returns:
+            bool: Whether dataset is carried forward
+        """
+        if previous_dbdataset is None or previous_dbdataset.error:
+            return False
+        if len(resources) == 0:
+            return False
+        update_frequency = dataset.get("data_update_frequency")
+        if update_frequency is not None:
+            update_frequency = int(update_frequency)
+            if dataset.get("updated_by_script"):
+                return False
+        if update_frequency != previous_dbdataset.update_frequency:
+            return False
+        if dataset.get("dataset_date") != previous_dbdataset.dataset_date:
+            return False
+        metadata_modified = parse_date(
+            dataset["metadata_modified"], include_microseconds=True
+        )
+        if metadata_modified != previous_dbdataset.metadata_modified:
+            return False
+        if "last_modified" in dataset:
+            last_modified = parse_date(
+                dataset["last_modified"], include_microseconds=True
             )
-            time_period = dataset.get("dataset_date")
-            metadata_modified = parse_date(
-                dataset["metadata_modified"], include_microseconds=True
+            if last_modified > previous_dbdataset.last_modified:
+                return False
+        review_date = dataset.get("review_date")
+        if review_date is not None:
+            review_date = parse_date(review_date, include_microseconds=True)
+            if (
+                previous_dbdataset.review_date is None
+                or review_date > previous_dbdataset.review_date
+            ):
+                return False
+        resource_ids = {x["id"] for x in resources}
+        if previous_dbdataset.last_resource_updated not in resource_ids:
+            return False
+        if update_frequency is None:
+            fresh = None
+        elif update_frequency in (0, -1, -2):
+            fresh = 0
+        elif update_frequency in self.freshness_by_frequency:
+            fresh = self.calculate_freshness(
+                previous_dbdataset.latest_of_modifieds, update_frequency
+            )
+        else:
+            return False
+        if not self.dont_hash and fresh != 0 and update_frequency is not None:
+            return False  # resources of datasets that are not fresh are hashed
+        if not self.dont_hash and update_frequency == 1:
+            return False
+        resources_what_updated = []
+        for resource in resources:
+            resource_id = resource["id"]
+            previous_dbresource = self.previous_dbresources.get(resource_id)
+            if previous_dbresource is None:
+                return False
+            last_modified = parse_date(
+                resource["last_modified"], include_microseconds=True
             )
-            if "last_modified" in dataset:
-                last_modified = parse_date(
-                    dataset["last_modified"], include_microseconds=True
+            if last_modified != previous_dbresource.last_modified:
+                return False
+            if (
+                resource["url"] != previous_dbresource.url
+                or resource["name"] != previous_dbresource.name
+            ):
+                return False
+            what_updated = "nothing"
+            if not self.dont_hash:
+                when_checked = previous_dbresource.when_checked
+                if (
+                    not hash_ids
+                    and self.hash_policy
+                    and self.hash_policy.skip_hash(resource_id, when_checked, self.now)
+                ):
+                    return False
+                if self.url_internal in previous_dbresource.url:
+                    what_updated = "internal-nothing"  # never hashed
+                elif hash_ids:
+                    if resource_id in hash_ids:
+                        return False
+                elif when_checked is None or self.now - when_checked > timedelta(
+                    days=30
+                ):
+                    return False
+            resources_what_updated.append((resource_id, what_updated))
+        if update_frequency == 0:
+            self.live_update += 1
+        elif update_frequency == -1:
+            self.never_update += 1
+        elif update_frequency == -2:
+            self.asneeded_update += 1
+        for resource_id, what_updated in resources_what_updated:
+            self.resource_what_updated.add("total", resource_id)
+            self.resource_what_updated.add(what_updated, resource_id)
+        dataset_id = dataset["id"]
+        update_string = f"{self.freshness_statuses[fresh]}, Updated nothing"
+        self.dataset_what_updated.add(update_string, dataset_id)
+        self.carried_dataset_ids.append(dataset_id)
+        self.carried_resource_ids.extend(x[0] for x in resources_what_updated)
+        return True
+
+    def get_freshness_case(self, latest_of_modifieds: Any, update_frequency: Any):
+        """Get SQL CASE expression that calculates freshness for the run date the
+        same way as calculate_freshness
+
+        Args:
+            latest_of_modifieds (Any): Latest of modifieds column or expression
+            update_frequency (Any): Update frequency column or expression
+
+        Returns:
+            sqlalchemy.sql.elements.Case: CASE expression giving freshness
+        """
+        return self.freshness_engine.get_case(
+            self.now, latest_of_modifieds, update_frequency
+        )
+
+    def write_carried_forward(self) -> None:
+        """Copy the previous run's rows of datasets and resources being carried
+        forward into the new run using INSERT ... SELECT
+
+        Returns:
+            None
+        """
+        if not self.carried_dataset_ids:
+            return
+        logger.info(
+            f"Carrying forward {len(self.carried_dataset_ids)} datasets and "
+            f"{len(self.carried_resource_ids)} resources"
+        )
+        table = DBDataset.__table__
+        columns = []
+        values = []
+        for column in table.columns:
+            columns.append(column.name)
+            if column.name == "run_number":
+                values.append(literal(self.run_number))
+            elif column.name == "what_updated":
+                values.append(literal("nothing"))
+            elif column.name == "what_updated_flags":
+                values.append(literal(int(WhatUpdated.NOTHING)))
+            elif column.name == "fresh":
+                values.append(
+                    self.get_freshness_case(
+                        table.c.latest_of_modifieds, table.c.update_frequency
+                    )
                 )
             else:
-                last_modified = datetime(1970, 1, 1, 0, 0, tzinfo=timezone.utc)
-            if len(resources) == 0 and last_resource_updated is None:
-                last_resource_updated = "NO RESOURCES"
-                last_resource_modified = datetime(1970, 1, 1, 0, 0, tzinfo=timezone.utc)
-                error = True
-                what_updated = "no resources"
-            else:
-                error = False
-                what_updated = "firstrun"
-            review_date = dataset.get("review_date")
-            if review_date is None:
-                latest_of_modifieds = last_modified
+                values.append(column)
+        for ids in self.chunk(self.carried_dataset_ids):
+            query = select(*values).where(
+                table.c.run_number == self.previous_run_number, table.c.id.in_(ids)
+            )
+            self.session.execute(insert(table).from_select(columns, query))
+        table = DBResource.__table__
+        nothing = WhatUpdated.NOTHING
+        if self.dont_hash:
+            what_updated = literal(nothing.render())
+            what_updated_flags = literal(int(nothing))
+        else:
+            internal = table.c.url.contains(self.url_internal)
+            what_updated = case(
+                (internal, WhatUpdated.INTERNAL.render()),
+                else_=nothing.render(),
+            )
+            what_updated_flags = case(
+                (internal, int(WhatUpdated.INTERNAL)),
+                else_=int(nothing),
+            )
+        columns = []
+        values = []
+        for column in table.columns:
+            columns.append(column.name)
+            if column.name == "run_number":
+                values.append(literal(self.run_number))
+            elif column.name == "what_updated":
+                values.append(what_updated)
+            elif column.name == "what_updated_flags":
+                values.append(what_updated_flags)
+            elif column.name in (
+                "api",
+                "error",
+                "error_category",
+                "error_status",
+                "error_raised",
+            ):  # set again if resource is checked
+                values.append(null())
             else:
-                review_date = parse_date(review_date, include_microseconds=True)
-                if review_date > last_modified:
-                    latest_of_modifieds = review_date
-                else:
-                    latest_of_modifieds = last_modified
-            if updated_by_script and updated_by_script > latest_of_modifieds:
-                latest_of_modifieds = updated_by_script
+                values.append(column)
+        for ids in self.chunk(self.carried_resource_ids):
+            query = select(*values).where(
+                table.c.run_number == self.previous_run_number, table.c.id.in_(ids)
+            )
+            self.session.execute(insert(table).from_select(columns, query))
+        self.carried_dataset_ids = []
+        self.carried_resource_ids = []
 
-            fresh = None
-            if update_frequency is not None and not error:
-                if update_frequency == 0:
-                    fresh = 0
-                    self.live_update += 1
-                elif update_frequency == -1:
-                    fresh = 0
-                    self.never_update += 1
-                elif update_frequency == -2:
-                    fresh = 0
-                    self.asneeded_update += 1
-                else:
-                    fresh = self.calculate_freshness(
-                        latest_of_modifieds, update_frequency
-                    )
+    def process_dataset(
+        self,
+        dataset: Dataset,
+        datasets_to_check: Dict[str, str],
+        resources_to_check: List[Tuple],
+        hash_ids: Optional[List[str]] = None,
+    ) -> None:
+        """Process an HDX dataset, staging its metadata to be written to the freshness
+        database and adding it and its resources to those to be checked if needed.
 
-            dbdataset = DBDataset(
-                run_number=self.run_number,
-                id=dataset_id,
-                dataset_date=time_period,
-                update_frequency=update_frequency,
-                review_date=review_date,
-                last_modified=last_modified,
-                metadata_modified=metadata_modified,
-                updated_by_script=updated_by_script,
-                latest_of_modifieds=latest_of_modifieds,
-                what_updated=what_updated,
-                last_resource_updated=last_resource_updated,
-                last_resource_modified=last_resource_modified,
-                fresh=fresh,
-                error=error,
+        Args:
+            dataset (Dataset): HDX dataset to process
+            datasets_to_check (Dict[str, str]): Datasets to check to add to
+            resources_to_check (List[Tuple]): Resources to check to add to
+            hash_ids (Optional[List[str]]): Resource ids to hash for testing purposes
+
+        Returns:
+            None
+        """
+        resources = dataset.get_resources()
+        if dataset.is_requestable():  # ignore requestable
+            return
+        dataset_id = dataset["id"]
+        self.dataset_what_updated.add("total", dataset_id)
+        organization_id = dataset["organization"]["id"]
+        organization_name = dataset["organization"]["name"]
+        organization_title = dataset["organization"]["title"]
+        self.bulkwriter.add_upsert(
+            DBOrganization,
+            {
+                "id": organization_id,
+                "name": organization_name,
+                "title": organization_title,
+            },
+        )
+        dataset_name = dataset["name"]
+        dataset_title = dataset["title"]
+        dataset_private = dataset["private"]
+        dataset_maintainer = dataset["maintainer"]
+        dataset_location = ",".join([x["name"] for x in dataset["groups"]])
+        self.bulkwriter.add_upsert(
+            DBInfoDataset,
+            {
+                "id": dataset_id,
+                "name": dataset_name,
+                "title": dataset_title,
+                "private": dataset_private,
+                "organization_id": organization_id,
+                "maintainer": dataset_maintainer,
+                "location": dataset_location,
+            },
+        )
+        previous_dbdataset = self.previous_dbdatasets.get(dataset_id)
+        if self.incremental and self.carry_forward(
+            dataset, previous_dbdataset, resources, hash_ids
+        ):
+            return
+
+        update_frequency = dataset.get("data_update_frequency")
+        updated_by_script = None
+        if update_frequency is not None:
+            update_frequency = int(update_frequency)
+            updated_by_script = dataset.get("updated_by_script")
+            if updated_by_script:
+                if "freshness_ignore" in updated_by_script:
+                    updated_by_script = None
+                else:
+                    match = self.bracketed_date.search(updated_by_script)
+                    if match is None:
+                        updated_by_script = None
+                    else:
+                        try:
+                            updated_by_script = parse_date(
+                                match.group(1), include_microseconds=True
+                            )
+                        except ParserError:
+                            updated_by_script = None
+        (
+            dataset_resources,
+            last_resource_updated,
+            last_resource_modified,
+        ) = self.process_resources(
+            dataset_id,
+            previous_dbdataset,
+            resources,
+            updated_by_script,
+            hash_ids=hash_ids,
+        )
+        time_period = dataset.get("dataset_date")
+        metadata_modified = parse_date(
+            dataset["metadata_modified"], include_microseconds=True
+        )
+        if "last_modified" in dataset:
+            last_modified = parse_date(
+                dataset["last_modified"], include_microseconds=True
             )
-            if previous_dbdataset is not None and not error:
-                dbdataset.what_updated = self.add_what_updated(
-                    dbdataset.what_updated, "nothing"
+        else:
+            last_modified = datetime(1970, 1, 1, 0, 0, tzinfo=timezone.utc)
+        if len(resources) == 0 and last_resource_updated is None:
+            last_resource_updated = "NO RESOURCES"
+            last_resource_modified = datetime(1970, 1, 1, 0, 0, tzinfo=timezone.utc)
+            error = True
+            what_updated = WhatUpdated.NO_RESOURCES
+        else:
+            error = False
+            what_updated = WhatUpdated.FIRSTRUN
+        review_date = dataset.get("review_date")
+        if review_date is None:
+            latest_of_modifieds = last_modified
+        else:
+            review_date = parse_date(review_date, include_microseconds=True)
+            if review_date > last_modified:
+                latest_of_modifieds = review_date
+            else:
+                latest_of_modifieds = last_modified
+        if updated_by_script and updated_by_script > latest_of_modifieds:
+            latest_of_modifieds = updated_by_script
+
+        fresh = None
+        if update_frequency is not None and not error:
+            if update_frequency == 0:
+                fresh = 0
+                self.live_update += 1
+            elif update_frequency == -1:
+                fresh = 0
+                self.never_update += 1
+            elif update_frequency == -2:
+                fresh = 0
+                self.asneeded_update += 1
+            else:
+                fresh = self.calculate_freshness(latest_of_modifieds, update_frequency)
+
+        dbdataset = {
+            "run_number": self.run_number,
+            "id": dataset_id,
+            "dataset_date": time_period,
+            "update_frequency": update_frequency,
+            "review_date": review_date,
+            "last_modified": last_modified,
+            "metadata_modified": metadata_modified,
+            "updated_by_script": updated_by_script,
+            "latest_of_modifieds": latest_of_modifieds,
+            "last_resource_updated": last_resource_updated,
+            "last_resource_modified": last_resource_modified,
+            "fresh": fresh,
+            "error": error,
+        }
+        if previous_dbdataset is not None and not error:
+            what_updated = self.add_what_updated(what_updated, WhatUpdated.NOTHING)
+            if (
+                last_modified > previous_dbdataset.last_modified
+            ):  # filestore update would cause this
+                what_updated = self.add_what_updated(
+                    what_updated, WhatUpdated.FILESTORE
                 )
-                if (
-                    last_modified > previous_dbdataset.last_modified
-                ):  # filestore update would cause this
-                    dbdataset.what_updated = self.add_what_updated(
-                        dbdataset.what_updated, "filestore"
+            else:
+                dbdataset["last_modified"] = previous_dbdataset.last_modified
+            if previous_dbdataset.review_date is None:
+                if review_date is not None:
+                    what_updated = self.add_what_updated(
+                        what_updated, WhatUpdated.REVIEW_DATE
                     )
-                else:
-                    dbdataset.last_modified = previous_dbdataset.last_modified
-                if previous_dbdataset.review_date is None:
-                    if review_date is not None:
-                        dbdataset.what_updated = self.add_what_updated(
-                            dbdataset.what_updated, "review date"
-                        )
-                else:
-                    if (
-                        review_date is not None
-                        and review_date > previous_dbdataset.review_date
-                    ):  # someone clicked the review button
-                        dbdataset.what_updated = self.add_what_updated(
-                            dbdataset.what_updated, "review date"
-                        )
-                    else:
-                        dbdataset.review_date = previous_dbdataset.review_date
-                if updated_by_script and (
-                    previous_dbdataset.updated_by_script is None
-                    or updated_by_script > previous_dbdataset.updated_by_script
-                ):  # new script update of datasets
-                    dbdataset.what_updated = self.add_what_updated(
-                        dbdataset.what_updated, "script update"
+            else:
+                if (
+                    review_date is not None
+                    and review_date > previous_dbdataset.review_date
+                ):  # someone clicked the review button
+                    what_updated = self.add_what_updated(
+                        what_updated, WhatUpdated.REVIEW_DATE
                     )
                 else:
-                    dbdataset.updated_by_script = previous_dbdataset.updated_by_script
-                if last_resource_modified <= previous_dbdataset.last_resource_modified:
-                    # we keep this so that although we don't normally use it,
-                    # we retain the ability to run without touching CKAN
-                    dbdataset.last_resource_updated = (
-                        previous_dbdataset.last_resource_updated
-                    )
-                    dbdataset.last_resource_modified = (
-                        previous_dbdataset.last_resource_modified
-                    )
-                if latest_of_modifieds < previous_dbdataset.latest_of_modifieds:
-                    dbdataset.latest_of_modifieds = (
-                        previous_dbdataset.latest_of_modifieds
-                    )
-                    if update_frequency is not None and update_frequency > 0:
-                        fresh = self.calculate_freshness(
-                            previous_dbdataset.latest_of_modifieds,
-                            update_frequency,
-                        )
-                        dbdataset.fresh = fresh
-            self.session.add(dbdataset)
-
-            update_string = (
-                f"{self.freshness_statuses[fresh]}, Updated {dbdataset.what_updated}"
-            )
-            anyresourcestohash = False
-            for (
-                url,
-                resource_id,
-                resource_format,
-                what_updated,
-                should_hash,
-            ) in dataset_resources:
-                if not should_hash:
-                    if (
-                        fresh == 0 and update_frequency != 1
-                    ) or update_frequency is None:
-                        dict_of_lists_add(
-                            self.resource_what_updated,
-                            what_updated,
-                            resource_id,
-                        )
-                        continue
-                resources_to_check.append(
-                    (url, resource_id, resource_format, what_updated)
+                    dbdataset["review_date"] = previous_dbdataset.review_date
+            if updated_by_script and (
+                previous_dbdataset.updated_by_script is None
+                or updated_by_script > previous_dbdataset.updated_by_script
+            ):  # new script update of datasets
+                what_updated = self.add_what_updated(
+                    what_updated, WhatUpdated.SCRIPT_UPDATE
                 )
-                self.urls_to_check_count += 1
-                anyresourcestohash = True
-            if anyresourcestohash:
-                datasets_to_check[dataset_id] = update_string
             else:
-                dict_of_lists_add(self.dataset_what_updated, update_string, dataset_id)
-        self.session.commit()
-        return datasets_to_check, resources_to_check
+                dbdataset["updated_by_script"] = previous_dbdataset.updated_by_script
+            if last_resource_modified <= previous_dbdataset.last_resource_modified:
+                # we keep this so that although we don't normally use it,
+                # we retain the ability to run without touching CKAN
+                dbdataset["last_resource_updated"] = (
+                    previous_dbdataset.last_resource_updated
+                )
+                dbdataset["last_resource_modified"] = (
+                    previous_dbdataset.last_resource_modified
+                )
+            if latest_of_modifieds < previous_dbdataset.latest_of_modifieds:
+                dbdataset["latest_of_modifieds"] = (
+                    previous_dbdataset.latest_of_modifieds
+                )
+                if update_frequency is not None and update_frequency > 0:
+                    fresh = self.calculate_freshness(
+                        previous_dbdataset.latest_of_modifieds,
+                        update_frequency,
+                    )
+                    dbdataset["fresh"] = fresh
+        self.set_what_updated(dbdataset, what_updated)
+        self.bulkwriter.add(DBDataset, dbdataset)
+
+        update_string = (
+            f"{self.freshness_statuses[fresh]}, Updated {dbdataset['what_updated']}"
+        )
+        anyresourcestohash = False
+        for (
+            url,
+            resource_id,
+            resource_format,
+            what_updated,
+            should_hash,
+            dbresource,
+        ) in dataset_resources:
+            if not should_hash:
+                if (fresh == 0 and update_frequency != 1) or update_frequency is None:
+                    self.resource_what_updated.add(what_updated, resource_id)
+                    continue
+            resources_to_check.append((url, resource_id, resource_format, what_updated))
+            self.registry.add(DBResource, dbresource)
+            self.urls_to_check_count += 1
+            anyresourcestohash = True
+        if anyresourcestohash:
+            datasets_to_check[dataset_id] = update_string
+            self.registry.add(DBDataset, dbdataset)
+        else:
+            self.dataset_what_updated.add(update_string, dataset_id)
 
     def check_urls(
         self,
@@ -595,9 +1016,10 @@ class DataFreshness:
         hash_results: Optional[Dict] = None,
     ) -> Tuple[Dict[str, Tuple], Dict[str, Tuple]]:
         """Download resources and hash them. If the hash has changed compared to the
-        previous run, download and hash again. Return two dictionaries, the first
-        with the hashes from the first downloads and the second with the hashes from
-        the second downloads.
+        previous run, download and hash again unless the hash policy says that the
+        history of the resource makes this unnecessary. Return two dictionaries, the
+        first with the hashes from the first downloads and the second with the hashes
+        from the second downloads.
 
         Args:
             resources_to_check (List[Tuple]): List of resources to be checked
@@ -613,7 +1035,9 @@ class DataFreshness:
         def get_netloc(x):
             return urlparse(x[0]).netloc
 
-        retrieval = Retrieval(user_agent, self.url_internal)
+        retrieval = Retrieval(
+            user_agent, self.url_internal, self.max_sizes, self.hashing_threads
+        )
         if results is None:  # pragma: no cover
             resources_to_check = list_distribute_contents(
                 resources_to_check, get_netloc
@@ -623,6 +1047,7 @@ class DataFreshness:
                 serialize_results(self.testsession, results)
 
         hash_check = []
+        unconfirmed = []
         for resource_id in results:
             (
                 url,
@@ -633,18 +1058,22 @@ class DataFreshness:
                 xlsx_hash,
             ) = results[resource_id]
             if hash:
-                dbresource = self.session.execute(
-                    select(DBResource).where(
-                        DBResource.run_number == self.run_number,
-                        DBResource.id == resource_id,
-                    )
-                ).scalar_one()
+                dbresource = self.registry.get(DBResource, resource_id)
                 if dbresource.md5_hash == hash:  # File unchanged
                     continue
                 if xlsx_hash and dbresource.md5_hash == xlsx_hash:  # File unchanged
                     continue
+                if self.hash_policy and not self.hash_policy.needs_confirmation(
+                    resource_id
+                ):
+                    unconfirmed.append(resource_id)
+                    continue
                 hash_check.append((url, resource_id, resource_format))
 
+        if unconfirmed:
+            logger.info(
+                f"Skipping confirmation download of {len(unconfirmed)} resources"
+            )
         if hash_results is None:  # pragma: no cover
             hash_check = list_distribute_contents(hash_check, get_netloc)
             hash_results = retrieval.retrieve(hash_check)
@@ -658,12 +1087,20 @@ class DataFreshness:
         results: Dict[str, Tuple],
         hash_results: Dict[str, Tuple],
         resourcecls: Union[Resource, Any] = Resource,
+        datasetcls: Union[Dataset, Any] = Dataset,
     ) -> Dict[str, Dict[str, Tuple]]:
         """Process the downloaded and hashed resources. If the two hashes are the same
         but different to the previous run's, the file has been changed. If the two
         hashes are different, it is an API (eg. editable Google sheet) where the hash
-        constantly changes. If the file is determined to have been changed, then the
-        resource on HDX is touched to update its last_modified field. Return a
+        constantly changes. A resource the hash policy did not download again is
+        treated as a changed file if it is a stable file and otherwise as an API, but
+        whether it is an API is not recorded. If the file is determined to have been
+        changed, then the resource on HDX is touched to update its last_modified field. Touches and
+        markings of broken resources are queued to run concurrently with processing
+        and are waited for before returning. If writeback_batch is set, the
+        resource last_modified values loaded when processing datasets are used to
+        decide whether to touch rather than reading each resource from HDX, and all
+        touches and markings for a dataset are made in one package_revise call. Return a
         dictionary of dictionaries from dataset id to resource ids to update information
         about resources including their latest_of_modifieds.
 
@@ -671,33 +1108,30 @@ class DataFreshness:
             results (Dict[str, Tuple]): Test results to use in place of first downloads
             hash_results (Dict[str, Tuple]): Test results replacing second downloads
             resourcecls (Union[Resource, Any]): Class to use. Defaults to Resource.
+            datasetcls (Union[Dataset, Any]): Class to use. Defaults to Dataset.
 
         Returns:
             Dict[str, Dict[str, Tuple]]: Dataset id to resource id to resource info
         """
 
-        def check_broken(error):
-            if error == Retrieval.toolargeerror:
-                return False
-            if Retrieval.notmatcherror in error:
-                return True
-            match_error = re.search(Retrieval.clienterror_regex, error)
-            if match_error:
-                return True
-            return False
-
+        if self.do_touch:
+            writeback = WriteBackQueue(
+                self.writeback_threads,
+                self.writeback_rate,
+                self.writeback_retries,
+                exceptions=(HDXError,),
+            )
+        dataset_revisions: Dict[str, Dict[str, Dict[str, Any]]] = {}
         datasets_resourcesinfo = {}
-        for resource_id in sorted(results):
+        resource_ids = sorted(results)
+        self.hash_history.load(resource_ids)
+        self.registry.attach(DBResource)
+        for resource_id in resource_ids:
             url, _, err, http_last_modified, hash, xlsx_hash = results[resource_id]
-            dbresource = self.session.execute(
-                select(DBResource).where(
-                    DBResource.run_number == self.run_number,
-                    DBResource.id == resource_id,
-                )
-            ).scalar_one()
+            dbresource = self.registry.get(DBResource, resource_id)
             dataset_id = dbresource.dataset_id
             resourcesinfo = datasets_resourcesinfo.get(dataset_id, dict())
-            what_updated = dbresource.what_updated
+            what_updated = WhatUpdated(dbresource.what_updated_flags or 0)
             update_last_modified = False
             is_broken = False
             if http_last_modified:
@@ -709,11 +1143,30 @@ class DataFreshness:
             if hash:
                 dbresource.when_checked = self.now
                 if dbresource.md5_hash == hash:  # File unchanged
-                    what_updated = self.add_what_updated(what_updated, "same hash")
+                    what_updated = self.add_what_updated(
+                        what_updated, WhatUpdated.SAME_HASH
+                    )
+                    self.hash_history.add(resource_id, hash, self.run_number)
                 elif xlsx_hash and dbresource.md5_hash == xlsx_hash:  # File unchanged
-                    what_updated = self.add_what_updated(what_updated, "same hash")
+                    what_updated = self.add_what_updated(
+                        what_updated, WhatUpdated.SAME_HASH
+                    )
+                    self.hash_history.add(resource_id, xlsx_hash, self.run_number)
                 else:  # File updated
                     hash_to_set = hash
+                    hash_result = hash_results.get(resource_id)
+                    # Whether resource is an API is unknown if not downloaded again
+                    confirmed = hash_result is not None
+                    if not confirmed:
+                        if self.hash_policy and self.hash_policy.is_stable_file(
+                            resource_id
+                        ):  # First download is trusted for stable files
+                            hash_result = (url, None, None, None, hash, xlsx_hash)
+                        else:  # Known API
+                            what_updated = self.add_what_updated(
+                                what_updated, WhatUpdated.API
+                            )
+                            hash_result = (url, None, None, None, None, None)
                     (
                         hash_url,
                         _,
@@ -721,7 +1174,7 @@ class DataFreshness:
                         hash_http_last_modified,
                         hash_hash,
                         hash_xlsx_hash,
-                    ) = hash_results[resource_id]
+                    ) = hash_result
                     if hash_http_last_modified:
                         if (
                             dbresource.http_last_modified is None
@@ -741,132 +1194,229 @@ class DataFreshness:
                                 dbresource.md5_hash is None
                             ):  # First occurrence of resource eg. first run - don't use hash
                                 # for last modified field (and hence freshness calculation)
-                                dbresource.what_updated = self.add_what_updated(
-                                    what_updated, "first hash"
+                                what_updated = self.add_what_updated(
+                                    what_updated, WhatUpdated.FIRST_HASH
                                 )
-                                what_updated = dbresource.what_updated
+                                self.set_what_updated(dbresource, what_updated)
                             else:
                                 # Check if hash has occurred before
-                                # select distinct md5_hash from dbresources where id = '714ef7b5-a303-4e4f-be2f-03b2ce2933c7' and md5_hash='2f3cd6a6fce5ad4d7001780846ad87a7';
-                                if self.session.scalar(
-                                    select(
-                                        exists().where(
-                                            DBResource.id == resource_id,
-                                            DBResource.md5_hash == hash,
-                                        )
-                                    )
-                                ):
-                                    dbresource.what_updated = self.add_what_updated(
-                                        what_updated, "repeat hash"
+                                if self.hash_history.is_repeat(resource_id, hash):
+                                    what_updated = self.add_what_updated(
+                                        what_updated, WhatUpdated.REPEAT_HASH
                                     )
-                                    what_updated = dbresource.what_updated
+                                    self.set_what_updated(dbresource, what_updated)
                                 else:
                                     (
                                         what_updated,
                                         _,
                                     ) = self.set_latest_of_modifieds(
-                                        dbresource, self.now, "hash"
+                                        dbresource, self.now, WhatUpdated.HASH
                                     )
                                     dbresource.hash_last_modified = self.now
                                     update_last_modified = True
-                            dbresource.api = False
+                            if confirmed:
+                                dbresource.api = False
                         else:
                             hash_to_set = hash_hash
-                            what_updated = self.add_what_updated(what_updated, "api")
+                            what_updated = self.add_what_updated(
+                                what_updated, WhatUpdated.API
+                            )
                             dbresource.api = True
                     if hash_err:
-                        what_updated = self.add_what_updated(what_updated, "error")
-                        dbresource.error = hash_err
-                        if check_broken(hash_err):
+                        what_updated = self.add_what_updated(
+                            what_updated, WhatUpdated.ERROR
+                        )
+                        if self.set_error(dbresource, hash_err):
                             is_broken = True
                     dbresource.md5_hash = hash_to_set
+                    self.hash_history.add(resource_id, hash_to_set, self.run_number)
             if err:
                 dbresource.when_checked = self.now
-                what_updated = self.add_what_updated(what_updated, "error")
-                dbresource.error = err
-                if check_broken(err):
+                what_updated = self.add_what_updated(what_updated, WhatUpdated.ERROR)
+                if self.set_error(dbresource, err):
                     is_broken = True
             resourcesinfo[resource_id] = (
                 dbresource.error,
                 dbresource.latest_of_modifieds,
-                dbresource.what_updated,
+                WhatUpdated(dbresource.what_updated_flags or 0),
             )
             datasets_resourcesinfo[dataset_id] = resourcesinfo
-            dict_of_lists_add(self.resource_what_updated, what_updated, resource_id)
+            self.resource_what_updated.add(what_updated.render(), resource_id)
             if update_last_modified and self.do_touch:  # Touch resource if needed
-                try:
-                    logger.info(f"Updating last modified for resource {resource_id}")
-                    resource = resourcecls.read_from_hdx(resource_id)
-                    if resource:
-                        last_modified = parse_date(
-                            resource["last_modified"],
-                            include_microseconds=True,
+                dbdataset = self.registry.get(DBDataset, dataset_id)
+                if self.writeback_batch:
+                    if self.is_resource_fresh(
+                        dbresource.last_modified, dbdataset.update_frequency
+                    ):
+                        logger.info(
+                            f"Didn't update last modified for resource {resource_id} as it is fresh!"
                         )
-                        dbdataset = self.session.execute(
-                            select(DBDataset).where(
-                                DBDataset.run_number == self.run_number,
-                                DBDataset.id == dataset_id,
-                            )
-                        ).scalar_one()
-                        update_frequency = dbdataset.update_frequency
-                        if update_frequency > 0:
-                            if (
-                                self.calculate_freshness(
-                                    last_modified, update_frequency
-                                )
-                                == 0
-                            ):
-                                dotouch = False
-                            else:
-                                dotouch = True
-                        else:
-                            dotouch = True
-                        if dotouch:
-                            dt_notz = dbresource.latest_of_modifieds.replace(
-                                tzinfo=None
-                            )
-                            resource["last_modified"] = dt_notz.isoformat()
-                            resource.update_in_hdx(
-                                operation="patch",
-                                batch_mode="KEEP_OLD",
-                                skip_validation=True,
-                                ignore_check=True,
-                            )
-                            self.resource_last_modified_count += 1
-                            logger.info(
-                                f"Resource last modified count: {self.resource_last_modified_count}"
-                            )
-                        else:
-                            logger.info(
-                                f"Didn't update last modified for resource {resource_id} as it is fresh!"
-                            )
                     else:
-                        logger.error(
-                            f"Last modified update failed for id {resource_id}! Resource does not exist."
-                        )
-                except HDXError:
-                    logger.exception(
-                        f"Last modified update failed for id {resource_id}!"
+                        dt_notz = dbresource.latest_of_modifieds.replace(tzinfo=None)
+                        revisions = dataset_revisions.setdefault(dataset_id, {})
+                        revision = revisions.setdefault(resource_id, {})
+                        revision["last_modified"] = dt_notz.isoformat()
+                else:
+                    writeback.submit(
+                        "touch",
+                        resource_id,
+                        partial(
+                            self.touch_resource,
+                            resourcecls,
+                            resource_id,
+                            dbresource.latest_of_modifieds,
+                            dbdataset.update_frequency,
+                        ),
                     )
             if is_broken and self.do_touch:
-                try:
-                    logger.info(f"Marking resource {resource_id} as broken")
-                    resource = resourcecls.read_from_hdx(resource_id)
-                    if resource:
-                        resource.mark_broken()
-                        self.resource_broken_count += 1
-                        logger.info(
-                            f"Resource broken count: {self.resource_broken_count}"
-                        )
-                    else:
-                        logger.error(
-                            f"Mark broken failed for id {resource_id}! Resource does not exist."
-                        )
-                except HDXError:
-                    logger.exception(f"Mark broken failed for id {resource_id}!")
+                if self.writeback_batch:
+                    revisions = dataset_revisions.setdefault(dataset_id, {})
+                    revision = revisions.setdefault(resource_id, {})
+                    revision["broken_link"] = True
+                else:
+                    writeback.submit(
+                        "mark broken",
+                        resource_id,
+                        partial(self.mark_resource_broken, resourcecls, resource_id),
+                    )
+        for dataset_id, revisions in dataset_revisions.items():
+            writeback.submit(
+                "revise",
+                dataset_id,
+                partial(self.revise_resources, datasetcls, dataset_id, revisions),
+            )
+        self.hash_history.write()
+        self.registry.detach()
         self.session.commit()
+        if self.do_touch:
+            report = writeback.wait()
+            self.resource_last_modified_count += len(
+                report.get("touch", {}).get("done", [])
+            )
+            self.resource_broken_count += len(
+                report.get("mark broken", {}).get("done", [])
+            )
+            for dataset_id in report.get("revise", {}).get("done", []):
+                for revision in dataset_revisions[dataset_id].values():
+                    if "last_modified" in revision:
+                        self.resource_last_modified_count += 1
+                    if "broken_link" in revision:
+                        self.resource_broken_count += 1
+            logger.info(
+                f"Resource last modified count: {self.resource_last_modified_count}"
+            )
+            logger.info(f"Resource broken count: {self.resource_broken_count}")
         return datasets_resourcesinfo
 
+    def is_resource_fresh(self, last_modified: datetime, update_frequency: int) -> bool:
+        """Whether a resource's last_modified on HDX makes it fresh so that it does
+        not need to be touched. Resources of datasets without a regular update
+        frequency are never considered fresh.
+
+        Args:
+            last_modified (datetime): Last modified date of resource on HDX
+            update_frequency (int): Update frequency of resource's dataset
+
+        Returns:
+            bool: Whether resource is fresh
+        """
+        if update_frequency > 0:
+            return self.calculate_freshness(last_modified, update_frequency) == 0
+        return False
+
+    def touch_resource(
+        self,
+        resourcecls: Union[Resource, Any],
+        resource_id: str,
+        latest_of_modifieds: datetime,
+        update_frequency: int,
+    ) -> bool:
+        """Update the last_modified field of a resource on HDX to its latest of
+        modifieds unless the resource's current last_modified makes it fresh
+
+        Args:
+            resourcecls (Union[Resource, Any]): Class to use
+            resource_id (str): Resource id
+            latest_of_modifieds (datetime): Latest of modifieds of resource
+            update_frequency (int): Update frequency of resource's dataset
+
+        Returns:
+            bool: Whether the resource was touched
+        """
+        logger.info(f"Updating last modified for resource {resource_id}")
+        resource = resourcecls.read_from_hdx(resource_id)
+        if not resource:
+            logger.error(
+                f"Last modified update failed for id {resource_id}! Resource does not exist."
+            )
+            return False
+        last_modified = parse_date(
+            resource["last_modified"],
+            include_microseconds=True,
+        )
+        if self.is_resource_fresh(last_modified, update_frequency):
+            logger.info(
+                f"Didn't update last modified for resource {resource_id} as it is fresh!"
+            )
+            return False
+        dt_notz = latest_of_modifieds.replace(tzinfo=None)
+        resource["last_modified"] = dt_notz.isoformat()
+        resource.update_in_hdx(
+            operation="patch",
+            batch_mode="KEEP_OLD",
+            skip_validation=True,
+            ignore_check=True,
+        )
+        return True
+
+    @staticmethod
+    def mark_resource_broken(
+        resourcecls: Union[Resource, Any], resource_id: str
+    ) -> bool:
+        """Mark a resource on HDX as broken
+
+        Args:
+            resourcecls (Union[Resource, Any]): Class to use
+            resource_id (str): Resource id
+
+        Returns:
+            bool: Whether the resource was marked as broken
+        """
+        logger.info(f"Marking resource {resource_id} as broken")
+        resource = resourcecls.read_from_hdx(resource_id)
+        if not resource:
+            logger.error(
+                f"Mark broken failed for id {resource_id}! Resource does not exist."
+            )
+            return False
+        resource.mark_broken()
+        return True
+
+    @staticmethod
+    def revise_resources(
+        datasetcls: Union[Dataset, Any],
+        dataset_id: str,
+        revisions: Dict[str, Dict[str, Any]],
+    ) -> bool:
+        """Update the last_modified and broken_link fields of resources of a dataset
+        on HDX in one package_revise call
+
+        Args:
+            datasetcls (Union[Dataset, Any]): Class to use
+            dataset_id (str): Dataset id
+            revisions (Dict[str, Dict[str, Any]]): Resource id to fields to update
+
+        Returns:
+            bool: Whether the resources were revised
+        """
+        logger.info(f"Revising {len(revisions)} resources of dataset {dataset_id}")
+        updates = {
+            f"update__resources__{resource_id}": revision
+            for resource_id, revision in revisions.items()
+        }
+        datasetcls.revise({"id": dataset_id}, **updates)
+        return True
+
     def update_dataset_latest_of_modifieds(
         self,
         datasets_to_check: Dict[str, str],
@@ -874,7 +1424,8 @@ class DataFreshness:
     ) -> None:
         """Given the dictionary of dictionaries from dataset id to resource ids to
         update information about resources including their latest_of_modifieds, work
-        out latest_of_modifieds for datasets and calculate freshness.
+        out latest_of_modifieds for datasets and recalculate the freshness of those
+        datasets in the database in one update.
 
         Args:
             datasets_to_check (Dict[str, str]): Datasets with resources that were hashed
@@ -885,16 +1436,12 @@ class DataFreshness:
             None
         """
 
+        self.registry.attach(DBDataset)
         for dataset_id in datasets_resourcesinfo:
-            dbdataset = self.session.execute(
-                select(DBDataset).where(
-                    DBDataset.run_number == self.run_number,
-                    DBDataset.id == dataset_id,
-                )
-            ).scalar_one()
+            dbdataset = self.registry.get(DBDataset, dataset_id)
             dataset = datasets_resourcesinfo[dataset_id]
             dataset_latest_of_modifieds = dbdataset.latest_of_modifieds
-            dataset_what_updated = dbdataset.what_updated
+            dataset_what_updated = WhatUpdated(dbdataset.what_updated_flags or 0)
             last_resource_modified = dbdataset.last_resource_modified
             last_resource_updated = dbdataset.last_resource_updated
             all_errors = True
@@ -918,25 +1465,24 @@ class DataFreshness:
             self.set_latest_of_modifieds(
                 dbdataset, dataset_latest_of_modifieds, dataset_what_updated
             )
-            update_frequency = dbdataset.update_frequency
-            if update_frequency is not None and update_frequency > 0:
-                dbdataset.fresh = self.calculate_freshness(
-                    dbdataset.latest_of_modifieds, update_frequency
-                )
             dbdataset.error = all_errors
+        self.registry.detach()
+        freshness = self.freshness_engine.update_run(
+            self.session, self.run_number, self.now, list(datasets_resourcesinfo)
+        )
+        for dataset_id in datasets_resourcesinfo:
+            dbdataset = self.registry.get(DBDataset, dataset_id)
+            if dataset_id in freshness:
+                set_committed_value(dbdataset, "fresh", freshness[dataset_id])
             status = f"{self.freshness_statuses[dbdataset.fresh]}, Updated {dbdataset.what_updated}"
-            if all_errors:
+            if dbdataset.error:
                 status = f"{status},error"
-            dict_of_lists_add(self.dataset_what_updated, status, dataset_id)
+            self.dataset_what_updated.add(status, dataset_id)
         self.session.commit()
         for dataset_id in datasets_to_check:
             if dataset_id in datasets_resourcesinfo:
                 continue
-            dict_of_lists_add(
-                self.dataset_what_updated,
-                datasets_to_check[dataset_id],
-                dataset_id,
-            )
+            self.dataset_what_updated.add(datasets_to_check[dataset_id], dataset_id)
 
     def output_counts(self) -> str:
         """Create and display output string
@@ -947,12 +1493,11 @@ class DataFreshness:
 
         def add_what_updated_str(hdxobject_what_updated):
             nonlocal output_str
-            output_str += f"\n* total: {len(hdxobject_what_updated['total'])} *"
-            for countstr in sorted(hdxobject_what_updated):
+            counts = hdxobject_what_updated.counts
+            output_str += f"\n* total: {counts['total']} *"
+            for countstr in sorted(counts):
                 if countstr != "total":
-                    output_str += (
-                        f",\n{countstr}: {len(hdxobject_what_updated[countstr])}"
-                    )
+                    output_str += f",\n{countstr}: {counts[countstr]}"
 
         output_str = "\n*** Resources ***"
         add_what_updated_str(self.resource_what_updated)
@@ -967,53 +1512,97 @@ class DataFreshness:
         logger.info(output_str)
         return output_str
 
+    def write_counts(self) -> None:
+        """Write the counts of datasets and resources in each what updated category
+        for the run to the database so that they can be compared over time
+
+        Returns:
+            None
+        """
+        for object_type, what_updated in (
+            ("dataset", self.dataset_what_updated),
+            ("resource", self.resource_what_updated),
+        ):
+            for category, count in what_updated.counts.items():
+                self.bulkwriter.add_upsert(
+                    DBWhatUpdatedCount,
+                    {
+                        "run_number": self.run_number,
+                        "object_type": object_type,
+                        "category": category,
+                        "count": count,
+                    },
+                )
+            for category, sample in what_updated.samples.items():
+                logger.debug(f"Sample of {object_type}s in {category}: {sample}")
+        self.bulkwriter.write()
+        self.session.commit()
+
+    @staticmethod
+    def set_error(dbresource: DBResource, error: str) -> bool:
+        """Set the error of a database resource along with the structured code of the
+        error so that errors can be filtered and grouped in the database.
+
+        Args:
+            dbresource (DBResource): Database resource to update
+            error (str): Error message
+
+        Returns:
+            bool: Whether the error means that the resource is broken
+        """
+        category, status, raised = Retrieval.get_error_code(error)
+        dbresource.error = error
+        dbresource.error_category = category
+        dbresource.error_status = status
+        dbresource.error_raised = raised
+        return category in Retrieval.broken_error_categories
+
     @staticmethod
     def set_latest_of_modifieds(
         dbobject: Union[DBDataset, DBResource],
         modified_date: datetime,
-        what_updated: str,
-    ) -> Tuple[str, bool]:
+        what_updated: WhatUpdated,
+    ) -> Tuple[WhatUpdated, bool]:
         """Set latest of modifieds if provided date is greater than current and add
-        to the Database object's what_updated field.
+        to the Database object's what_updated flags.
 
         Args:
             dbobject (Union[DBDataset, DBResource]): Database object to update
             modified_date (datetime): New modified date
-            what_updated (str): What updated eg. hash
+            what_updated (WhatUpdated): What updated eg. WhatUpdated.HASH
 
         Returns:
-            Tuple[str, bool]: (DB object's what_updated, whether new date > current)
+            Tuple[WhatUpdated, bool]: (DB object's what_updated, whether new date > current)
         """
+        prev_what_updated = WhatUpdated(dbobject.what_updated_flags or 0)
         if modified_date > dbobject.latest_of_modifieds:
             dbobject.latest_of_modifieds = modified_date
-            dbobject.what_updated = DataFreshness.add_what_updated(
-                dbobject.what_updated, what_updated
+            prev_what_updated = DataFreshness.add_what_updated(
+                prev_what_updated, what_updated
             )
+            DataFreshness.set_what_updated(dbobject, prev_what_updated)
             update = True
         else:
             update = False
-        return dbobject.what_updated, update
+        return prev_what_updated, update
 
     @staticmethod
-    def add_what_updated(prev_what_updated: str, what_updated: str):
-        """Add to what_updated string any new cause of update (such as hash). "nothing"
-        is removed if anything else is added.
+    def add_what_updated(
+        prev_what_updated: WhatUpdated, what_updated: WhatUpdated
+    ) -> WhatUpdated:
+        """Add to what_updated flags any new cause of update (such as hash). "nothing"
+        and "firstrun" are replaced by whatever is added.
 
         Args:
-            prev_what_updated (str): Previous what_updated string
-            what_updated (str): Additional what_updated string
+            prev_what_updated (WhatUpdated): Previous what_updated flags
+            what_updated (WhatUpdated): Additional what_updated flags
 
         Returns:
-            str: New what_updated string
+            WhatUpdated: New what_updated flags
         """
-        if what_updated in prev_what_updated:
-            return prev_what_updated
-        if prev_what_updated != "nothing" and prev_what_updated != "firstrun":
-            if what_updated != "nothing":
-                return f"{prev_what_updated},{what_updated}"
-            return prev_what_updated
-        else:
-            return what_updated
+        if prev_what_updated in (WhatUpdated.NOTHING, WhatUpdated.FIRSTRUN):
+            return WhatUpdated(what_updated)
+        return prev_what_updated | what_updated
 
     def calculate_freshness(
         self, last_modified: datetime, update_frequency: int
@@ -1028,11 +1617,6 @@ class DataFreshness:
         Returns:
             int: 0 for fresh, 1 for due, 2 for overdue and 3 for delinquent
         """
-        delta = self.now - last_modified
-        if delta >= self.freshness_by_frequency[update_frequency]["Delinquent"]:
-            return 3
-        elif delta >= self.freshness_by_frequency[update_frequency]["Overdue"]:
-            return 2
-        elif delta >= self.freshness_by_frequency[update_frequency]["Due"]:
-            return 1
-        return 0
+        return self.freshness_engine.calculate(
+            self.now, last_modified, update_frequency
+        )
@@ -0,0 +1,140 @@
+"""Calculation of freshness from the aging thresholds for single datasets and for
+whole runs in the database"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, case, select, update
+from sqlalchemy.orm import Session
+
+from ..database.dbdataset import DBDataset
+
+logger = logging.getLogger(__name__)
+
+
+class FreshnessEngine:
+    """Calculates freshness from the aging thresholds of each update frequency.
+    Freshness is 0 for fresh, 1 for due, 2 for overdue and 3 for delinquent. As well
+    as calculating it for a single date, it can produce an SQL CASE expression that
+    calculates it the same way so that the freshness of all datasets in a run can
+    be recomputed and written with one UPDATE rather than one object at a time.
+
+    Args:
+        aging (Dict[Any, Dict[str, int]]): Update frequency to status to days
+    """
+
+    def __init__(self, aging: Dict[Any, Dict[str, int]]) -> None:
+        self.freshness_by_frequency: Dict[int, Dict[str, timedelta]] = {}
+        for key, value in aging.items():
+            update_frequency = int(key)
+            freshness_frequency = {}
+            for status in value:
+                nodays = value[status]
+                freshness_frequency[status] = timedelta(days=nodays)
+            self.freshness_by_frequency[update_frequency] = freshness_frequency
+
+    def calculate(
+        self, now: datetime, last_modified: datetime, update_frequency: int
+    ) -> int:
+        """Calculate freshness at a given time based on a last modified date and the
+        expected update frequency
+
+        Args:
+            now (datetime): Time at which to calculate freshness
+            last_modified (datetime): Last modified date
+            update_frequency (int): Expected update frequency
+
+        Returns:
+            int: 0 for fresh, 1 for due, 2 for overdue and 3 for delinquent
+        """
+        delta = now - last_modified
+        if delta >= self.freshness_by_frequency[update_frequency]["Delinquent"]:
+            return 3
+        elif delta >= self.freshness_by_frequency[update_frequency]["Overdue"]:
+            return 2
+        elif delta >= self.freshness_by_frequency[update_frequency]["Due"]:
+            return 1
+        return 0
+
+    def get_case(self, now: datetime, latest_of_modifieds: Any, update_frequency: Any):
+        """Get SQL CASE expression that calculates freshness at a given time the same
+        way as calculate. The thresholds for each update frequency are turned into
+        cutoff dates so that the comparisons can use the column directly.
+
+        Args:
+            now (datetime): Time at which to calculate freshness
+            latest_of_modifieds (Any): Latest of modifieds column or expression
+            update_frequency (Any): Update frequency column or expression
+
+        Returns:
+            sqlalchemy.sql.elements.Case: CASE expression giving freshness
+        """
+        whens = [
+            (update_frequency.is_(None), None),
+            (update_frequency.in_((0, -1, -2)), 0),
+        ]
+        for frequency, thresholds in self.freshness_by_frequency.items():
+            for fresh, status in ((3, "Delinquent"), (2, "Overdue"), (1, "Due")):
+                cutoff = now - thresholds[status]
+                whens.append(
+                    (
+                        and_(
+                            update_frequency == frequency,
+                            latest_of_modifieds <= cutoff,
+                        ),
+                        fresh,
+                    )
+                )
+            whens.append((update_frequency == frequency, 0))
+        return case(*whens, else_=None)
+
+    def update_run(
+        self,
+        session: Session,
+        run_number: int,
+        now: datetime,
+        dataset_ids: Optional[List[str]] = None,
+    ) -> Dict[str, Optional[int]]:
+        """Recompute the freshness of datasets with a regular update frequency in a
+        run from their latest of modifieds and write it to the database. Other
+        datasets keep their freshness. All of the run's datasets are updated unless
+        dataset ids are given.
+
+        Args:
+            session (sqlalchemy.orm.Session): Session to use for queries
+            run_number (int): Run number
+            now (datetime): Time at which to calculate freshness eg. run date
+            dataset_ids (Optional[List[str]]): Dataset ids to update. Defaults to None.
+
+        Returns:
+            Dict[str, Optional[int]]: Dataset id to freshness of updated datasets
+        """
+        fresh = self.get_case(
+            now, DBDataset.latest_of_modifieds, DBDataset.update_frequency
+        )
+        conditions = [
+            DBDataset.run_number == run_number,
+            DBDataset.update_frequency > 0,
+        ]
+        if dataset_ids is None:
+            chunks = [conditions]
+        else:
+            chunks = [
+                conditions + [DBDataset.id.in_(dataset_ids[start : start + 10000])]
+                for start in range(0, len(dataset_ids), 10000)
+            ]
+        freshness = {}
+        for where in chunks:
+            session.execute(
+                update(DBDataset)
+                .where(*where)
+                .values(fresh=fresh)
+                .execution_options(synchronize_session=False)
+            )
+            results = session.execute(
+                select(DBDataset.id, DBDataset.fresh).where(*where)
+            )
+            for dataset_id, dataset_fresh in results:
+                freshness[dataset_id] = dataset_fresh
+        return freshness
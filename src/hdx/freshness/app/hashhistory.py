@@ -0,0 +1,126 @@
+"""History of the hashes of resources used to detect repeated hashes"""
+
+import logging
+from typing import Dict, List, Tuple
+
+from sqlalchemy import exists, func, insert, select
+from sqlalchemy.orm import Session
+
+from ..database.dbresource import DBResource
+from ..database.dbresourcehash import DBResourceHash
+from ..utils.bulkwriter import BulkWriter
+
+logger = logging.getLogger(__name__)
+
+
+class HashHistory:
+    """Keeps every hash recorded for each resource with the first and last runs in
+    which it was recorded, so that whether a changed hash has occurred before can be
+    determined without searching the resource's rows in all runs. The history is
+    kept in its own table so that it is not lost when old runs are cleaned. If the
+    table is empty, it is filled from the hashes in the existing runs.
+
+    Args:
+        session (sqlalchemy.orm.Session): Session to use for queries
+    """
+
+    def __init__(self, session: Session) -> None:
+        self.session = session
+        self.bulkwriter = BulkWriter(session)
+        self.hashes: Dict[Tuple[str, str], int] = {}
+
+    def backfill(self) -> None:
+        """Fill an empty history from the hashes of resources in existing runs
+
+        Returns:
+            None
+        """
+        if self.session.scalar(select(exists().select_from(DBResourceHash))):
+            return
+        columns = [
+            DBResource.id,
+            DBResource.md5_hash,
+            func.min(DBResource.run_number),
+            func.max(DBResource.run_number),
+        ]
+        hashes = (
+            select(*columns)
+            .where(DBResource.md5_hash.is_not(None))
+            .group_by(DBResource.id, DBResource.md5_hash)
+        )
+        self.session.execute(
+            insert(DBResourceHash).from_select(
+                ["resource_id", "hash", "first_seen_run", "last_seen_run"], hashes
+            )
+        )
+        logger.info("Filled hash history from existing runs")
+
+    def load(self, resource_ids: List[str]) -> None:
+        """Load the hash history of the given resources
+
+        Args:
+            resource_ids (List[str]): Resource ids
+
+        Returns:
+            None
+        """
+        self.backfill()
+        self.hashes = {}
+        columns = [
+            DBResourceHash.resource_id,
+            DBResourceHash.hash,
+            DBResourceHash.first_seen_run,
+        ]
+        for start in range(0, len(resource_ids), 10000):
+            ids = resource_ids[start : start + 10000]
+            results = self.session.execute(
+                select(*columns).where(DBResourceHash.resource_id.in_(ids))
+            ).all()
+            for resource_id, hash, first_seen_run in results:
+                self.hashes[(resource_id, hash)] = first_seen_run
+        logger.info(
+            f"Loaded {len(self.hashes)} hashes of {len(resource_ids)} resources"
+        )
+
+    def is_repeat(self, resource_id: str, hash: str) -> bool:
+        """Whether hash has been recorded for resource before
+
+        Args:
+            resource_id (str): Resource id
+            hash (str): Hash
+
+        Returns:
+            bool: Whether hash is a repeat
+        """
+        return (resource_id, hash) in self.hashes
+
+    def add(self, resource_id: str, hash: str, run_number: int) -> None:
+        """Record hash of resource in run
+
+        Args:
+            resource_id (str): Resource id
+            hash (str): Hash
+            run_number (int): Run number
+
+        Returns:
+            None
+        """
+        key = (resource_id, hash)
+        first_seen_run = self.hashes.setdefault(key, run_number)
+        self.bulkwriter.add_upsert(
+            DBResourceHash,
+            {
+                "resource_id": resource_id,
+                "hash": hash,
+                "first_seen_run": first_seen_run,
+                "last_seen_run": run_number,
+            },
+        )
+
+    def write(self) -> None:
+        """Write hashes recorded in run to the database
+
+        Returns:
+            None
+        """
+        self.bulkwriter.write()
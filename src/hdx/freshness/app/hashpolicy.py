@@ -0,0 +1,160 @@
+"""Policy that uses the history of resources to decide how they are hashed"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from ..database.dbresource import DBResource
+
+logger = logging.getLogger(__name__)
+
+
+class HashPolicy:
+    """Uses the api field of each resource over recent runs to decide whether a
+    changed hash needs to be confirmed by a second download. A resource found not to
+    be an API in at least stable_runs runs (and never found to be one) is a stable
+    file whose first download is trusted. A resource found to be an API in at least
+    api_runs runs (and never found not to be one) is a known API that does not need a
+    second download and is only hashed every api_check_days days. Resources whose
+    changes are not confirmed have api left unset in that run so that only confirmed
+    runs count towards their history, and a changed hash is confirmed again if the
+    resource has not been confirmed in the last confirm_runs runs.
+
+    Args:
+        session (sqlalchemy.orm.Session): Session to use for queries
+        lookback_runs (int): Number of previous runs to examine. Defaults to 180.
+        stable_runs (int): Runs needed to consider a file stable. Defaults to 10.
+        api_runs (int): Runs needed to consider a resource an API. Defaults to 3.
+        api_check_days (int): Days between hashes of known APIs. Defaults to 90.
+        confirm_runs (int): Runs after which a change is confirmed. Defaults to 10.
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        lookback_runs: int = 180,
+        stable_runs: int = 10,
+        api_runs: int = 3,
+        api_check_days: int = 90,
+        confirm_runs: int = 10,
+    ) -> None:
+        self.session = session
+        self.lookback_runs = lookback_runs
+        self.stable_runs = stable_runs
+        self.api_runs = api_runs
+        self.api_check_period = timedelta(days=api_check_days)
+        self.confirm_runs = confirm_runs
+        self.api_history: Dict[str, Tuple[int, int]] = {}
+        self.last_confirmed: Dict[str, int] = {}
+        self.run_number: Optional[int] = None
+
+    def load(self, previous_run_number: Optional[int]) -> None:
+        """Load from the database the number of runs in which each resource was found
+        not to be an API and found to be an API and the last run in which it was
+        checked for being an API
+
+        Args:
+            previous_run_number (Optional[int]): Previous run number or None
+
+        Returns:
+            None
+        """
+        self.api_history = {}
+        self.last_confirmed = {}
+        if previous_run_number is None:
+            self.run_number = None
+            return
+        self.run_number = previous_run_number + 1
+        columns = [
+            DBResource.id,
+            func.sum(case((DBResource.api.is_(False), 1), else_=0)),
+            func.sum(case((DBResource.api.is_(True), 1), else_=0)),
+            func.max(DBResource.run_number),
+        ]
+        filters = [
+            DBResource.run_number > previous_run_number - self.lookback_runs,
+            DBResource.api.is_not(None),
+        ]
+        results = self.session.execute(
+            select(*columns).where(*filters).group_by(DBResource.id)
+        )
+        for resource_id, nofile, noapi, last_confirmed in results:
+            self.api_history[resource_id] = (nofile, noapi)
+            self.last_confirmed[resource_id] = last_confirmed
+        logger.info(f"Loaded api history of {len(self.api_history)} resources")
+
+    def is_stable_file(self, resource_id: str) -> bool:
+        """Whether resource has consistently been found not to be an API
+
+        Args:
+            resource_id (str): Resource id
+
+        Returns:
+            bool: Whether resource is a stable file
+        """
+        nofile, noapi = self.api_history.get(resource_id, (0, 0))
+        return noapi == 0 and nofile >= self.stable_runs
+
+    def is_known_api(self, resource_id: str) -> bool:
+        """Whether resource has consistently been found to be an API
+
+        Args:
+            resource_id (str): Resource id
+
+        Returns:
+            bool: Whether resource is a known API
+        """
+        nofile, noapi = self.api_history.get(resource_id, (0, 0))
+        return nofile == 0 and noapi >= self.api_runs
+
+    def is_confirmation_due(self, resource_id: str) -> bool:
+        """Whether resource has not been checked for being an API in the last
+        confirm_runs runs
+
+        Args:
+            resource_id (str): Resource id
+
+        Returns:
+            bool: Whether a change to the resource is due to be confirmed
+        """
+        last_confirmed = self.last_confirmed.get(resource_id)
+        if last_confirmed is None or self.run_number is None:
+            return True
+        return self.run_number - last_confirmed >= self.confirm_runs
+
+    def needs_confirmation(self, resource_id: str) -> bool:
+        """Whether a changed hash needs to be confirmed by a second download
+
+        Args:
+            resource_id (str): Resource id
+
+        Returns:
+            bool: Whether to download and hash again
+        """
+        if self.is_confirmation_due(resource_id):
+            return True
+        if self.is_stable_file(resource_id):
+            return False
+        if self.is_known_api(resource_id):
+            return False
+        return True
+
+    def skip_hash(
+        self, resource_id: str, when_checked: Optional[datetime], now: datetime
+    ) -> bool:
+        """Whether to skip hashing a known API because it was checked recently
+
+        Args:
+            resource_id (str): Resource id
+            when_checked (Optional[datetime]): When resource was last checked
+            now (datetime): Date of run
+
+        Returns:
+            bool: Whether to skip hashing resource
+        """
+        if when_checked is None or not self.is_known_api(resource_id):
+            return False
+        return now - when_checked < self.api_check_period
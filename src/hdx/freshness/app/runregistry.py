@@ -0,0 +1,105 @@
+"""Registry of the current run's database records that are used across stages"""
+
+import logging
+from typing import Any, Dict, List, Type, Union
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from ..database.dbdataset import DBDataset
+from ..database.dbresource import DBResource
+
+logger = logging.getLogger(__name__)
+
+
+class RunRegistry:
+    """Keeps the current run's records for the datasets and resources that are to
+    be checked, as created when the datasets are processed, so that later stages can
+    look them up by id rather than querying the database for each one. The records
+    are ORM objects created from the rows written in bulk and marked as already
+    persisted, so they are kept detached from the session (and are not expired by
+    commits) except while a stage is changing them. Records that are not in the
+    registry are queried from the database.
+
+    Args:
+        session (sqlalchemy.orm.Session): Session to use for queries
+        run_number (int): Current run number
+    """
+
+    def __init__(self, session: Session, run_number: int) -> None:
+        self.session = session
+        self.run_number = run_number
+        self.records: Dict[Type, Dict[str, Union[DBDataset, DBResource]]] = {}
+        self.attached: List[Union[DBDataset, DBResource]] = []
+
+    def add(
+        self, model: Type[Union[DBDataset, DBResource]], row: Dict[str, Any]
+    ) -> None:
+        """Add the record for a row that has been or will be written to the database
+
+        Args:
+            model (Type[Union[DBDataset, DBResource]]): DBDataset or DBResource
+            row (Dict[str, Any]): Row keyed by column name
+
+        Returns:
+            None
+        """
+        columns = model.__table__.columns.keys()
+        record = model(**{x: row.get(x) for x in columns})
+        make_transient_to_detached(record)
+        records = self.records.get(model)
+        if records is None:
+            records = {}
+            self.records[model] = records
+        records[row["id"]] = record
+
+    def get(
+        self, model: Type[Union[DBDataset, DBResource]], record_id: str
+    ) -> Union[DBDataset, DBResource]:
+        """Get the current run's record with the given id, querying the database if
+        it is not in the registry
+
+        Args:
+            model (Type[Union[DBDataset, DBResource]]): DBDataset or DBResource
+            record_id (str): Dataset or resource id
+
+        Returns:
+            Union[DBDataset, DBResource]: Record
+        """
+        record = self.records.get(model, {}).get(record_id)
+        if record is None:
+            record = self.session.execute(
+                select(model).where(
+                    model.run_number == self.run_number,
+                    model.id == record_id,
+                )
+            ).scalar_one()
+        return record
+
+    def attach(self, model: Type[Union[DBDataset, DBResource]]) -> None:
+        """Attach the records of a model to the session so that changes to them are
+        written
+
+        Args:
+            model (Type[Union[DBDataset, DBResource]]): DBDataset or DBResource
+
+        Returns:
+            None
+        """
+        for record in self.records.get(model, {}).values():
+            self.session.add(record)
+            self.attached.append(record)
+
+    def detach(self) -> None:
+        """Write changes to attached records and detach them from the session so
+        that they stay loaded after the next commit
+
+        Returns:
+            None
+        """
+        if not self.attached:
+            return
+        self.session.flush()
+        for record in self.attached:
+            self.session.expunge(record)
+        self.attached = []
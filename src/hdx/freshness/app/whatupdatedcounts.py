@@ -0,0 +1,39 @@
+"""Counts of the datasets or resources with each what updated category in a run"""
+
+import logging
+from collections import Counter
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class WhatUpdatedCounts:
+    """Counts the datasets or resources added under each what updated category
+    rather than keeping every id. For debugging, up to sample_size ids can be kept
+    per category.
+
+    Args:
+        sample_size (int): Number of ids to keep per category. Defaults to 0.
+    """
+
+    def __init__(self, sample_size: int = 0) -> None:
+        self.sample_size = sample_size
+        self.counts: Counter = Counter()
+        self.samples: Dict[str, List[str]] = {}
+
+    def add(self, category: str, object_id: str) -> None:
+        """Count a dataset or resource under a category
+
+        Args:
+            category (str): What updated category eg. "total" or "hash"
+            object_id (str): Dataset or resource id
+
+        Returns:
+            None
+        """
+        self.counts[category] += 1
+        if not self.sample_size:
+            return
+        sample = self.samples.setdefault(category, [])
+        if len(sample) < self.sample_size:
+            sample.append(object_id)
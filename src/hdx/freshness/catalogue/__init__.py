@@ -0,0 +1,10 @@
+from sqlalchemy.orm import DeclarativeBase, declared_attr
+
+
+class Base(DeclarativeBase):
+    """Base for the tables of the catalogue cache, which is kept in its own
+    database rather than the freshness database"""
+
+    @declared_attr.directive
+    def __tablename__(cls):
+        return f"{cls.__name__.lower()}s"
@@ -0,0 +1,232 @@
+"""Local cache of the HDX catalogue that is synchronised incrementally"""
+
+import json
+import logging
+import zlib
+from typing import Dict, Iterator, List, Optional, Set
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from ..utils.bulkwriter import BulkWriter
+from .dbcatalogueddataset import DBCataloguedDataset
+from hdx.api.configuration import Configuration
+from hdx.data.dataset import Dataset
+from hdx.data.resource import Resource
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogueCache:
+    """Keeps the metadata of all public HDX datasets in a local database, stored as
+    compressed JSON. The first sync downloads the whole catalogue. Later syncs only
+    download datasets whose metadata_modified is at or after the latest one in the
+    cache, then reconcile the cached ids against a list of all ids in HDX to remove
+    datasets that were deleted or made private. Datasets are not removed if the
+    number of ids listed differs from the count HDX reports, as the catalogue
+    changing during paging can cause ids to be skipped.
+
+    Args:
+        session (sqlalchemy.orm.Session): Session for the cache database
+        configuration (Optional[Configuration]): HDX configuration. Defaults to global.
+        page_size (int): Number of rows per package_search call. Defaults to 1000.
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        configuration: Optional[Configuration] = None,
+        page_size: int = 1000,
+    ) -> None:
+        self.session = session
+        self.configuration = configuration
+        self.page_size = page_size
+
+    @staticmethod
+    def compress(dataset: Dict) -> bytes:
+        """Compress dataset metadata
+
+        Args:
+            dataset (Dict): Dataset metadata
+
+        Returns:
+            bytes: Compressed JSON
+        """
+        return zlib.compress(json.dumps(dataset, separators=(",", ":")).encode())
+
+    @staticmethod
+    def decompress(data: bytes) -> Dict:
+        """Decompress dataset metadata
+
+        Args:
+            data (bytes): Compressed JSON
+
+        Returns:
+            Dict: Dataset metadata
+        """
+        return json.loads(zlib.decompress(data))
+
+    def search(self, data: Dict) -> Iterator[List[Dict]]:
+        """Page through package_search yielding each page of results
+
+        Args:
+            data (Dict): Parameters for package_search other than rows and start
+
+        Returns:
+            Iterator[List[Dict]]: Pages of results
+        """
+        start = 0
+        while True:
+            result = self.configuration.call_remoteckan(
+                "package_search",
+                {**data, "rows": self.page_size, "start": start},
+            )
+            results = result["results"]
+            if results:
+                yield results
+            if len(results) < self.page_size:
+                return
+            start += self.page_size
+
+    def get_last_modified(self) -> Optional[str]:
+        """Get the latest metadata_modified in the cache
+
+        Returns:
+            Optional[str]: Latest metadata_modified or None if cache is empty
+        """
+        return self.session.scalar(
+            select(func.max(DBCataloguedDataset.metadata_modified))
+        )
+
+    def update(self, last_modified: Optional[str]) -> int:
+        """Download datasets modified at or after last_modified (or all datasets if
+        it is None) and store them in the cache
+
+        Args:
+            last_modified (Optional[str]): Latest metadata_modified in the cache
+
+        Returns:
+            int: Number of datasets downloaded
+        """
+        data = {"q": "*:*"}
+        if last_modified is None:
+            logger.info("Downloading whole catalogue")
+            data["sort"] = "metadata_created asc"
+        else:
+            logger.info(f"Downloading datasets modified since {last_modified}")
+            # truncate to seconds as the range is inclusive anyway
+            data["fq"] = f"metadata_modified:[{last_modified[:19]}Z TO *]"
+            data["sort"] = "metadata_modified asc"
+        bulkwriter = BulkWriter(self.session)
+        count = 0
+        for datasets in self.search(data):
+            for dataset in datasets:
+                bulkwriter.add_upsert(
+                    DBCataloguedDataset,
+                    {
+                        "id": dataset["id"],
+                        "metadata_modified": dataset["metadata_modified"],
+                        "data": self.compress(dataset),
+                    },
+                )
+            bulkwriter.write()
+            self.session.commit()
+            count += len(datasets)
+        return count
+
+    def get_hdx_ids(self) -> Optional[Set[str]]:
+        """Get the ids of all datasets in HDX, requesting only the id field. If the
+        number of ids differs from the count of datasets obtained beforehand, the
+        catalogue changed during paging and ids may have been skipped, so None is
+        returned.
+
+        Returns:
+            Optional[Set[str]]: Dataset ids or None if they may be incomplete
+        """
+        result = self.configuration.call_remoteckan(
+            "package_search", {"q": "*:*", "rows": 0}
+        )
+        count = result["count"]
+        data = {"q": "*:*", "fl": "id", "sort": "metadata_created asc"}
+        hdx_ids = {x["id"] for datasets in self.search(data) for x in datasets}
+        if len(hdx_ids) != count:
+            logger.warning(
+                f"Listed {len(hdx_ids)} dataset ids from HDX but expected {count}!"
+            )
+            return None
+        return hdx_ids
+
+    def reconcile(self) -> int:
+        """Remove datasets from the cache that are no longer in HDX. Nothing is
+        removed if the ids in HDX could not be listed reliably.
+
+        Returns:
+            int: Number of datasets removed
+        """
+        hdx_ids = self.get_hdx_ids()
+        if hdx_ids is None:
+            logger.warning("Not removing datasets from catalogue cache!")
+            return 0
+        cached_ids = self.session.scalars(select(DBCataloguedDataset.id)).all()
+        removed_ids = [x for x in cached_ids if x not in hdx_ids]
+        for start in range(0, len(removed_ids), self.page_size):
+            ids = removed_ids[start : start + self.page_size]
+            self.session.execute(
+                delete(DBCataloguedDataset).where(DBCataloguedDataset.id.in_(ids))
+            )
+        self.session.commit()
+        return len(removed_ids)
+
+    def sync(self) -> None:
+        """Synchronise the cache with HDX
+
+        Returns:
+            None
+        """
+        if self.configuration is None:
+            self.configuration = Configuration.read()
+        self.configuration.set_read_only(True)  # so that we only get public datasets
+        try:
+            last_modified = self.get_last_modified()
+            updated = self.update(last_modified)
+            if last_modified is None:
+                removed = 0
+            else:
+                removed = self.reconcile()
+        finally:
+            self.configuration.set_read_only(False)
+        logger.info(f"Catalogue cache: {updated} downloaded, {removed} removed")
+
+    def get_dataset(self, data: bytes) -> Dataset:
+        """Create HDX dataset from compressed metadata
+
+        Args:
+            data (bytes): Compressed JSON
+
+        Returns:
+            Dataset: HDX dataset
+        """
+        datasetdict = self.decompress(data)
+        resources = datasetdict.pop("resources", [])
+        dataset = Dataset(datasetdict, configuration=self.configuration)
+        dataset.get_resources().extend(
+            Resource(x, configuration=self.configuration) for x in resources
+        )
+        return dataset
+
+    def get_pages(self, page_size: int) -> Iterator[List[Dataset]]:
+        """Get pages of HDX datasets from the cache
+
+        Args:
+            page_size (int): Number of datasets per page
+
+        Returns:
+            Iterator[List[Dataset]]: Pages of HDX datasets
+        """
+        results = self.session.execute(
+            select(DBCataloguedDataset.data)
+            .order_by(DBCataloguedDataset.id)
+            .execution_options(yield_per=page_size)
+        )
+        for rows in results.partitions():
+            yield [self.get_dataset(x.data) for x in rows]
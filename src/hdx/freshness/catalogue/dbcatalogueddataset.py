@@ -0,0 +1,30 @@
+"""SQLAlchemy class representing DBCataloguedDataset row. Holds the compressed HDX
+metadata of a dataset in the local catalogue cache.
+"""
+
+from sqlalchemy.orm import Mapped, mapped_column
+
+from . import Base
+
+
+class DBCataloguedDataset(Base):
+    """
+    id: Mapped[str] = mapped_column(primary_key=True)
+    metadata_modified: Mapped[str] = mapped_column(nullable=False, index=True)
+    data: Mapped[bytes] = mapped_column(nullable=False)
+    """
+
+    id: Mapped[str] = mapped_column(primary_key=True)
+    metadata_modified: Mapped[str] = mapped_column(nullable=False, index=True)
+    data: Mapped[bytes] = mapped_column(nullable=False)
+
+    def __repr__(self) -> str:
+        """String representation of DBCataloguedDataset row
+
+        Returns:
+            str: String representation of DBCataloguedDataset row
+        """
+        return (
+            f"<CataloguedDataset(id={self.id}, "
+            f"metadata modified={self.metadata_modified})>"
+        )
@@ -2,12 +2,31 @@ from datetime import datetime
 
 from sqlalchemy.orm import DeclarativeBase, declared_attr
 
+from .compacttypes import HashBytes, UUIDString, hash_str, uuid_str
 from hdx.database.no_timezone import ConversionNoTZ
 
 
 class Base(DeclarativeBase):
     type_annotation_map = {
         datetime: ConversionNoTZ,
+        uuid_str: UUIDString,
+        hash_str: HashBytes,
+    }
+
+    @declared_attr.directive
+    def __tablename__(cls):
+        return f"{cls.__name__.lower()}s"
+
+
+class VersionBase(DeclarativeBase):
+    """Base for the tables that store dataset and resource rows as versions valid
+    over a range of runs. They are only created in the freshness database when runs
+    are first folded into them."""
+
+    type_annotation_map = {
+        datetime: ConversionNoTZ,
+        uuid_str: UUIDString,
+        hash_str: HashBytes,
     }
 
     @declared_attr.directive
@@ -0,0 +1,91 @@
+"""Column types for ids and hashes. They are stored as strings unless compact types
+are enabled, in which case Postgres databases store ids with the native uuid type and
+MD5 hashes as 16 bytes in bytea columns, roughly halving the size of the run tables
+and their indexes. Values are always strings in Python.
+"""
+
+from typing import Annotated, Any, Optional
+from uuid import UUID
+
+from sqlalchemy import String
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Dialect
+from sqlalchemy.types import TypeDecorator, TypeEngine
+
+uuid_str = Annotated[str, "uuid"]
+hash_str = Annotated[str, "hash"]
+
+
+class CompactType(TypeDecorator):
+    """Base of column types that can be stored compactly in Postgres"""
+
+    impl = String
+    cache_ok = True
+    enabled = False
+
+    @staticmethod
+    def is_compact(dialect: Dialect) -> bool:
+        """Whether values are stored compactly in a database
+
+        Args:
+            dialect (Dialect): Database dialect
+
+        Returns:
+            bool: True if compact types are enabled and the database is Postgres
+        """
+        return CompactType.enabled and dialect.name == "postgresql"
+
+
+class UUIDString(CompactType):
+    """Id stored as uuid in Postgres if compact types are enabled and otherwise as a
+    string. Ids are returned as strings even if compact types are not enabled but the
+    database has been converted to them.
+    """
+
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect: Dialect) -> TypeEngine:
+        if self.is_compact(dialect):
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=False))
+        return dialect.type_descriptor(String())
+
+    def process_result_value(self, value: Any, dialect: Dialect) -> Optional[str]:
+        if isinstance(value, UUID):
+            return str(value)
+        return value
+
+
+class HashBytes(CompactType):
+    """MD5 hash stored as 16 bytes in bytea in Postgres if compact types are enabled
+    and otherwise as a 32 character hex string. Hashes are returned as hex strings.
+    """
+
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect: Dialect) -> TypeEngine:
+        if self.is_compact(dialect):
+            return dialect.type_descriptor(postgresql.BYTEA())
+        return dialect.type_descriptor(String())
+
+    def process_bind_param(self, value: Optional[str], dialect: Dialect) -> Any:
+        if value is not None and self.is_compact(dialect):
+            return bytes.fromhex(value)
+        return value
+
+    def process_result_value(self, value: Any, dialect: Dialect) -> Optional[str]:
+        if isinstance(value, (bytes, memoryview)):
+            return bytes(value).hex()
+        return value
+
+
+def set_compact_types(enabled: bool) -> None:
+    """Set whether ids and hashes are stored compactly in Postgres. Must be called
+    before connecting to the database.
+
+    Args:
+        enabled (bool): Whether to enable compact types
+
+    Returns:
+        None
+    """
+    CompactType.enabled = enabled
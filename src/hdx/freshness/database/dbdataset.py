@@ -4,10 +4,11 @@ each run.
 
 from datetime import datetime
 
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column
 
 from . import Base
+from .compacttypes import uuid_str
 
 
 class DBDataset(Base):
@@ -15,7 +16,7 @@ class DBDataset(Base):
     run_number: Mapped[int] = mapped_column(
         ForeignKey("dbruns.run_number"), primary_key=True
     )
-    id: Mapped[str] = mapped_column(
+    id: Mapped[uuid_str] = mapped_column(
         ForeignKey("dbinfodatasets.id"), primary_key=True
     )
     dataset_date: Mapped[str] = mapped_column(nullable=True)
@@ -29,6 +30,7 @@ class DBDataset(Base):
 
     latest_of_modifieds: Mapped[datetime] = mapped_column(nullable=False)
     what_updated: Mapped[str] = mapped_column(nullable=False)
+    what_updated_flags: Mapped[int] = mapped_column(nullable=True)
     last_resource_updated: Mapped[str] = mapped_column(
         nullable=False
     )  # id of last resource updated
@@ -37,12 +39,23 @@ class DBDataset(Base):
     )  # date last resource updated
     fresh: Mapped[int] = mapped_column(nullable=True)
     error: Mapped[bool] = mapped_column(nullable=False)
+
+    __table_args__ = (
+        Index("ix_dbdatasets_run_number_fresh", "run_number", "fresh"),
+        Index(
+            "ix_dbdatasets_run_number_what_updated_flags",
+            "run_number",
+            "what_updated_flags",
+        ),
+    )
     """
 
     run_number: Mapped[int] = mapped_column(
         ForeignKey("dbruns.run_number"), primary_key=True
     )
-    id: Mapped[str] = mapped_column(ForeignKey("dbinfodatasets.id"), primary_key=True)
+    id: Mapped[uuid_str] = mapped_column(
+        ForeignKey("dbinfodatasets.id"), primary_key=True
+    )
     dataset_date: Mapped[str] = mapped_column(nullable=True)
     update_frequency: Mapped[int] = mapped_column(nullable=True)
     review_date: Mapped[datetime] = mapped_column(nullable=True)
@@ -53,6 +66,7 @@ class DBDataset(Base):
     )  # this field and above are CKAN fields
     latest_of_modifieds: Mapped[datetime] = mapped_column(nullable=False)
     what_updated: Mapped[str] = mapped_column(nullable=False)
+    what_updated_flags: Mapped[int] = mapped_column(nullable=True)
     last_resource_updated: Mapped[str] = mapped_column(
         nullable=False
     )  # id of last resource updated
@@ -62,6 +76,16 @@ class DBDataset(Base):
     fresh: Mapped[int] = mapped_column(nullable=True)
     error: Mapped[bool] = mapped_column(nullable=False)
 
+    # datasets of a run by freshness status
+    __table_args__ = (
+        Index("ix_dbdatasets_run_number_fresh", "run_number", "fresh"),
+        Index(
+            "ix_dbdatasets_run_number_what_updated_flags",
+            "run_number",
+            "what_updated_flags",
+        ),
+    )
+
     def __repr__(self) -> str:
         """String representation of DBDataset row
 
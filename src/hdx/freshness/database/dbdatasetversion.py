@@ -0,0 +1,81 @@
+"""SQLAlchemy class representing DBDatasetVersion row. Holds dynamic dataset metadata
+that is unchanged over a range of runs.
+"""
+
+from datetime import datetime
+
+from sqlalchemy.orm import Mapped, mapped_column
+
+from . import VersionBase
+from .compacttypes import uuid_str
+
+
+class DBDatasetVersion(VersionBase):
+    """
+    id: Mapped[uuid_str] = mapped_column(primary_key=True)
+    valid_from_run: Mapped[int] = mapped_column(primary_key=True)
+    valid_to_run: Mapped[int] = mapped_column(
+        nullable=True, index=True
+    )  # None if version is current
+    dataset_date: Mapped[str] = mapped_column(nullable=True)
+    update_frequency: Mapped[int] = mapped_column(nullable=True)
+    review_date: Mapped[datetime] = mapped_column(nullable=True)
+    last_modified: Mapped[datetime] = mapped_column(nullable=False)
+    updated_by_script: Mapped[datetime] = mapped_column(nullable=True)
+    metadata_modified: Mapped[datetime] = mapped_column(
+        nullable=False
+    )  # this field and above are CKAN fields
+
+    latest_of_modifieds: Mapped[datetime] = mapped_column(nullable=False)
+    what_updated: Mapped[str] = mapped_column(nullable=False)
+    what_updated_flags: Mapped[int] = mapped_column(nullable=True)
+    last_resource_updated: Mapped[str] = mapped_column(
+        nullable=False
+    )  # id of last resource updated
+    last_resource_modified: Mapped[datetime] = mapped_column(
+        nullable=False
+    )  # date last resource updated
+    fresh: Mapped[int] = mapped_column(nullable=True)
+    error: Mapped[bool] = mapped_column(nullable=False)
+    """
+
+    id: Mapped[uuid_str] = mapped_column(primary_key=True)
+    valid_from_run: Mapped[int] = mapped_column(primary_key=True)
+    valid_to_run: Mapped[int] = mapped_column(
+        nullable=True, index=True
+    )  # None if version is current
+    dataset_date: Mapped[str] = mapped_column(nullable=True)
+    update_frequency: Mapped[int] = mapped_column(nullable=True)
+    review_date: Mapped[datetime] = mapped_column(nullable=True)
+    last_modified: Mapped[datetime] = mapped_column(nullable=False)
+    updated_by_script: Mapped[datetime] = mapped_column(nullable=True)
+    metadata_modified: Mapped[datetime] = mapped_column(
+        nullable=False
+    )  # this field and above are CKAN fields
+    latest_of_modifieds: Mapped[datetime] = mapped_column(nullable=False)
+    what_updated: Mapped[str] = mapped_column(nullable=False)
+    what_updated_flags: Mapped[int] = mapped_column(nullable=True)
+    last_resource_updated: Mapped[str] = mapped_column(
+        nullable=False
+    )  # id of last resource updated
+    last_resource_modified: Mapped[datetime] = mapped_column(
+        nullable=False
+    )  # date last resource updated
+    fresh: Mapped[int] = mapped_column(nullable=True)
+    error: Mapped[bool] = mapped_column(nullable=False)
+
+    def __repr__(self) -> str:
+        """String representation of DBDatasetVersion row
+
+        Returns:
+            str: String representation of DBDatasetVersion row
+        """
+        output = f"<DatasetVersion(id={self.id}, valid from run={self.valid_from_run}, "
+        output += f"valid to run={self.valid_to_run},\n"
+        output += f"time period={str(self.dataset_date)}, update frequency={self.update_frequency},\n"
+        output += f"review date={str(self.review_date)}, last modified={str(self.last_modified)}, "
+        output += f"metadata modified={str(self.metadata_modified)}, updated by script={str(self.updated_by_script)},\n"
+        output += f"latest of modifieds={str(self.latest_of_modifieds)}, what updated={str(self.what_updated)},\n"
+        output += f"Resource {str(self.last_resource_updated)}: last modified={str(self.last_resource_modified)},\n"
+        output += f"Dataset fresh={str(self.fresh)}, error={str(self.error)})>"
+        return output
@@ -0,0 +1,23 @@
+"""SQLAlchemy class representing DBFoldedRun row. Holds the numbers of runs whose
+dataset and resource rows have been folded into versions.
+"""
+
+from sqlalchemy.orm import Mapped, mapped_column
+
+from . import VersionBase
+
+
+class DBFoldedRun(VersionBase):
+    """
+    run_number: Mapped[int] = mapped_column(primary_key=True)
+    """
+
+    run_number: Mapped[int] = mapped_column(primary_key=True)
+
+    def __repr__(self) -> str:
+        """String representation of DBFoldedRun row
+
+        Returns:
+            str: String representation of DBFoldedRun row
+        """
+        return f"<Folded run number={self.run_number}>"
@@ -4,26 +4,27 @@ from sqlalchemy import ForeignKey
 from sqlalchemy.orm import Mapped, mapped_column
 
 from . import Base
+from .compacttypes import uuid_str
 
 
 class DBInfoDataset(Base):
     """
-    id: Mapped[str] = mapped_column(primary_key=True)
+    id: Mapped[uuid_str] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(nullable=False)
     title: Mapped[str] = mapped_column(nullable=False)
     private: Mapped[bool] = mapped_column(nullable=False)
-    organization_id: Mapped[str] = mapped_column(
+    organization_id: Mapped[uuid_str] = mapped_column(
         ForeignKey("dborganizations.id"), nullable=False
     )
     location: Mapped[str] = mapped_column(nullable=True)
     maintainer: Mapped[str] = mapped_column(nullable=True)
     """
 
-    id: Mapped[str] = mapped_column(primary_key=True)
+    id: Mapped[uuid_str] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(nullable=False)
     title: Mapped[str] = mapped_column(nullable=False)
     private: Mapped[bool] = mapped_column(nullable=False)
-    organization_id: Mapped[str] = mapped_column(
+    organization_id: Mapped[uuid_str] = mapped_column(
         ForeignKey("dborganizations.id"), nullable=False
     )
     location: Mapped[str] = mapped_column(nullable=True)
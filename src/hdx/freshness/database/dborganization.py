@@ -3,16 +3,17 @@
 from sqlalchemy.orm import Mapped, mapped_column
 
 from . import Base
+from .compacttypes import uuid_str
 
 
 class DBOrganization(Base):
     """
-    id: Mapped[str] = mapped_column(primary_key=True)
+    id: Mapped[uuid_str] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(nullable=False)
     title: Mapped[str] = mapped_column(nullable=False)
     """
 
-    id: Mapped[str] = mapped_column(primary_key=True)
+    id: Mapped[uuid_str] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(nullable=False)
     title: Mapped[str] = mapped_column(nullable=False)
 
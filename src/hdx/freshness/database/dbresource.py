@@ -4,10 +4,11 @@ each run.
 
 from datetime import datetime
 
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from . import Base
+from .compacttypes import hash_str, uuid_str
 
 
 class DBResource(Base):
@@ -15,9 +16,9 @@ class DBResource(Base):
     run_number: Mapped[int] = mapped_column(
         ForeignKey("dbruns.run_number"), primary_key=True
     )
-    id: Mapped[str] = mapped_column(primary_key=True)
+    id: Mapped[uuid_str] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(nullable=False)
-    dataset_id: Mapped[str] = mapped_column(
+    dataset_id: Mapped[uuid_str] = mapped_column(
         ForeignKey("dbinfodatasets.id"), nullable=False
     )
     url: Mapped[str] = mapped_column(nullable=False)
@@ -28,24 +29,47 @@ class DBResource(Base):
 
     latest_of_modifieds: Mapped[datetime] = mapped_column(nullable=False)
     what_updated: Mapped[str] = mapped_column(nullable=False)
+    what_updated_flags: Mapped[int] = mapped_column(nullable=True)
     http_last_modified: Mapped[datetime] = mapped_column(
         default=None, nullable=True
     )
-    md5_hash: Mapped[str] = mapped_column(default=None, nullable=True)
+    md5_hash: Mapped[hash_str] = mapped_column(default=None, nullable=True)
     hash_last_modified: Mapped[datetime] = mapped_column(
         default=None, nullable=True
     )
     when_checked: Mapped[datetime] = mapped_column(default=None, nullable=True)
     api: Mapped[bool] = mapped_column(nullable=True)
     error: Mapped[str] = mapped_column(nullable=True)
+    error_category: Mapped[str] = mapped_column(nullable=True)
+    error_status: Mapped[int] = mapped_column(nullable=True)
+    error_raised: Mapped[str] = mapped_column(nullable=True)
+
+    __table_args__ = (
+        Index("ix_dbresources_id_md5_hash", "id", "md5_hash"),
+        Index("ix_dbresources_run_number_dataset_id", "run_number", "dataset_id"),
+        Index(
+            "ix_dbresources_run_number_when_checked_error",
+            "run_number",
+            "when_checked",
+            postgresql_where=text("error IS NOT NULL"),
+            sqlite_where=text("error IS NOT NULL"),
+        ),
+        Index(
+            "ix_dbresources_run_number_error_category",
+            "run_number",
+            "error_category",
+            postgresql_where=text("error_category IS NOT NULL"),
+            sqlite_where=text("error_category IS NOT NULL"),
+        ),
+    )
     """
 
     run_number: Mapped[int] = mapped_column(
         ForeignKey("dbruns.run_number"), primary_key=True
     )
-    id: Mapped[str] = mapped_column(primary_key=True)
+    id: Mapped[uuid_str] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(nullable=False)
-    dataset_id: Mapped[str] = mapped_column(
+    dataset_id: Mapped[uuid_str] = mapped_column(
         ForeignKey("dbinfodatasets.id"), nullable=False
     )
     url: Mapped[str] = mapped_column(nullable=False)
@@ -55,12 +79,39 @@ class DBResource(Base):
     )  # this field and above are CKAN fields
     latest_of_modifieds: Mapped[datetime] = mapped_column(nullable=False)
     what_updated: Mapped[str] = mapped_column(nullable=False)
+    what_updated_flags: Mapped[int] = mapped_column(nullable=True)
     http_last_modified: Mapped[datetime] = mapped_column(default=None, nullable=True)
-    md5_hash: Mapped[str] = mapped_column(default=None, nullable=True)
+    md5_hash: Mapped[hash_str] = mapped_column(default=None, nullable=True)
     hash_last_modified: Mapped[datetime] = mapped_column(default=None, nullable=True)
     when_checked: Mapped[datetime] = mapped_column(default=None, nullable=True)
     api: Mapped[bool] = mapped_column(nullable=True)
     error: Mapped[str] = mapped_column(nullable=True)
+    error_category: Mapped[str] = mapped_column(nullable=True)
+    error_status: Mapped[int] = mapped_column(nullable=True)
+    error_raised: Mapped[str] = mapped_column(nullable=True)
+
+    __table_args__ = (
+        # repeat hash lookups of a resource's earlier hashes
+        Index("ix_dbresources_id_md5_hash", "id", "md5_hash"),
+        # joins of a run's resources to their datasets
+        Index("ix_dbresources_run_number_dataset_id", "run_number", "dataset_id"),
+        # broken resources of a run
+        Index(
+            "ix_dbresources_run_number_when_checked_error",
+            "run_number",
+            "when_checked",
+            postgresql_where=text("error IS NOT NULL"),
+            sqlite_where=text("error IS NOT NULL"),
+        ),
+        # broken resources of a run by error category
+        Index(
+            "ix_dbresources_run_number_error_category",
+            "run_number",
+            "error_category",
+            postgresql_where=text("error_category IS NOT NULL"),
+            sqlite_where=text("error_category IS NOT NULL"),
+        ),
+    )
 
     def __repr__(self) -> str:
         """String representation of DBResource row
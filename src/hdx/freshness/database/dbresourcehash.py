@@ -0,0 +1,34 @@
+"""SQLAlchemy class representing DBResourceHash row. Holds the runs in which each hash
+of a resource was first and last recorded.
+"""
+
+from sqlalchemy.orm import Mapped, mapped_column
+
+from . import Base
+from .compacttypes import hash_str, uuid_str
+
+
+class DBResourceHash(Base):
+    """
+    resource_id: Mapped[uuid_str] = mapped_column(primary_key=True)
+    hash: Mapped[hash_str] = mapped_column(primary_key=True)
+    first_seen_run: Mapped[int] = mapped_column(nullable=False)
+    last_seen_run: Mapped[int] = mapped_column(nullable=False)
+    """
+
+    __tablename__ = "dbresourcehashes"
+
+    resource_id: Mapped[uuid_str] = mapped_column(primary_key=True)
+    hash: Mapped[hash_str] = mapped_column(primary_key=True)
+    first_seen_run: Mapped[int] = mapped_column(nullable=False)
+    last_seen_run: Mapped[int] = mapped_column(nullable=False)
+
+    def __repr__(self) -> str:
+        """String representation of DBResourceHash row
+
+        Returns:
+            str: String representation of DBResourceHash row
+        """
+        output = f"<ResourceHash(resource id={self.resource_id}, hash={self.hash}, "
+        output += f"first seen run={self.first_seen_run}, last seen run={self.last_seen_run})>"
+        return output
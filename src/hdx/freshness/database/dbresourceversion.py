@@ -0,0 +1,88 @@
+"""SQLAlchemy class representing DBResourceVersion row. Holds dynamic resource
+metadata that is unchanged over a range of runs.
+"""
+
+from datetime import datetime
+
+from sqlalchemy.orm import Mapped, mapped_column
+
+from . import VersionBase
+from .compacttypes import hash_str, uuid_str
+
+
+class DBResourceVersion(VersionBase):
+    """
+    id: Mapped[uuid_str] = mapped_column(primary_key=True)
+    valid_from_run: Mapped[int] = mapped_column(primary_key=True)
+    valid_to_run: Mapped[int] = mapped_column(
+        nullable=True, index=True
+    )  # None if version is current
+    name: Mapped[str] = mapped_column(nullable=False)
+    dataset_id: Mapped[uuid_str] = mapped_column(nullable=False)
+    url: Mapped[str] = mapped_column(nullable=False)
+    last_modified: Mapped[datetime] = mapped_column(nullable=False)
+    metadata_modified: Mapped[datetime] = mapped_column(
+        default=None, nullable=True
+    )  # this field and above are CKAN fields
+
+    latest_of_modifieds: Mapped[datetime] = mapped_column(nullable=False)
+    what_updated: Mapped[str] = mapped_column(nullable=False)
+    what_updated_flags: Mapped[int] = mapped_column(nullable=True)
+    http_last_modified: Mapped[datetime] = mapped_column(
+        default=None, nullable=True
+    )
+    md5_hash: Mapped[hash_str] = mapped_column(default=None, nullable=True)
+    hash_last_modified: Mapped[datetime] = mapped_column(
+        default=None, nullable=True
+    )
+    when_checked: Mapped[datetime] = mapped_column(default=None, nullable=True)
+    api: Mapped[bool] = mapped_column(nullable=True)
+    error: Mapped[str] = mapped_column(nullable=True)
+    error_category: Mapped[str] = mapped_column(nullable=True)
+    error_status: Mapped[int] = mapped_column(nullable=True)
+    error_raised: Mapped[str] = mapped_column(nullable=True)
+    """
+
+    id: Mapped[uuid_str] = mapped_column(primary_key=True)
+    valid_from_run: Mapped[int] = mapped_column(primary_key=True)
+    valid_to_run: Mapped[int] = mapped_column(
+        nullable=True, index=True
+    )  # None if version is current
+    name: Mapped[str] = mapped_column(nullable=False)
+    dataset_id: Mapped[uuid_str] = mapped_column(nullable=False)
+    url: Mapped[str] = mapped_column(nullable=False)
+    last_modified: Mapped[datetime] = mapped_column(nullable=False)
+    metadata_modified: Mapped[datetime] = mapped_column(
+        default=None, nullable=True
+    )  # this field and above are CKAN fields
+    latest_of_modifieds: Mapped[datetime] = mapped_column(nullable=False)
+    what_updated: Mapped[str] = mapped_column(nullable=False)
+    what_updated_flags: Mapped[int] = mapped_column(nullable=True)
+    http_last_modified: Mapped[datetime] = mapped_column(default=None, nullable=True)
+    md5_hash: Mapped[hash_str] = mapped_column(default=None, nullable=True)
+    hash_last_modified: Mapped[datetime] = mapped_column(default=None, nullable=True)
+    when_checked: Mapped[datetime] = mapped_column(default=None, nullable=True)
+    api: Mapped[bool] = mapped_column(nullable=True)
+    error: Mapped[str] = mapped_column(nullable=True)
+    error_category: Mapped[str] = mapped_column(nullable=True)
+    error_status: Mapped[int] = mapped_column(nullable=True)
+    error_raised: Mapped[str] = mapped_column(nullable=True)
+
+    def __repr__(self) -> str:
+        """String representation of DBResourceVersion row
+
+        Returns:
+            str: String representation of DBResourceVersion row
+        """
+        output = (
+            f"<ResourceVersion(id={self.id}, valid from run={self.valid_from_run}, "
+        )
+        output += f"valid to run={self.valid_to_run}, name={self.name}, "
+        output += f"dataset id={self.dataset_id},\nurl={self.url},\n"
+        output += f"last modified={str(self.last_modified)}, metadata modified={str(self.metadata_modified)},\n"
+        output += f"latest of modifieds={str(self.latest_of_modifieds)}, what updated={str(self.what_updated)},\n"
+        output += f"http last modified={str(self.http_last_modified)},\n"
+        output += f"MD5 hash={self.md5_hash}, hash last modified={str(self.hash_last_modified)}, "
+        output += f"when checked={str(self.when_checked)},\n"
+        output += f"api={str(self.api)}, error={str(self.error)})>"
+        return output
@@ -0,0 +1,32 @@
+"""SQLAlchemy class representing DBWhatUpdatedCount row. Holds the number of datasets
+or resources with each what updated category in each run.
+"""
+
+from sqlalchemy.orm import Mapped, mapped_column
+
+from . import Base
+
+
+class DBWhatUpdatedCount(Base):
+    """
+    run_number: Mapped[int] = mapped_column(primary_key=True)
+    object_type: Mapped[str] = mapped_column(primary_key=True)
+    category: Mapped[str] = mapped_column(primary_key=True)
+    count: Mapped[int] = mapped_column(nullable=False)
+    """
+
+    run_number: Mapped[int] = mapped_column(primary_key=True)
+    object_type: Mapped[str] = mapped_column(primary_key=True)
+    category: Mapped[str] = mapped_column(primary_key=True)
+    count: Mapped[int] = mapped_column(nullable=False)
+
+    def __repr__(self) -> str:
+        """String representation of DBWhatUpdatedCount row
+
+        Returns:
+            str: String representation of DBWhatUpdatedCount row
+        """
+        output = f"<WhatUpdatedCount(run number={self.run_number}, "
+        output += f"object type={self.object_type}, category={self.category}, "
+        output += f"count={self.count})>"
+        return output
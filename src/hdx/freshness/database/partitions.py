@@ -0,0 +1,127 @@
+"""Optional Postgres range partitioning of the dbdatasets and dbresources tables by
+run number. Partitioned tables are only created in new Postgres databases when
+partition_tables is passed as the prepare function of the database. SQLite and
+existing databases stay on plain tables and the functions below do nothing for them.
+"""
+
+import logging
+import re
+from typing import List, Tuple, Union
+
+from sqlalchemy import Connection, Table, text
+from sqlalchemy.orm import Session
+
+from .dbdataset import DBDataset
+from .dbresource import DBResource
+
+logger = logging.getLogger(__name__)
+
+run_tables = (DBDataset.__table__, DBResource.__table__)
+bound_regex = re.compile(r"FROM \((\d+)\) TO \((\d+)\)")
+
+
+def partition_tables() -> None:
+    """Declare the dbdatasets and dbresources tables as partitioned by ranges of run
+    number. Must be run before Base.metadata.create_all. Only Postgres uses this.
+
+    Returns:
+        None
+    """
+    for table in run_tables:
+        table.dialect_options["postgresql"]["partition_by"] = "RANGE (run_number)"
+
+
+def get_partitioned_tables(session: Union[Session, Connection]) -> List[Table]:
+    """Get the tables among dbdatasets and dbresources that are partitioned in the
+    database
+
+    Args:
+        session (Union[Session, Connection]): Session or connection to use for queries
+
+    Returns:
+        List[Table]: Partitioned tables
+    """
+    if isinstance(session, Session):
+        dialect = session.get_bind().dialect
+    else:
+        dialect = session.dialect
+    if dialect.name != "postgresql":
+        return []
+    names = session.scalars(
+        text(
+            "SELECT c.relname FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid"
+        )
+    ).all()
+    return [x for x in run_tables if x.name in names]
+
+
+def get_partitions(session: Session, table: Table) -> List[Tuple[str, int, int]]:
+    """Get the partitions of a partitioned table
+
+    Args:
+        session (sqlalchemy.orm.Session): Session to use for queries
+        table (Table): Partitioned table
+
+    Returns:
+        List[Tuple[str, int, int]]: List of (partition name, first run, end run)
+    """
+    rows = session.execute(
+        text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :name"
+        ),
+        {"name": table.name},
+    ).all()
+    partitions = []
+    for name, bound in rows:
+        match = bound_regex.search(bound)
+        if match is None:
+            continue
+        partitions.append((name, int(match.group(1)), int(match.group(2))))
+    return sorted(partitions, key=lambda x: x[1])
+
+
+def get_partition_range(run_number: int, partition_size: int) -> Tuple[int, int]:
+    """Get the range of runs of the partition that holds a run. The end run is not
+    included in the range.
+
+    Args:
+        run_number (int): Run number
+        partition_size (int): Number of runs per partition
+
+    Returns:
+        Tuple[int, int]: (first run, end run)
+    """
+    start = run_number // partition_size * partition_size
+    return start, start + partition_size
+
+
+def create_run_partitions(
+    session: Session, run_number: int, partition_size: int
+) -> None:
+    """Create the partitions that will hold a run's rows in the partitioned tables
+    if they do not exist already
+
+    Args:
+        session (sqlalchemy.orm.Session): Session to use for queries
+        run_number (int): Run number
+        partition_size (int): Number of runs per partition
+
+    Returns:
+        None
+    """
+    for table in get_partitioned_tables(session):
+        partitions = get_partitions(session, table)
+        if any(start <= run_number < end for _, start, end in partitions):
+            continue
+        start, end = get_partition_range(run_number, partition_size)
+        name = f"{table.name}_{start}"
+        logger.info(f"Creating partition {name} for runs {start} to {end - 1}")
+        session.execute(
+            text(
+                f"CREATE TABLE {name} PARTITION OF {table.name} "
+                f"FOR VALUES FROM ({start}) TO ({end})"
+            )
+        )
@@ -0,0 +1,66 @@
+"""Views presenting dataset and resource rows for every run in the same shape as the
+dbdatasets and dbresources tables, whether the run's rows are still in those tables
+or have been folded into versions.
+"""
+
+from typing import Type
+
+from sqlalchemy import and_, or_, select, union_all
+from sqlalchemy.sql import CompoundSelect
+
+from . import Base, VersionBase
+from .dbdataset import DBDataset
+from .dbdatasetversion import DBDatasetVersion
+from .dbfoldedrun import DBFoldedRun
+from .dbresource import DBResource
+from .dbresourceversion import DBResourceVersion
+from hdx.database import Database
+
+
+def get_run_selectable(
+    model: Type[Base], version_model: Type[VersionBase]
+) -> CompoundSelect:
+    """Get a select of the rows of every run, taking each folded run's rows from the
+    versions valid for that run and the rows of other runs from the per-run table
+
+    Args:
+        model (Type[Base]): Per-run table class eg. DBDataset
+        version_model (Type[VersionBase]): Version table class eg. DBDatasetVersion
+
+    Returns:
+        CompoundSelect: Select of rows of every run
+    """
+    table = model.__table__
+    version_table = version_model.__table__
+    columns = [
+        DBFoldedRun.run_number if x.name == "run_number" else version_table.c[x.name]
+        for x in table.columns
+    ]
+    folded = select(*columns).join_from(
+        version_table,
+        DBFoldedRun,
+        and_(
+            DBFoldedRun.run_number >= version_table.c.valid_from_run,
+            or_(
+                version_table.c.valid_to_run.is_(None),
+                DBFoldedRun.run_number <= version_table.c.valid_to_run,
+            ),
+        ),
+    )
+    return union_all(folded, select(table))
+
+
+dbdatasetruns = Database.prepare_view(
+    {
+        "name": "dbdatasetruns",
+        "metadata": VersionBase.metadata,
+        "selectable": get_run_selectable(DBDataset, DBDatasetVersion),
+    }
+)
+dbresourceruns = Database.prepare_view(
+    {
+        "name": "dbresourceruns",
+        "metadata": VersionBase.metadata,
+        "selectable": get_run_selectable(DBResource, DBResourceVersion),
+    }
+)
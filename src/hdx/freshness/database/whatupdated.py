@@ -0,0 +1,78 @@
+"""Flags for the causes of updates of datasets and resources. They are stored in the
+what_updated_flags column, while the what_updated column holds the equivalent text
+for display.
+"""
+
+from enum import IntFlag
+
+
+class WhatUpdated(IntFlag):
+    """Set of causes of an update. The values are stored in the database so must
+    not be changed. NOTHING (no flags) is rendered as "nothing" and INTERNAL is
+    rendered as the prefix "internal-" on the other causes.
+    """
+
+    NOTHING = 0
+    FIRSTRUN = 1
+    NO_RESOURCES = 2
+    FILESTORE = 4
+    REVIEW_DATE = 8
+    SCRIPT_UPDATE = 16
+    HTTP_HEADER = 32
+    SAME_HASH = 64
+    API = 128
+    FIRST_HASH = 256
+    REPEAT_HASH = 512
+    HASH = 1024
+    ERROR = 2048
+    INTERNAL = 4096
+
+    def render(self) -> str:
+        """Get the text of the causes in the order they are determined
+
+        Returns:
+            str: Text eg. internal-firstrun,hash
+        """
+        labels = [label for flag, label in flag_labels if flag in self]
+        what_updated = ",".join(labels) if labels else "nothing"
+        if WhatUpdated.INTERNAL in self:
+            return f"internal-{what_updated}"
+        return what_updated
+
+    @classmethod
+    def parse(cls, what_updated: str) -> "WhatUpdated":
+        """Get the flags from text as stored in the what_updated column. Unknown
+        causes are ignored.
+
+        Args:
+            what_updated (str): Text eg. internal-firstrun,hash
+
+        Returns:
+            WhatUpdated: Flags
+        """
+        flags = cls.NOTHING
+        if what_updated.startswith("internal-"):
+            flags |= cls.INTERNAL
+            what_updated = what_updated[9:]
+        for label in what_updated.split(","):
+            flag = label_flags.get(label)
+            if flag is not None:
+                flags |= flag
+        return flags
+
+
+flag_labels = (
+    (WhatUpdated.FIRSTRUN, "firstrun"),
+    (WhatUpdated.NO_RESOURCES, "no resources"),
+    (WhatUpdated.FILESTORE, "filestore"),
+    (WhatUpdated.REVIEW_DATE, "review date"),
+    (WhatUpdated.SCRIPT_UPDATE, "script update"),
+    (WhatUpdated.HTTP_HEADER, "http header"),
+    (WhatUpdated.SAME_HASH, "same hash"),
+    (WhatUpdated.API, "api"),
+    (WhatUpdated.FIRST_HASH, "first hash"),
+    (WhatUpdated.REPEAT_HASH, "repeat hash"),
+    (WhatUpdated.HASH, "hash"),
+    (WhatUpdated.ERROR, "error"),
+)
+label_flags = {label: flag for flag, label in flag_labels}
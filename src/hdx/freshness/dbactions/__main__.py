@@ -2,27 +2,63 @@
 
 import argparse
 import logging
+import re
 from os import getenv
-from typing import Optional
+from typing import Optional, Tuple
 
 from .. import __version__
+from ..app.freshnessengine import FreshnessEngine
 from ..database import Base
+from ..database.compacttypes import set_compact_types
 from .dbclean import DBClean
 from .dbclone import DBClone
+from .dbfold import DBFold
+from .dbmigrate import DBMigrate
+from .dbrefresh import DBRefresh
 from hdx.database import Database
 from hdx.database.dburi import get_params_from_connection_uri
 from hdx.utilities.dateparse import now_utc
 from hdx.utilities.dictandlist import args_to_dict
 from hdx.utilities.easy_logging import setup_logging
+from hdx.utilities.loader import load_yaml
+from hdx.utilities.path import script_dir_plus_file
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
 
+def get_run_range(runs: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """Get start and end run numbers from a run number or range of runs eg. 100,
+    100-200, 100- or -200
+
+    Args:
+        runs (Optional[str]): Run number or range of runs
+
+    Returns:
+        Tuple[Optional[int], Optional[int]]: (start run, end run)
+    """
+    if not runs:
+        return None, None
+    match = re.fullmatch(r"([0-9]*)(-?)([0-9]*)", runs)
+    if not match or not (match.group(1) or match.group(3)):
+        raise ValueError(
+            f"Invalid runs {runs}! Use a run number or a range eg. 100-200, 100- or -200."
+        )
+    start_run, separator, end_run = match.groups()
+    start_run = int(start_run) if start_run else None
+    end_run = int(end_run) if end_run else None
+    if not separator:
+        end_run = start_run
+    return start_run, end_run
+
+
 def main(
     db_uri: Optional[str] = None,
     db_params: Optional[str] = None,
     action: str = "clean",
+    runs: Optional[str] = None,
+    dry_run: bool = False,
+    compact_types: bool = False,
 ) -> None:
     """Run freshness database cleaner. Either a database connection string
     (db_uri) or database connection parameters (db_params) can be supplied. If
@@ -32,7 +68,10 @@ def main(
     Args:
         db_uri (Optional[str]): Database connection URI. Defaults to None.
         db_params (Optional[str]): Database connection parameters. Defaults to None.
-        action (bool): What action to take. "clone" to copy prod db for testing. Default is clean.
+        action (bool): What action to take. "clone" to copy prod db for testing. "fold" to fold older runs into versions. "migrate" to apply schema migrations. "refresh" to recompute freshness of past runs. Default is clean.
+        runs (Optional[str]): Run or range of runs to refresh eg. 100-200. Defaults to None (all).
+        dry_run (bool): Whether to only report what refresh would change. Defaults to False.
+        compact_types (bool): Whether ids and hashes are stored compactly in Postgres. Defaults to False.
 
     Returns:
         None
@@ -46,7 +85,9 @@ def main(
     else:
         params = {"dialect": "sqlite", "database": "freshness.db"}
     logger.info(f"> Database parameters: {params}")
-    with Database(**params, table_base=Base) as session:
+    set_compact_types(compact_types)
+    with Database(**params, table_base=Base) as database:
+        session = database.get_session()
         now = now_utc()
         if action == "clean":
             cleaner = DBClean(session)
@@ -56,6 +97,23 @@ def main(
             cloner = DBClone(session)
             cloner.run()
             logger.info("Freshness database clone completed!")
+        elif action == "fold":
+            dbfold = DBFold(session)
+            dbfold.run()
+            logger.info("Freshness database fold completed!")
+        elif action == "migrate":
+            migrator = DBMigrate(session, compact_types=compact_types)
+            migrator.run()
+            logger.info("Freshness database migration completed!")
+        elif action == "refresh":
+            project_config_yaml = script_dir_plus_file(
+                "project_configuration.yaml", FreshnessEngine
+            )
+            aging = load_yaml(project_config_yaml)["aging"]
+            start_run, end_run = get_run_range(runs)
+            refresher = DBRefresh(session, aging, dry_run=dry_run)
+            refresher.run(start_run, end_run)
+            logger.info("Freshness database refresh completed!")
 
 
 if __name__ == "__main__":
@@ -75,7 +133,31 @@ if __name__ == "__main__":
         default="clean",
         help="Action to perform.",
     )
+    parser.add_argument(
+        "-r",
+        "--runs",
+        default=None,
+        help="Run or range of runs for refresh eg. 100, 100-200, 100- or -200",
+    )
+    parser.add_argument(
+        "-dr",
+        "--dry_run",
+        default=False,
+        action="store_true",
+        help="Only report what refresh would change",
+    )
+    parser.add_argument(
+        "-ct",
+        "--compact_types",
+        default=False,
+        action="store_true",
+        help="Ids and hashes are stored compactly in Postgres. With migrate, convert to them.",
+    )
     args = parser.parse_args()
+    try:
+        get_run_range(args.runs)
+    except ValueError as ex:
+        parser.error(str(ex))
     db_uri = args.db_uri
     if db_uri is None:
         db_uri = getenv("DB_URI")
@@ -85,4 +167,7 @@ if __name__ == "__main__":
         db_uri=db_uri,
         db_params=args.db_params,
         action=args.action,
+        runs=args.runs,
+        dry_run=args.dry_run,
+        compact_types=args.compact_types,
     )
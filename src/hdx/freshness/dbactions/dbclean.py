@@ -4,11 +4,15 @@ from datetime import timedelta
 
 from dateutil.relativedelta import relativedelta
 from dateutil.rrule import MONTHLY, WE, WEEKLY, rrule
-from sqlalchemy import delete, select
+from sqlalchemy import and_, delete, desc, exists, inspect, or_, select, text
 
 from ..database.dbdataset import DBDataset
+from ..database.dbdatasetversion import DBDatasetVersion
+from ..database.dbfoldedrun import DBFoldedRun
 from ..database.dbresource import DBResource
+from ..database.dbresourceversion import DBResourceVersion
 from ..database.dbrun import DBRun
+from ..database.partitions import get_partitioned_tables, get_partitions
 from hdx.utilities.dictandlist import write_list_to_csv
 
 logger = logging.getLogger(__name__)
@@ -20,6 +24,28 @@ class DBClean:
     # quarter.
     def __init__(self, session):
         self.session = session
+        # whether runs have been folded into versions by DBFold
+        self.folded = inspect(session.get_bind()).has_table(DBFoldedRun.__tablename__)
+
+    @staticmethod
+    def version_covers_run(version_model):
+        return and_(
+            DBFoldedRun.run_number >= version_model.valid_from_run,
+            or_(
+                version_model.valid_to_run.is_(None),
+                DBFoldedRun.run_number <= version_model.valid_to_run,
+            ),
+        )
+
+    def get_run_numbers(self, model, version_model):
+        query = select(model.run_number).distinct()
+        if self.folded:
+            query = query.union(
+                select(DBFoldedRun.run_number).where(
+                    exists().where(self.version_covers_run(version_model))
+                )
+            )
+        return self.session.scalars(query.order_by(desc("run_number"))).all()
 
     def get_runs(self):
         return self.session.scalars(
@@ -27,18 +53,29 @@ class DBClean:
         ).all()
 
     def get_dataset_runs(self):
-        return self.session.scalars(
-            select(DBDataset.run_number)
-            .distinct()
-            .order_by(DBDataset.run_number.desc())
-        ).all()
+        return self.get_run_numbers(DBDataset, DBDatasetVersion)
 
     def get_resource_runs(self):
-        return self.session.scalars(
-            select(DBResource.run_number)
-            .distinct()
-            .order_by(DBResource.run_number.desc())
-        ).all()
+        return self.get_run_numbers(DBResource, DBResourceVersion)
+
+    def delete_unused_versions(self):
+        for version_model in (DBDatasetVersion, DBResourceVersion):
+            self.session.execute(
+                delete(version_model).where(
+                    ~exists().where(self.version_covers_run(version_model))
+                )
+            )
+        self.session.commit()
+
+    def drop_partitions(self, runs_to_keep):
+        # Drop whole partitions of runs when none of their runs are kept
+        for table in get_partitioned_tables(self.session):
+            for name, start, end in get_partitions(self.session, table):
+                if any(start <= run_no < end for run_no in runs_to_keep):
+                    continue
+                logger.info(f"Dropping partition {name} for runs {start} to {end - 1}")
+                self.session.execute(text(f"DROP TABLE {name}"))
+        self.session.commit()
 
     def run(
         self,
@@ -162,6 +199,7 @@ class DBClean:
             rows.append(row)
         write_list_to_csv(filepath, rows, headers=("Run Number", "Run Date", "Delete"))
 
+        self.drop_partitions(runs_to_keep)
         for run_number, run_date in run_number_to_run_date.items():
             if run_number not in runs_to_keep:
                 self.session.execute(
@@ -170,8 +208,14 @@ class DBClean:
                 self.session.execute(
                     delete(DBDataset).where(DBDataset.run_number == run_number)
                 )
+                if self.folded:
+                    self.session.execute(
+                        delete(DBFoldedRun).where(DBFoldedRun.run_number == run_number)
+                    )
                 self.session.execute(
                     delete(DBRun).where(DBRun.run_number == run_number)
                 )
                 self.session.commit()
+        if self.folded:
+            self.delete_unused_versions()
         return True
@@ -0,0 +1,95 @@
+import logging
+
+from sqlalchemy import delete, exists, insert, literal, select, update
+
+from ..database import VersionBase
+from ..database.dbdataset import DBDataset
+from ..database.dbdatasetversion import DBDatasetVersion
+from ..database.dbfoldedrun import DBFoldedRun
+from ..database.dbresource import DBResource
+from ..database.dbresourceversion import DBResourceVersion
+from ..database.dbrun import DBRun
+from ..database.runviews import dbdatasetruns, dbresourceruns  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+
+class DBFold:
+    # Fold the dataset and resource rows of all but the latest runs into versions
+    # that are valid over a range of runs, so that a new row is only stored when a
+    # dataset or resource changes. The latest runs stay in dbdatasets and
+    # dbresources as they are needed by the next freshness run and the emailer.
+    # The dbdatasetruns and dbresourceruns views give the rows of every run in the
+    # same shape as those tables.
+    def __init__(self, session, keep_runs=2):
+        self.session = session
+        self.keep_runs = keep_runs
+        VersionBase.metadata.create_all(session.get_bind())
+
+    def get_last_folded_run(self):
+        return self.session.scalar(
+            select(DBFoldedRun.run_number)
+            .order_by(DBFoldedRun.run_number.desc())
+            .limit(1)
+        )
+
+    def get_runs_to_fold(self):
+        run_numbers = self.session.scalars(
+            select(DBRun.run_number).order_by(DBRun.run_number.desc())
+        ).all()
+        if len(run_numbers) <= self.keep_runs:
+            return []
+        newest_to_fold = run_numbers[self.keep_runs]
+        query = (
+            select(DBDataset.run_number)
+            .where(DBDataset.run_number <= newest_to_fold)
+            .union(
+                select(DBResource.run_number).where(
+                    DBResource.run_number <= newest_to_fold
+                )
+            )
+            .order_by("run_number")
+        )
+        return self.session.scalars(query).all()
+
+    def fold_table(self, model, version_model, run_number, last_folded_run):
+        table = model.__table__
+        version_table = version_model.__table__
+        columns = [x.name for x in table.columns if x.name != "run_number"]
+        open_version = version_table.c.valid_to_run.is_(None)
+        if last_folded_run is not None:
+            unchanged = exists().where(
+                table.c.run_number == run_number,
+                *(version_table.c[x].is_not_distinct_from(table.c[x]) for x in columns),
+            )
+            self.session.execute(
+                update(version_table)
+                .where(open_version, ~unchanged)
+                .values(valid_to_run=last_folded_run)
+            )
+        changed = select(literal(run_number), *(table.c[x] for x in columns)).where(
+            table.c.run_number == run_number,
+            ~exists().where(version_table.c.id == table.c.id, open_version),
+        )
+        self.session.execute(
+            insert(version_table).from_select(["valid_from_run", *columns], changed)
+        )
+        self.session.execute(delete(table).where(table.c.run_number == run_number))
+
+    def run(self):
+        last_folded_run = self.get_last_folded_run()
+        run_numbers = self.get_runs_to_fold()
+        for run_number in run_numbers:
+            if last_folded_run is not None and run_number <= last_folded_run:
+                logger.error(
+                    f"Run number {run_number} is not after last folded run {last_folded_run}!"
+                )
+                return False
+            logger.info(f"Folding run {run_number}")
+            self.fold_table(DBDataset, DBDatasetVersion, run_number, last_folded_run)
+            self.fold_table(DBResource, DBResourceVersion, run_number, last_folded_run)
+            self.session.add(DBFoldedRun(run_number=run_number))
+            self.session.commit()
+            last_folded_run = run_number
+        logger.info(f"Folded {len(run_numbers)} runs")
+        return True
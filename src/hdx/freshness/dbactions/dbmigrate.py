@@ -0,0 +1,312 @@
+import logging
+
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    case,
+    inspect,
+    select,
+    text,
+    update,
+)
+
+from ..database.compacttypes import CompactType, HashBytes, UUIDString
+from ..database.dbdataset import DBDataset
+from ..database.dbdatasetversion import DBDatasetVersion
+from ..database.dbinfodataset import DBInfoDataset
+from ..database.dborganization import DBOrganization
+from ..database.dbresource import DBResource
+from ..database.dbresourcehash import DBResourceHash
+from ..database.dbresourceversion import DBResourceVersion
+from ..database.partitions import get_partitioned_tables
+from ..database.runviews import dbdatasetruns, dbresourceruns, get_run_selectable
+from ..database.whatupdated import WhatUpdated
+from ..utils.retrieval import Retrieval
+from hdx.database.no_timezone import ConversionNoTZ
+from hdx.database.views import CreateView, DropView
+from hdx.utilities.dateparse import now_utc
+from hdx.utilities.dictandlist import dict_of_lists_add
+
+logger = logging.getLogger(__name__)
+
+dbmigrations = Table(
+    "dbmigrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied", ConversionNoTZ, nullable=False),
+)
+
+# Tables with id or hash columns that can be stored compactly in Postgres
+compact_models = (
+    DBOrganization,
+    DBInfoDataset,
+    DBDataset,
+    DBResource,
+    DBResourceHash,
+    DBDatasetVersion,
+    DBResourceVersion,
+)
+
+
+def create_indexes(connection, names):
+    # Create the named indexes declared on the run tables if they do not exist.
+    # On Postgres, they are built concurrently so that the tables are not locked
+    # against writes while the indexes are built. That is not possible for
+    # partitioned tables, but those are only in new databases which already
+    # have the indexes.
+    partitioned = {x.name for x in get_partitioned_tables(connection)}
+    for table in (DBDataset.__table__, DBResource.__table__):
+        concurrently = (
+            connection.dialect.name == "postgresql" and table.name not in partitioned
+        )
+        for index in sorted(table.indexes, key=lambda x: x.name):
+            if index.name not in names:
+                continue
+            logger.info(f"Creating index {index.name}")
+            options = index.dialect_options["postgresql"]
+            options["concurrently"] = concurrently
+            try:
+                index.create(connection, checkfirst=True)
+            finally:
+                options["concurrently"] = False
+
+
+def add_run_table_indexes(connection):
+    create_indexes(
+        connection,
+        (
+            "ix_dbdatasets_run_number_fresh",
+            "ix_dbresources_id_md5_hash",
+            "ix_dbresources_run_number_dataset_id",
+            "ix_dbresources_run_number_when_checked_error",
+        ),
+    )
+
+
+def add_columns(connection, models, names):
+    # Add the named columns declared on the models to their tables where the
+    # tables exist but the columns do not. Returns the tables that exist.
+    inspector = inspect(connection)
+    tables = []
+    for model in models:
+        table = model.__table__
+        if not inspector.has_table(table.name):
+            continue
+        existing = {x["name"] for x in inspector.get_columns(table.name)}
+        for name in names:
+            if name in existing:
+                continue
+            logger.info(f"Adding column {name} to {table.name}")
+            column_type = table.c[name].type.compile(connection.dialect)
+            connection.execute(
+                text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}")
+            )
+        tables.append(table)
+    return tables
+
+
+run_views = (
+    (dbdatasetruns, DBDataset, DBDatasetVersion),
+    (dbresourceruns, DBResource, DBResourceVersion),
+)
+
+
+def drop_run_views(connection):
+    # Drop the run views that exist, returning them so they can be recreated
+    view_names = inspect(connection).get_view_names()
+    dropped = []
+    for view, model, version_model in run_views:
+        if view.name not in view_names:
+            continue
+        logger.info(f"Dropping view {view.name}")
+        connection.execute(DropView(view.name))
+        dropped.append((view, model, version_model))
+    return dropped
+
+
+def create_run_views(connection, views):
+    for view, model, version_model in views:
+        logger.info(f"Creating view {view.name}")
+        connection.execute(
+            CreateView(view.name, get_run_selectable(model, version_model))
+        )
+
+
+def recreate_run_views(connection):
+    # Views list the columns of their tables when they are created, so the run
+    # views must be recreated after columns are added to the run tables
+    create_run_views(connection, drop_run_views(connection))
+
+
+def add_what_updated_flags(connection):
+    # Add the what_updated_flags column to the run tables and any version tables
+    # and fill it from the what_updated text of existing rows, mapping each
+    # distinct text to its flags in one update per table
+    models = (DBDataset, DBResource, DBDatasetVersion, DBResourceVersion)
+    for table in add_columns(connection, models, ("what_updated_flags",)):
+        column = table.c.what_updated_flags
+        texts = connection.scalars(
+            select(table.c.what_updated).distinct().where(column.is_(None))
+        ).all()
+        if not texts:
+            continue
+        logger.info(f"Filling {column.name} of {table.name}")
+        flags = {x: int(WhatUpdated.parse(x)) for x in texts}
+        connection.execute(
+            update(table)
+            .where(column.is_(None))
+            .values({column.name: case(flags, value=table.c.what_updated)})
+        )
+    create_indexes(connection, ("ix_dbdatasets_run_number_what_updated_flags",))
+    recreate_run_views(connection)
+
+
+def add_error_codes(connection):
+    # Add the error code columns to the resource tables and fill them from the
+    # error messages of existing rows, updating the rows of the distinct messages
+    # with each error code together
+    names = ("error_category", "error_status", "error_raised")
+    for table in add_columns(connection, (DBResource, DBResourceVersion), names):
+        unfilled = (table.c.error.is_not(None), table.c.error_category.is_(None))
+        errors = connection.scalars(
+            select(table.c.error).distinct().where(*unfilled)
+        ).all()
+        if not errors:
+            continue
+        logger.info(f"Filling error codes of {table.name}")
+        error_codes = {}
+        for error in errors:
+            dict_of_lists_add(error_codes, Retrieval.get_error_code(error), error)
+        for (category, status, raised), messages in error_codes.items():
+            for start in range(0, len(messages), 1000):
+                connection.execute(
+                    update(table)
+                    .where(*unfilled, table.c.error.in_(messages[start : start + 1000]))
+                    .values(
+                        error_category=category,
+                        error_status=status,
+                        error_raised=raised,
+                    )
+                )
+    create_indexes(connection, ("ix_dbresources_run_number_error_category",))
+    recreate_run_views(connection)
+
+
+def get_compact_conversions(connection):
+    # Get the clauses that convert each existing table's id and hash columns that
+    # are still strings to the compact types
+    inspector = inspect(connection)
+    conversions = {}
+    for model in compact_models:
+        table = model.__table__
+        if not inspector.has_table(table.name):
+            continue
+        types = {x["name"]: x["type"] for x in inspector.get_columns(table.name)}
+        clauses = []
+        for column in table.columns:
+            if not isinstance(types.get(column.name), String):
+                continue
+            name = column.name
+            if isinstance(column.type, UUIDString):
+                clauses.append(f"ALTER COLUMN {name} TYPE uuid USING {name}::uuid")
+            elif isinstance(column.type, HashBytes):
+                clauses.append(
+                    f"ALTER COLUMN {name} TYPE bytea USING decode({name}, 'hex')"
+                )
+        if clauses:
+            conversions[table.name] = clauses
+    return conversions
+
+
+def convert_compact_types(connection):
+    # Convert the id columns of existing tables to uuid and the hash columns to
+    # bytea in one transaction. The run views and the foreign keys between id
+    # columns depend on the column types so they are dropped first and
+    # recreated afterwards. The tables are locked while they are rewritten.
+    with connection.engine.begin() as transaction:
+        conversions = get_compact_conversions(transaction)
+        if not conversions:
+            return
+        views = drop_run_views(transaction)
+        inspector = inspect(transaction)
+        foreign_keys = []
+        for model in compact_models:
+            table = model.__table__
+            if not inspector.has_table(table.name):
+                continue
+            for foreign_key in inspector.get_foreign_keys(table.name):
+                columns = foreign_key["constrained_columns"]
+                if any(isinstance(table.c[x].type, CompactType) for x in columns):
+                    foreign_keys.append((table.name, foreign_key))
+        for table_name, foreign_key in foreign_keys:
+            transaction.execute(
+                text(f"ALTER TABLE {table_name} DROP CONSTRAINT {foreign_key['name']}")
+            )
+        for table_name, clauses in conversions.items():
+            logger.info(f"Converting ids and hashes of {table_name}")
+            transaction.execute(text(f"ALTER TABLE {table_name} {', '.join(clauses)}"))
+        for table_name, foreign_key in foreign_keys:
+            columns = ", ".join(foreign_key["constrained_columns"])
+            referred_columns = ", ".join(foreign_key["referred_columns"])
+            transaction.execute(
+                text(
+                    f"ALTER TABLE {table_name} ADD CONSTRAINT {foreign_key['name']} "
+                    f"FOREIGN KEY ({columns}) REFERENCES "
+                    f"{foreign_key['referred_table']} ({referred_columns})"
+                )
+            )
+        create_run_views(transaction, views)
+
+
+class DBMigrate:
+    # Apply schema changes to existing databases. Each migration has a version
+    # number and is applied once, in order, with applied versions recorded in the
+    # dbmigrations table. Migrations run outside of a transaction so that they
+    # can change the schema online. Compact migrations are opt-in and only apply
+    # to Postgres.
+    migrations = (
+        (1, "Add indexes to run tables", add_run_table_indexes),
+        (2, "Add what updated flags to run tables", add_what_updated_flags),
+        (3, "Add error codes to resource tables", add_error_codes),
+    )
+    compact_migrations = (
+        (4, "Convert ids and hashes to compact types", convert_compact_types),
+    )
+
+    def __init__(self, session, compact_types=False):
+        self.session = session
+        self.compact_types = compact_types
+
+    def get_migrations(self, dialect):
+        if not self.compact_types:
+            return self.migrations
+        if dialect.name != "postgresql":
+            logger.warning("Compact types are only supported for Postgres!")
+            return self.migrations
+        return self.migrations + self.compact_migrations
+
+    def get_applied_versions(self, connection):
+        return set(connection.scalars(select(dbmigrations.c.version)).all())
+
+    def run(self):
+        engine = self.session.get_bind()
+        with engine.connect().execution_options(
+            isolation_level="AUTOCOMMIT"
+        ) as connection:
+            dbmigrations.create(connection, checkfirst=True)
+            applied_versions = self.get_applied_versions(connection)
+            for version, name, migration in self.get_migrations(engine.dialect):
+                if version in applied_versions:
+                    continue
+                logger.info(f"Applying migration {version}: {name}")
+                migration(connection)
+                connection.execute(
+                    dbmigrations.insert().values(
+                        version=version, name=name, applied=now_utc()
+                    )
+                )
+        return True
@@ -0,0 +1,103 @@
+import logging
+
+from sqlalchemy import exists, func, select, update
+
+from ..app.freshnessengine import FreshnessEngine
+from ..database.dbdataset import DBDataset
+from ..database.dbrun import DBRun
+
+logger = logging.getLogger(__name__)
+
+
+class DBRefresh:
+    # Recompute the stored freshness of the datasets in past runs, for example
+    # after the aging thresholds in the configuration have changed. Each run's
+    # freshness is calculated as of its run date in SQL and only rows whose
+    # freshness changes are updated, one run at a time. Datasets with no resources
+    # have no freshness and are left alone. Runs that have been folded
+    # into versions are not changed. In a dry run, the changes in freshness status
+    # that would be made are counted but nothing is updated.
+    def __init__(self, session, aging, dry_run=False, progress_runs=100):
+        self.session = session
+        self.engine = FreshnessEngine(aging)
+        self.dry_run = dry_run
+        self.progress_runs = progress_runs
+
+    def get_runs(self, start_run=None, end_run=None):
+        query = select(DBRun.run_number, DBRun.run_date).where(
+            exists().where(DBDataset.run_number == DBRun.run_number)
+        )
+        if start_run is not None:
+            query = query.where(DBRun.run_number >= start_run)
+        if end_run is not None:
+            query = query.where(DBRun.run_number <= end_run)
+        return self.session.execute(query.order_by(DBRun.run_number)).all()
+
+    def get_conditions(self, run_number, fresh):
+        return (
+            DBDataset.run_number == run_number,
+            DBDataset.update_frequency > 0,
+            DBDataset.last_resource_updated != "NO RESOURCES",
+            DBDataset.fresh.is_distinct_from(fresh),
+        )
+
+    def get_transitions(self, run_number, fresh):
+        changes = (
+            select(DBDataset.fresh.label("old"), fresh.label("new"))
+            .where(*self.get_conditions(run_number, fresh))
+            .subquery()
+        )
+        rows = self.session.execute(
+            select(changes.c.old, changes.c.new, func.count()).group_by(
+                changes.c.old, changes.c.new
+            )
+        ).all()
+        return {(old, new): count for old, new, count in rows}
+
+    def refresh_run(self, run_number, run_date):
+        fresh = self.engine.get_case(
+            run_date, DBDataset.latest_of_modifieds, DBDataset.update_frequency
+        )
+        transitions = self.get_transitions(run_number, fresh)
+        if transitions and not self.dry_run:
+            self.session.execute(
+                update(DBDataset)
+                .where(*self.get_conditions(run_number, fresh))
+                .values(fresh=fresh)
+                .execution_options(synchronize_session=False)
+            )
+            self.session.commit()
+        return transitions
+
+    def run(self, start_run=None, end_run=None):
+        runs = self.get_runs(start_run, end_run)
+        if not runs:
+            logger.info("No runs to refresh!")
+            return {}
+        total_transitions = {}
+        changed = 0
+        for i, (run_number, run_date) in enumerate(runs):
+            transitions = self.refresh_run(run_number, run_date)
+            for transition, count in transitions.items():
+                total_transitions[transition] = (
+                    total_transitions.get(transition, 0) + count
+                )
+                changed += count
+            no_runs = i + 1
+            if no_runs % self.progress_runs == 0 or no_runs == len(runs):
+                logger.info(
+                    f"Checked {no_runs}/{len(runs)} runs up to run {run_number}: "
+                    f"{changed} datasets with changed freshness"
+                )
+        if self.dry_run:
+            prefix = "Would change"
+        else:
+            prefix = "Changed"
+        for old, new in sorted(total_transitions, key=lambda x: (str(x[0]), x[1])):
+            count = total_transitions[(old, new)]
+            logger.info(f"{prefix} freshness {old} to {new} for {count} datasets")
+        logger.info(
+            f"{prefix} freshness of {sum(total_transitions.values())} datasets in "
+            f"runs {runs[0].run_number} to {runs[-1].run_number}"
+        )
+        return total_transitions
@@ -7,6 +7,7 @@ from typing import Optional
 
 from ... import __version__
 from ...database import Base
+from ...database.compacttypes import set_compact_types
 from ..utils.databasequeries import DatabaseQueries
 from ..utils.freshnessemail import Email
 from ..utils.hdxhelper import HDXHelper
@@ -100,6 +101,7 @@ def main(
     if sysadmin_emails:
         sysadmin_emails = sysadmin_emails.split(",")
     logger.info(f"> Database parameters: {params}")
+    set_compact_types(configuration.get("compact_types", False))
     with Database(**params, table_base=Base) as database:
         now = now_utc()
         email = Email(
@@ -1,19 +1,22 @@
 """Functions that perform queries of the freshness database"""
 
 import logging
-import re
 from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+from typing import Dict, List, Tuple, Union
 
-from sqlalchemy import func, select
+from sqlalchemy import Table, func, inspect, select
 from sqlalchemy.orm import Session, aliased
+from sqlalchemy.sql import TableClause
 
 from ...database.dbdataset import DBDataset
+from ...database.dbfoldedrun import DBFoldedRun
 from ...database.dbinfodataset import DBInfoDataset
 from ...database.dborganization import DBOrganization
 from ...database.dbresource import DBResource
 from ...database.dbrun import DBRun
+from ...database.runviews import dbdatasetruns
+from ...database.whatupdated import WhatUpdated
 from ...utils.retrieval import Retrieval
 from .hdxhelper import HDXHelper
 
@@ -114,6 +117,8 @@ class DatabaseQueries:
             DBResource.name.label("resource_name"),
             DBResource.dataset_id.label("id"),
             DBResource.error,
+            DBResource.error_category,
+            DBResource.error_raised,
             DBInfoDataset.name,
             DBInfoDataset.title,
             DBInfoDataset.maintainer,
@@ -130,7 +135,8 @@ class DatabaseQueries:
             DBResource.dataset_id == DBDataset.id,
             DBDataset.run_number == self.run_numbers[0][0],
             DBResource.run_number == DBDataset.run_number,
-            DBResource.error.is_not(None),
+            # other errors are mostly temporary server errors so are ignored
+            DBResource.error_category.in_(Retrieval.broken_error_categories),
             DBResource.when_checked > self.run_numbers[1][1],
         ]
         results = self.session.execute(select(*columns).where(*filters))
@@ -140,17 +146,10 @@ class DatabaseQueries:
             for i, column in enumerate(columns):
                 row[column.key] = result[i]
             error = row["error"]
-            if error == Retrieval.toolargeerror:
-                continue
-            if Retrieval.notmatcherror in error:
+            if row["error_category"] == "mismatch":
                 error_msg = self.format_mismatch_msg
             else:
-                match_error = re.search(Retrieval.clienterror_regex, error)
-                if match_error:
-                    error_msg = match_error.group(0)[1:-1]
-                else:
-                    # some sort of Server Error which most of the time is temporary so ignore
-                    continue
+                error_msg = row["error_raised"]
             datasets_error = datasets.get(error_msg, dict())
             datasets[error_msg] = datasets_error
 
@@ -174,6 +173,8 @@ class DatabaseQueries:
             del row["resource_id"]
             del row["resource_name"]
             del row["error"]
+            del row["error_category"]
+            del row["error_raised"]
             dataset.update(row)
 
         logger.info(f"SQL query returned {norows} rows.")
@@ -348,7 +349,7 @@ class DatabaseQueries:
             DBDataset.id == DBInfoDataset.id,
             DBInfoDataset.organization_id == DBOrganization.id,
             DBDataset.run_number == self.run_numbers[0][0],
-            DBDataset.what_updated == "no resources",
+            DBDataset.what_updated_flags == WhatUpdated.NO_RESOURCES,
         ]
         results = self.session.execute(select(*columns).where(*filters))
         norows = 0
@@ -403,6 +404,17 @@ class DatabaseQueries:
         self.datasets_modified_yesterday = datasets
         return datasets
 
+    def get_dataset_runs(self) -> Union[Table, TableClause]:
+        """Get the dataset rows of every run. Once runs have been folded into
+        versions, they are only in the dbdatasetruns view.
+
+        Returns:
+            Union[Table, TableClause]: dbdatasetruns view or dbdatasets table
+        """
+        if inspect(self.session.get_bind()).has_table(DBFoldedRun.__table__.name):
+            return dbdatasetruns
+        return DBDataset.__table__
+
     def get_datasets_time_period(self) -> List[Dict]:
         """Get datasets with a time period that could be due for update
 
@@ -430,34 +442,41 @@ class DatabaseQueries:
             if result.dataset_date == datasets[dataset_id]["dataset_date"]:
                 unchanged_dsdates_datasets.append(dataset_id)
         logger.info(f"SQL query returned {norows} rows.")
-        DBDataset2 = aliased(DBDataset)
+        dataset_runs = self.get_dataset_runs()
+        dataset_runs2 = dataset_runs.alias()
         dsdates_not_changed_within_uf = []
         for dataset_id in unchanged_dsdates_datasets:
             filters = [
-                DBDataset.id == dataset_id,
-                DBDataset2.id == DBDataset.id,
-                DBDataset2.run_number == DBDataset.run_number - 1,
-                DBDataset.dataset_date != DBDataset2.dataset_date,
+                dataset_runs.c.id == dataset_id,
+                dataset_runs2.c.id == dataset_runs.c.id,
+                dataset_runs2.c.run_number == dataset_runs.c.run_number - 1,
+                dataset_runs.c.dataset_date != dataset_runs2.c.dataset_date,
             ]
-            result = self.session.scalar(
-                select(DBDataset.run_number)
+            run_number = self.session.scalar(
+                select(dataset_runs.c.run_number)
                 .where(*filters)
-                .order_by(DBDataset.run_number.desc())
+                .order_by(dataset_runs.c.run_number.desc())
                 .limit(1)
             )
-            delta = self.now - self.run_number_to_run_date[result.run_number]
+            if run_number is None:  # unchanged since first run
+                run_number = min(self.run_number_to_run_date)
+            delta = self.now - self.run_number_to_run_date[run_number]
             if delta > timedelta(days=datasets[dataset_id]["update_frequency"]):
                 dsdates_not_changed_within_uf.append(dataset_id)
         datasets_dataset_date = []
         for dataset_id in dsdates_not_changed_within_uf:
-            columns = [DBDataset.run_number, DBDataset.update_frequency]
+            columns = [dataset_runs.c.run_number, dataset_runs.c.update_frequency]
             filters = [
-                DBDataset.id == dataset_id,
-                DBDataset2.id == DBDataset.id,
-                DBDataset2.run_number == DBDataset.run_number - 1,
-                DBDataset.what_updated != "nothing",
+                dataset_runs.c.id == dataset_id,
+                dataset_runs2.c.id == dataset_runs.c.id,
+                dataset_runs2.c.run_number == dataset_runs.c.run_number - 1,
+                dataset_runs.c.what_updated_flags != WhatUpdated.NOTHING,
             ]
-            results = self.session.execute(select(*columns).where(*filters))
+            results = self.session.execute(
+                select(*columns)
+                .where(*filters)
+                .order_by(dataset_runs.c.run_number.desc())
+            )
             prevdate = self.now
             number_of_updates = 0
             number_of_updates_within_uf = 0
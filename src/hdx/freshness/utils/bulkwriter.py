@@ -0,0 +1,192 @@
+"""Bulk writer that inserts many rows of a table without creating ORM objects"""
+
+import logging
+from typing import Any, Dict, List, Tuple, Type
+
+from sqlalchemy import insert, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import DeclarativeBase, Session
+
+logger = logging.getLogger(__name__)
+
+
+class BulkWriter:
+    """Accumulates plain rows for database tables and writes them in bulk. On
+    Postgres with psycopg, rows are streamed with COPY FROM STDIN. On other
+    databases, rows are inserted with executemany in batches. Rows for tables that
+    persist across runs can instead be staged for upsert, which is done with
+    INSERT ... ON CONFLICT DO UPDATE, only updating rows whose values changed.
+
+    Args:
+        session (sqlalchemy.orm.Session): Session to use for writing
+        batch_size (int): Number of rows per executemany batch. Defaults to 10000.
+    """
+
+    def __init__(self, session: Session, batch_size: int = 10000) -> None:
+        self.session = session
+        self.batch_size = batch_size
+        self.rows: Dict[Type[DeclarativeBase], List[Dict[str, Any]]] = {}
+        self.upserts: Dict[Type[DeclarativeBase], Dict[Tuple, Dict[str, Any]]] = {}
+
+    def add(self, model: Type[DeclarativeBase], row: Dict[str, Any]) -> None:
+        """Add a row to be written to the table of the given model. Columns
+        missing from the row are written as NULL. Tables are written in the order
+        in which their first row was added.
+
+        Args:
+            model (Type[DeclarativeBase]): Model class of table
+            row (Dict[str, Any]): Row to write keyed by column name
+
+        Returns:
+            None
+        """
+        rows = self.rows.get(model)
+        if rows is None:
+            rows = []
+            self.rows[model] = rows
+        rows.append(row)
+
+    def add_upsert(self, model: Type[DeclarativeBase], row: Dict[str, Any]) -> None:
+        """Stage a row to be inserted into the table of the given model or to update
+        the existing row with the same primary key. If the same primary key is staged
+        more than once, the last row wins. Tables are upserted in the order in which
+        their first row was staged and before any rows added with add are written.
+
+        Args:
+            model (Type[DeclarativeBase]): Model class of table
+            row (Dict[str, Any]): Row to upsert keyed by column name
+
+        Returns:
+            None
+        """
+        rows = self.upserts.get(model)
+        if rows is None:
+            rows = {}
+            self.upserts[model] = rows
+        key = tuple(row[x.name] for x in model.__table__.primary_key)
+        rows[key] = row
+
+    def upsert(self, model: Type[DeclarativeBase], rows: List[Dict[str, Any]]) -> None:
+        """Upsert rows into a table with INSERT ... ON CONFLICT DO UPDATE executed with
+        executemany in batches. Existing rows are only updated where a value differs.
+        Databases other than Postgres and SQLite fall back to merging each row.
+
+        Args:
+            model (Type[DeclarativeBase]): Model class of table
+            rows (List[Dict[str, Any]]): Rows to upsert
+
+        Returns:
+            None
+        """
+        table = model.__table__
+        dialect_name = self.session.get_bind().dialect.name
+        if dialect_name == "postgresql":
+            statement = postgresql.insert(table)
+        elif dialect_name == "sqlite":
+            statement = sqlite.insert(table)
+        else:
+            for row in rows:
+                self.session.merge(model(**row))
+            return
+        columns = [x.name for x in table.columns]
+        primary_keys = [x.name for x in table.primary_key]
+        others = [x for x in columns if x not in primary_keys]
+        excluded = statement.excluded
+        statement = statement.on_conflict_do_update(
+            index_elements=primary_keys,
+            set_={x: excluded[x] for x in others},
+            where=or_(*[table.c[x].is_distinct_from(excluded[x]) for x in others]),
+        )
+        for start in range(0, len(rows), self.batch_size):
+            batch = [
+                {column: row.get(column) for column in columns}
+                for row in rows[start : start + self.batch_size]
+            ]
+            self.session.execute(statement, batch)
+
+    def use_copy(self) -> bool:
+        """Whether rows can be written with COPY FROM STDIN
+
+        Returns:
+            bool: True if database is Postgres accessed with psycopg
+        """
+        dialect = self.session.get_bind().dialect
+        return dialect.name == "postgresql" and dialect.driver == "psycopg"
+
+    def copy(self, model: Type[DeclarativeBase], rows: List[Dict[str, Any]]) -> None:
+        """Write rows to a Postgres table with COPY FROM STDIN. The column types'
+        bind processors are applied to each value since COPY bypasses them.
+
+        Args:
+            model (Type[DeclarativeBase]): Model class of table
+            rows (List[Dict[str, Any]]): Rows to write
+
+        Returns:
+            None
+        """
+        table = model.__table__
+        dialect = self.session.get_bind().dialect
+        columns = []
+        processors = []
+        for column in table.columns:
+            columns.append(column.name)
+            processors.append(column.type.bind_processor(dialect))
+        column_names = ", ".join(f'"{x}"' for x in columns)
+        statement = f'COPY "{table.name}" ({column_names}) FROM STDIN'
+        connection = self.session.connection().connection.driver_connection
+        with connection.cursor() as cursor:
+            with cursor.copy(statement) as copy:
+                for row in rows:
+                    values = []
+                    for column, processor in zip(columns, processors):
+                        value = row.get(column)
+                        if processor is not None:
+                            value = processor(value)
+                        values.append(value)
+                    copy.write_row(values)
+
+    def executemany(
+        self, model: Type[DeclarativeBase], rows: List[Dict[str, Any]]
+    ) -> None:
+        """Write rows to a table using Core insert with executemany in batches
+
+        Args:
+            model (Type[DeclarativeBase]): Model class of table
+            rows (List[Dict[str, Any]]): Rows to write
+
+        Returns:
+            None
+        """
+        table = model.__table__
+        columns = [x.name for x in table.columns]
+        for start in range(0, len(rows), self.batch_size):
+            batch = [
+                {column: row.get(column) for column in columns}
+                for row in rows[start : start + self.batch_size]
+            ]
+            self.session.execute(insert(table), batch)
+
+    def write(self) -> None:
+        """Flush any pending ORM objects, upsert all staged rows then write all
+        accumulated rows and clear them. Does not commit.
+
+        Returns:
+            None
+        """
+        self.session.flush()
+        for model, rows in self.upserts.items():
+            if not rows:
+                continue
+            logger.info(f"Upserting {len(rows)} rows into {model.__tablename__}")
+            self.upsert(model, list(rows.values()))
+        self.upserts = {}
+        use_copy = self.use_copy()
+        for model, rows in self.rows.items():
+            if not rows:
+                continue
+            logger.info(f"Writing {len(rows)} rows to {model.__tablename__}")
+            if use_copy:
+                self.copy(model, rows)
+            else:
+                self.executemany(model, rows)
+        self.rows = {}
@@ -0,0 +1,104 @@
+"""Fetch pages of a paged API concurrently, yielding them in order"""
+
+import logging
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Callable, Deque, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+
+class PageFetcher:
+    """Fetches pages of a paged API on a bounded thread pool, starting requests no
+    more often than the rate limit allows, and yields the pages in order. Only a
+    limited number of pages are requested ahead of the page being consumed so that
+    the caller can process each page while later pages download without them all
+    being held in memory. Once the expected number of pages has been fetched,
+    further pages are fetched one at a time until a page is not full in case items
+    were added during fetching.
+
+    Args:
+        get_page (Callable[[int, int], List]): Function taking start and rows
+        count (int): Number of items expected
+        page_size (int): Number of items per page
+        threads (int): Number of pages to fetch concurrently. Defaults to 4.
+        rate (float): Maximum requests started per second. Defaults to 4.
+        lookahead (int): Maximum pages requested ahead. Defaults to 2 * threads.
+    """
+
+    def __init__(
+        self,
+        get_page: Callable[[int, int], List],
+        count: int,
+        page_size: int,
+        threads: int = 4,
+        rate: float = 4,
+        lookahead: int = 0,
+    ) -> None:
+        self.get_page = get_page
+        self.count = count
+        self.page_size = page_size
+        self.threads = threads
+        self.interval = 1 / rate
+        self.lookahead = lookahead if lookahead else threads * 2
+        self.lock = Lock()
+        self.next_request = time.monotonic()
+
+    def wait(self) -> None:
+        """Sleep until the rate limit allows another request to start
+
+        Returns:
+            None
+        """
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_request - now
+            self.next_request = max(now, self.next_request) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def fetch(self, start: int) -> List:
+        """Fetch a page after waiting for the rate limit
+
+        Args:
+            start (int): Offset of first item of page
+
+        Returns:
+            List: Items in page
+        """
+        self.wait()
+        logger.info(f"Fetching items {start} to {start + self.page_size}")
+        return self.get_page(start, self.page_size)
+
+    def __iter__(self) -> Iterator[List]:
+        """Iterate over the pages in order
+
+        Returns:
+            Iterator[List]: Pages of items
+        """
+        starts = iter(range(0, self.count, self.page_size))
+        futures: Deque[Future] = deque()
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            for start in starts:
+                futures.append(executor.submit(self.fetch, start))
+                if len(futures) == self.lookahead:
+                    break
+            page = None
+            while futures:
+                page = futures.popleft().result()
+                start = next(starts, None)
+                if start is not None:
+                    futures.append(executor.submit(self.fetch, start))
+                yield page
+        if page is not None and len(page) < self.page_size:
+            return
+        start = len(range(0, self.count, self.page_size)) * self.page_size
+        while True:
+            page = self.fetch(start)
+            if page:
+                yield page
+            if len(page) < self.page_size:
+                return
+            start += self.page_size
@@ -10,6 +10,8 @@ than the OS to decide when to switch to the next task.
 import asyncio
 import hashlib
 import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from timeit import default_timer as timer
 from typing import Dict, List, Optional, Tuple, Union
@@ -31,11 +33,19 @@ class Retrieval:
     Args:
         user_agent (str): User agent string to use when downloading
         url_ignore (Optional[str]): Parts of url to ignore for special xlsx handling
+        max_sizes (Optional[Dict[str, int]]): Maximum bytes to hash by format. Defaults to None.
+        hashing_threads (int): Threads for hashing off the event loop. Defaults to 0 (inline).
     """
 
     toolargeerror = "File too large to hash!"
+    default_max_size = 419430400
+    hash_batch_size = 1048576
     notmatcherror = "does not match HDX format"
     clienterror_regex = ".Client(.*)Error "
+    status_regex = "code=([0-9]+) "
+    raised_regex = "raised=([^ ]+) "
+    # Errors in the client and format mismatch categories mean a resource is broken
+    broken_error_categories = ("client", "mismatch")
     ignore_mimetypes = ["application/octet-stream", "application/binary"]
     mimetypes = {
         "json": ["application/json"],
@@ -53,9 +63,69 @@ class Retrieval:
         "xlsx": [b"PK\x03\x04"],
     }
 
-    def __init__(self, user_agent: str, url_ignore: Optional[str] = None) -> None:
+    def __init__(
+        self,
+        user_agent: str,
+        url_ignore: Optional[str] = None,
+        max_sizes: Optional[Dict[str, int]] = None,
+        hashing_threads: int = 0,
+    ) -> None:
         self.user_agent = user_agent
         self.url_ignore: Optional[str] = url_ignore
+        if max_sizes is None:
+            max_sizes = {}
+        self.max_sizes: Dict[str, int] = max_sizes
+        self.hashing_threads = hashing_threads
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def get_error_code(cls, error: str) -> Tuple[str, Optional[int], Optional[str]]:
+        """Get a structured code for an error message: its category, the HTTP status
+        and the class of the exception raised where the message gives them. The
+        category is "toolarge" if the file was too large to hash, "mismatch" if it
+        does not match its HDX format, "client" for client errors such as a missing
+        file or failed connection and "server" for others, which are usually
+        temporary.
+
+        Args:
+            error (str): Error message
+
+        Returns:
+            Tuple[str, Optional[int], Optional[str]]: (category, HTTP status, exception class)
+        """
+        match_status = re.match(cls.status_regex, error)
+        status = int(match_status.group(1)) if match_status else None
+        # The outermost exception is the last one given in the message
+        matches_raised = re.findall(cls.raised_regex, error)
+        raised = matches_raised[-1].split(".")[-1] if matches_raised else None
+        match_client = re.search(cls.clienterror_regex, error)
+        if error == cls.toolargeerror:
+            category = "toolarge"
+        elif cls.notmatcherror in error:
+            category = "mismatch"
+        elif match_client:
+            category = "client"
+            if raised is None:
+                raised = match_client.group(0)[1:-1]
+        else:
+            category = "server"
+        return category, status, raised
+
+    def get_max_size(self, resource_format: str) -> int:
+        """Get the maximum number of bytes that will be downloaded and hashed for a
+        given resource format. A "default" key in max_sizes overrides the default
+        for formats that are not specified.
+
+        Args:
+            resource_format (str): Resource format
+
+        Returns:
+            int: Maximum number of bytes to download and hash
+        """
+        max_size = self.max_sizes.get(resource_format)
+        if max_size is None:
+            max_size = self.max_sizes.get("default", self.default_max_size)
+        return max_size
 
     async def fetch(
         self,
@@ -75,8 +145,40 @@ class Retrieval:
         url = metadata[0]
         resource_id = metadata[1]
         resource_format = metadata[2]
+        max_size = self.get_max_size(resource_format)
+        # State kept across retries so that an interrupted download can be resumed
+        mimetype = None
+        signature = None
+        md5hash = None
+        xlsxbuffer = None
+        size = 0
+        validator = None
+        # Chunks waiting to be hashed by the executor
+        pending = bytearray()
+
+        def update_hash(data: bytes) -> None:
+            md5hash.update(data)
+            if xlsxbuffer:
+                xlsxbuffer.extend(data)
+
+        async def hash_pending() -> None:
+            # hashlib releases the GIL for large buffers so batches are hashed on a
+            # thread to keep CPU time off the event loop
+            nonlocal pending
+            data, pending = pending, bytearray()
+            await asyncio.get_running_loop().run_in_executor(
+                self.executor, update_hash, data
+            )
+
+        def get_kwargs() -> Dict:
+            # Ask for the rest of a partial download. If-Range means that the server
+            # sends the whole file again if it has changed since the first attempt
+            if size and validator:
+                return {"headers": {"Range": f"bytes={size}-", "If-Range": validator}}
+            return {}
 
         async def fn(response):
+            nonlocal mimetype, signature, md5hash, xlsxbuffer, size, validator, pending
             last_modified_str = response.headers.get("Last-Modified")
             http_last_modified = None
             if last_modified_str:
@@ -88,41 +190,84 @@ class Retrieval:
                     )
                 except (ValueError, OverflowError):
                     pass
-            length = response.headers.get("Content-Length")
-            if length and int(length) > 419430400:
+
+            def too_large():
                 response.close()
-                err = self.toolargeerror
                 return (
                     resource_id,
                     url,
                     resource_format,
-                    err,
+                    self.toolargeerror,
                     http_last_modified,
                     None,
                     None,
                 )
-            logger.info(f"Hashing {url}")
-            mimetype = response.headers.get("Content-Type")
+
+            resuming = response.status == 206 and response.headers.get(
+                "Content-Range", ""
+            ).startswith(f"bytes {size}-")
+            if resuming:
+                logger.info(f"Resuming {url} from byte {size}")
+            else:
+                if size:
+                    logger.info(f"Restarting {url} as it could not be resumed")
+                size = 0
+                validator = None
+                pending = bytearray()
+                if response.status == 206:
+                    raise aiohttp.ClientPayloadError(
+                        f"Unexpected Content-Range {response.headers.get('Content-Range')}"
+                    )
+                if response.headers.get("Accept-Ranges") == "bytes":
+                    etag = response.headers.get("ETag")
+                    if etag and not etag.startswith("W/"):  # If-Range needs strong
+                        validator = etag
+                    else:
+                        validator = last_modified_str
+            length = response.headers.get("Content-Length")
+            if length and size + int(length) > max_size:
+                return too_large()
+            if not resuming:
+                logger.info(f"Hashing {url}")
+                mimetype = response.headers.get("Content-Type")
 
             try:
                 iterator = response.content.iter_any()
-                first_chunk = await iterator.__anext__()
-                signature = first_chunk[:4]
-                if (
-                    resource_format == "xlsx"
-                    and mimetype == self.mimetypes["xlsx"][0]
-                    and signature == self.signatures["xlsx"][0]
-                    and (self.url_ignore not in url if self.url_ignore else True)
-                ):
-                    xlsxbuffer = bytearray(first_chunk)
-                else:
-                    xlsxbuffer = None
-                md5hash = hashlib.md5(first_chunk)
+                if not resuming:
+                    first_chunk = await iterator.__anext__()
+                    # Content-Length is not sent for chunked responses so the size
+                    # must also be checked while streaming
+                    if len(first_chunk) > max_size:
+                        return too_large()
+                    signature = first_chunk[:4]
+                    if (
+                        resource_format == "xlsx"
+                        and mimetype == self.mimetypes["xlsx"][0]
+                        and signature == self.signatures["xlsx"][0]
+                        and (self.url_ignore not in url if self.url_ignore else True)
+                    ):
+                        xlsxbuffer = bytearray(first_chunk)
+                    else:
+                        xlsxbuffer = None
+                    md5hash = hashlib.md5(first_chunk)
+                    size = len(first_chunk)
                 async for chunk in iterator:
                     if chunk:
-                        md5hash.update(chunk)
-                        if xlsxbuffer:
-                            xlsxbuffer.extend(chunk)
+                        if size + len(chunk) > max_size:
+                            return too_large()
+                        if self.executor:
+                            pending.extend(chunk)
+                            size += len(chunk)
+                            if len(pending) >= self.hash_batch_size:
+                                await hash_pending()
+                        else:
+                            update_hash(chunk)
+                            size += len(chunk)
+                if pending:
+                    await hash_pending()
+                # Download is complete so any retry must start from the beginning
+                size = 0
+                validator = None
                 if xlsxbuffer:
                     workbook = load_workbook(
                         filename=BytesIO(xlsxbuffer), read_only=True
@@ -179,7 +324,14 @@ class Retrieval:
 
         try:
             return await retry.send_http(
-                session, "get", url, retries=2, interval=5, backoff=4, fn=fn
+                session,
+                "get",
+                url,
+                retries=2,
+                interval=5,
+                backoff=4,
+                fn=fn,
+                kwargs_fn=get_kwargs,
             )
         except Exception as e:
             return resource_id, url, resource_format, str(e), None, None, None
@@ -197,37 +349,61 @@ class Retrieval:
         """
         tasks = []
 
-        conn = aiohttp.TCPConnector(limit=100, limit_per_host=1)
-        timeout = aiohttp.ClientTimeout(total=60 * 60, sock_connect=30, sock_read=30)
-        async with aiohttp.ClientSession(
-            connector=conn,
-            timeout=timeout,
-            headers={"User-Agent": self.user_agent},
-        ) as session:
-            session = RateLimiter(session)  # Limit connections per timeframe to host
-            for metadata in resources_to_check:
-                task = self.fetch(metadata, session)
-                tasks.append(task)
-            responses = {}
-            for f in tqdm.tqdm(asyncio.as_completed(tasks), total=len(tasks)):
-                (
-                    resource_id,
-                    url,
-                    resource_format,
-                    err,
-                    http_last_modified,
-                    hash,
-                    hash_xlsx,
-                ) = await f
-                responses[resource_id] = (
-                    url,
-                    resource_format,
-                    err,
-                    http_last_modified,
-                    hash,
-                    hash_xlsx,
+        if self.hashing_threads:
+            self.executor = ThreadPoolExecutor(
+                self.hashing_threads, thread_name_prefix="hashing"
+            )
+        try:
+            conn = aiohttp.TCPConnector(limit=100, limit_per_host=1)
+            timeout = aiohttp.ClientTimeout(
+                total=60 * 60, sock_connect=30, sock_read=30
+            )
+            async with aiohttp.ClientSession(
+                connector=conn,
+                timeout=timeout,
+                headers={"User-Agent": self.user_agent},
+            ) as session:
+                # Limit connections per timeframe to host
+                session = RateLimiter(session)
+                # Resources with the same url and format are only downloaded once
+                url_resource_ids = {}
+                for metadata in resources_to_check:
+                    key = (metadata[0], metadata[2])
+                    resource_ids = url_resource_ids.get(key)
+                    if resource_ids is None:
+                        url_resource_ids[key] = [metadata[1]]
+                        task = self.fetch(metadata, session)
+                        tasks.append(task)
+                    else:
+                        resource_ids.append(metadata[1])
+                logger.info(
+                    f"Downloading {len(tasks)} urls for {len(resources_to_check)} resources"
                 )
-            return responses
+                responses = {}
+                for f in tqdm.tqdm(asyncio.as_completed(tasks), total=len(tasks)):
+                    (
+                        resource_id,
+                        url,
+                        resource_format,
+                        err,
+                        http_last_modified,
+                        hash,
+                        hash_xlsx,
+                    ) = await f
+                    for resource_id in url_resource_ids[(url, resource_format)]:
+                        responses[resource_id] = (
+                            url,
+                            resource_format,
+                            err,
+                            http_last_modified,
+                            hash,
+                            hash_xlsx,
+                        )
+        finally:
+            if self.executor:
+                self.executor.shutdown()
+                self.executor = None
+        return responses
 
     def retrieve(self, resources_to_check: List[Tuple]) -> Dict[str, Tuple]:
         """Download resources and hash them. Return dictionary with resources information
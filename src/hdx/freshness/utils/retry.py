@@ -2,7 +2,7 @@
 
 import asyncio
 import logging
-from typing import Any, Callable, List
+from typing import Any, Callable, Dict, List, Optional
 
 import aiohttp
 from aiohttp import ClientResponse
@@ -59,6 +59,7 @@ async def send_http(
     backoff: int = 2,
     http_status_codes_to_retry: List[int] = HTTP_STATUS_CODES_TO_RETRY,
     fn: Callable[[ClientResponse], Any] = lambda x: x,
+    kwargs_fn: Optional[Callable[[], Dict]] = None,
     **kwargs: Any,
 ):
     """
@@ -73,6 +74,7 @@ async def send_http(
         backoff (int): Multiply interval by this factor after each failure
         http_status_codes_to_retry (List[int]): List of status codes to retry
         fn (Callable[[x],x]: Function to call on successful connection
+        kwargs_fn (Optional[Callable[[], Dict]]): Function giving extra kwargs for each attempt
         **kwargs
     """
     backoff_interval = interval
@@ -98,9 +100,15 @@ async def send_http(
             # bump interval for the next possible attempt
             backoff_interval *= backoff
         # logger.info(f'sending {method.upper()} {url} with {kwargs}')
+        if kwargs_fn:
+            attempt_kwargs = {**kwargs, **kwargs_fn()}
+        else:
+            attempt_kwargs = kwargs
         try:
-            async with await getattr(session, method)(url, **kwargs) as response:
-                if response.status == 200:
+            async with await getattr(session, method)(
+                url, **attempt_kwargs
+            ) as response:
+                if response.status in (200, 206):
                     return await fn(response)
                 elif response.status in http_status_codes_to_retry:
                     logger.error(
@@ -0,0 +1,142 @@
+"""Queue of writes back to HDX run concurrently with a rate limit and retries"""
+
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Tuple, Type
+
+from hdx.utilities.dictandlist import dict_of_lists_add
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBackQueue:
+    """Runs write jobs on a bounded thread pool so that they overlap with the work
+    of the caller, starting attempts no more often than the rate limit allows. A job
+    is a function that returns True if it wrote something and False if it decided
+    there was nothing to write. Jobs raising one of the given exceptions are retried
+    with an exponentially increasing interval and recorded as failed once the
+    retries are exhausted. Other exceptions are raised when waiting for the jobs. If
+    threads is 0, jobs are run inline when submitted.
+
+    Args:
+        threads (int): Number of jobs to run concurrently. Defaults to 4.
+        rate (float): Maximum attempts started per second. Defaults to 4.
+        retries (int): Number of times to retry a failed job. Defaults to 2.
+        interval (float): Seconds to wait before first retry. Defaults to 1.
+        backoff (float): Multiply interval by this after each retry. Defaults to 2.
+        exceptions (Tuple[Type[Exception], ...]): Exceptions to retry. Defaults to (Exception,).
+    """
+
+    def __init__(
+        self,
+        threads: int = 4,
+        rate: float = 4,
+        retries: int = 2,
+        interval: float = 1,
+        backoff: float = 2,
+        exceptions: Tuple[Type[Exception], ...] = (Exception,),
+    ) -> None:
+        if threads:
+            self.executor: Optional[ThreadPoolExecutor] = ThreadPoolExecutor(
+                threads, thread_name_prefix="writeback"
+            )
+        else:
+            self.executor: Optional[ThreadPoolExecutor] = None
+        self.interval = 1 / rate
+        self.retries = retries
+        self.retry_interval = interval
+        self.backoff = backoff
+        self.exceptions = exceptions
+        self.lock = Lock()
+        self.next_request = time.monotonic()
+        self.futures: List[Future] = []
+        self.report: Dict[str, Dict[str, List[str]]] = {}
+
+    def throttle(self) -> None:
+        """Sleep until the rate limit allows another attempt to start
+
+        Returns:
+            None
+        """
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_request - now
+            self.next_request = max(now, self.next_request) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def run(self, action: str, key: str, job: Callable[[], bool]) -> None:
+        """Run a job with retries and record its outcome in the report
+
+        Args:
+            action (str): Type of job eg. touch
+            key (str): Identifier of what the job writes eg. resource id
+            job (Callable[[], bool]): Function returning whether it wrote
+
+        Returns:
+            None
+        """
+        retry_interval = self.retry_interval
+        attempt = 0
+        while True:
+            self.throttle()
+            try:
+                outcome = "done" if job() else "skipped"
+                break
+            except self.exceptions:
+                if attempt == self.retries:
+                    logger.exception(f"{action} failed for {key}!")
+                    outcome = "failed"
+                    break
+                attempt += 1
+                logger.warning(
+                    f"{action} failed for {key}, retry {attempt} of {self.retries} "
+                    f"in {retry_interval:.2f}secs"
+                )
+                time.sleep(retry_interval)
+                retry_interval *= self.backoff
+        with self.lock:
+            dict_of_lists_add(self.report.setdefault(action, {}), outcome, key)
+
+    def submit(self, action: str, key: str, job: Callable[[], bool]) -> None:
+        """Queue a job to be run
+
+        Args:
+            action (str): Type of job eg. touch
+            key (str): Identifier of what the job writes eg. resource id
+            job (Callable[[], bool]): Function returning whether it wrote
+
+        Returns:
+            None
+        """
+        if self.executor is None:
+            self.run(action, key, job)
+        else:
+            self.futures.append(self.executor.submit(self.run, action, key, job))
+
+    def wait(self) -> Dict[str, Dict[str, List[str]]]:
+        """Wait for all queued jobs to finish and log a report of their outcomes.
+        The queue cannot be used afterwards.
+
+        Returns:
+            Dict[str, Dict[str, List[str]]]: Action to outcome to keys
+        """
+        try:
+            for future in self.futures:
+                future.result()
+        finally:
+            if self.executor is not None:
+                for future in self.futures:  # jobs not started if one raised
+                    future.cancel()
+                self.executor.shutdown(wait=True)
+            self.futures = []
+        for action in sorted(self.report):
+            outcomes = self.report[action]
+            counts = ", ".join(f"{x}: {len(outcomes[x])}" for x in sorted(outcomes))
+            logger.info(f"Write back {action} - {counts}")
+            failed = outcomes.get("failed")
+            if failed:
+                logger.error(f"Write back {action} failed for {', '.join(failed)}")
+        return self.report
@@ -17,6 +17,7 @@ from hdx.freshness.database.dbinfodataset import DBInfoDataset
 from hdx.freshness.database.dborganization import DBOrganization
 from hdx.freshness.database.dbresource import DBResource
 from hdx.freshness.database.dbrun import DBRun
+from hdx.freshness.database.dbwhatupdatedcount import DBWhatUpdatedCount
 from hdx.freshness.testdata.dbtestresult import DBTestResult
 from hdx.freshness.testdata.serialize import (
     deserialize_datasets,
@@ -130,6 +131,17 @@ Freshness Unavailable, Updated firstrun: 4
 19 datasets have update frequency of Never
 0 datasets have update frequency of As Needed"""
             )
+            freshness.write_counts()
+            counts = freshness.session.execute(
+                select(
+                    DBWhatUpdatedCount.object_type,
+                    DBWhatUpdatedCount.category,
+                    DBWhatUpdatedCount.count,
+                ).where(DBWhatUpdatedCount.run_number == 0)
+            ).all()
+            assert len(counts) == 13
+            assert ("resource", "total", 660) in counts
+            assert ("dataset", "3: Delinquent, Updated firstrun,error", 5) in counts
 
             dbsession = freshness.session
             dbrun = dbsession.execute(select(DBRun)).scalar_one()
@@ -11,12 +11,13 @@ Set force_hash in dbtestresults and dbtesthashresults if dataset is fresh or you
 (number of resources won't sum to total)!
 """
 
+import logging
 from os import remove
 from os.path import join
 from shutil import copyfile
 
 import pytest
-from sqlalchemy import func, select
+from sqlalchemy import func, select, update
 
 from hdx.database import Database
 from hdx.freshness.app.datafreshness import DataFreshness
@@ -37,6 +38,39 @@ from hdx.utilities.dateparse import parse_date
 
 
 class TestFreshnessDayN:
+    expected_output = """
+*** Resources ***
+* total: 657 *,
+api: 3,
+error: 26,
+first hash: 4,
+hash: 3,
+internal-filestore: 10,
+internal-nothing: 46,
+nothing: 558,
+repeat hash: 1,
+same hash: 6
+
+*** Datasets ***
+* total: 104 *,
+0: Fresh, Updated filestore: 4,
+0: Fresh, Updated filestore,review date: 1,
+0: Fresh, Updated firstrun: 1,
+0: Fresh, Updated hash: 3,
+0: Fresh, Updated nothing: 59,
+0: Fresh, Updated review date: 1,
+0: Fresh, Updated script update: 1,
+1: Due, Updated nothing: 1,
+2: Overdue, Updated nothing: 1,
+3: Delinquent, Updated nothing: 23,
+3: Delinquent, Updated nothing,error: 4,
+Freshness Unavailable, Updated no resources: 1,
+Freshness Unavailable, Updated nothing: 4
+
+15 datasets have update frequency of Live
+19 datasets have update frequency of Never
+0 datasets have update frequency of As Needed"""
+
     @pytest.fixture(scope="function")
     def database(self):
         dbfile = "test_freshness.db"
@@ -145,41 +179,7 @@ class TestFreshnessDayN:
             )
             output = freshness.output_counts()
             # Make sure the sum of the resources = the total resources and sum of the datasets = the total datasets!
-            assert (
-                output
-                == """
-*** Resources ***
-* total: 657 *,
-api: 3,
-error: 26,
-first hash: 4,
-hash: 3,
-internal-filestore: 10,
-internal-nothing: 46,
-nothing: 558,
-repeat hash: 1,
-same hash: 6
-
-*** Datasets ***
-* total: 104 *,
-0: Fresh, Updated filestore: 4,
-0: Fresh, Updated filestore,review date: 1,
-0: Fresh, Updated firstrun: 1,
-0: Fresh, Updated hash: 3,
-0: Fresh, Updated nothing: 59,
-0: Fresh, Updated review date: 1,
-0: Fresh, Updated script update: 1,
-1: Due, Updated nothing: 1,
-2: Overdue, Updated nothing: 1,
-3: Delinquent, Updated nothing: 23,
-3: Delinquent, Updated nothing,error: 4,
-Freshness Unavailable, Updated no resources: 1,
-Freshness Unavailable, Updated nothing: 4
-
-15 datasets have update frequency of Live
-19 datasets have update frequency of Never
-0 datasets have update frequency of As Needed"""
-            )
+            assert output == self.expected_output
 
             dbrun = dbsession.execute(
                 select(DBRun).where(DBRun.run_number == 1)
@@ -409,3 +409,258 @@ maintainer=7d7f5f8d-7e3b-483a-8de1-2b122010c1eb, location=bgd)>"""
 
             freshness.previous_run_number = freshness.run_number
             assert freshness.no_resources_force_hash() == 600
+
+    @pytest.mark.parametrize("threads", [1, 3])
+    def test_generate_dataset_paged(
+        self,
+        threads,
+        monkeypatch,
+        configuration,
+        database,
+        now,
+        datasets,
+        results,
+        hash_results,
+        forced_hash_ids,
+        resourcecls,
+    ):
+        all_datasets = list(datasets)
+        datasetdicts = [
+            {**x.data, "resources": [dict(y) for y in x.get_resources()]}
+            for x in all_datasets
+        ]
+        searches = []
+
+        def call_remoteckan(action, data):
+            assert action == "package_search"
+            searches.append((data.get("start"), data["rows"]))
+            start = data.get("start", 0)
+            return {
+                "count": len(datasetdicts),
+                "results": datasetdicts[start : start + data["rows"]],
+            }
+
+        monkeypatch.setattr(configuration, "call_remoteckan", call_remoteckan)
+        monkeypatch.setitem(configuration, "dataset_page_size", 25)
+        monkeypatch.setitem(configuration, "dataset_page_threads", threads)
+        monkeypatch.setitem(configuration, "dataset_page_rate", 100)
+        with Database(**database, table_base=Base) as database:
+            session = database.get_session()
+            freshness = DataFreshness(
+                configuration=configuration,
+                session=session,
+                now=now,
+                do_touch=True,
+                dont_hash=False,
+            )
+            freshness.spread_datasets()
+            freshness.add_new_run()
+            dbsession = freshness.session
+            modified = parse_date(
+                "2015-05-07 14:44:56.599079", include_microseconds=True
+            )
+            hash_modified = parse_date(
+                "2017-12-16 16:03:33.208327", include_microseconds=True
+            )
+            dbresource = DBResource(
+                run_number=-1,
+                id="010ab2d2-8f98-409b-a1f0-4707ad6c040a",
+                name="sidih_190.csv",
+                dataset_id="54d6b4b8-8cc9-42d3-82ce-3fa4fd3d9be1",
+                url="https://ds-ec2.scraperwiki.com/egzfk1p/siqsxsgjnxgk3r2/cgi-bin/csv/sidih_190.csv",
+                last_modified=modified,
+                metadata_modified=modified,
+                latest_of_modifieds=modified,
+                what_updated="",
+                http_last_modified=None,
+                md5_hash="999",
+                hash_last_modified=hash_modified,
+                when_checked=hash_modified,
+                api=False,
+                error=None,
+            )
+            dbsession.add(dbresource)
+            datasets_to_check, resources_to_check = freshness.process_datasets(
+                hash_ids=forced_hash_ids
+            )
+            # one count and one request per page
+            assert searches[0] == (None, 0)
+            assert sorted(searches[1:]) == [
+                (0, 25),
+                (25, 25),
+                (50, 25),
+                (75, 25),
+                (100, 25),
+            ]
+            results, hash_results = freshness.check_urls(
+                resources_to_check,
+                "test",
+                results=results,
+                hash_results=hash_results,
+            )
+            resourcecls.populate_resourcedict(all_datasets)
+            datasets_lastmodified = freshness.process_results(
+                results, hash_results, resourcecls=resourcecls
+            )
+            freshness.update_dataset_latest_of_modifieds(
+                datasets_to_check, datasets_lastmodified
+            )
+            output = freshness.output_counts()
+            assert output == self.expected_output
+            count = dbsession.scalar(
+                select(func.count(DBResource.id)).where(DBResource.run_number == 1)
+            )
+            assert count == 657
+
+    def test_get_dataset_pages_deleted(
+        self, monkeypatch, caplog, configuration, database, now, datasets
+    ):
+        all_datasets = [
+            {**x.data, "resources": [dict(y) for y in x.get_resources()]}
+            for x in datasets
+        ]
+
+        def call_remoteckan(action, data):
+            start = data.get("start", 0)
+            if start == 25:  # a dataset on the first page is deleted
+                del all_datasets[0]
+            return {
+                "count": len(all_datasets),
+                "results": all_datasets[start : start + data["rows"]],
+            }
+
+        monkeypatch.setattr(configuration, "call_remoteckan", call_remoteckan)
+        monkeypatch.setitem(configuration, "dataset_page_size", 25)
+        monkeypatch.setitem(configuration, "dataset_page_threads", 1)
+        monkeypatch.setitem(configuration, "dataset_page_rate", 100)
+        count = len(all_datasets)
+        with Database(**database, table_base=Base) as database:
+            freshness = DataFreshness(
+                configuration=configuration,
+                session=database.get_session(),
+                now=now,
+            )
+            with caplog.at_level(logging.WARNING):
+                pages = list(freshness.get_dataset_pages())
+            # the first dataset of the second page moved back a page and is skipped
+            assert sum(len(x) for x in pages) == count - 1
+            assert (
+                f"Retrieved {count - 1} datasets from HDX but expected {count}"
+                in caplog.text
+            )
+
+    @staticmethod
+    def run_freshness(
+        configuration,
+        database,
+        now,
+        results,
+        hash_results,
+        forced_hash_ids,
+        datasets,
+        resourcecls,
+    ):
+        with Database(**database, table_base=Base) as database:
+            session = database.get_session()
+            freshness = DataFreshness(
+                configuration=configuration,
+                session=session,
+                datasets=datasets,
+                now=now,
+                do_touch=True,
+                dont_hash=False,
+            )
+            carried = []
+            write_carried_forward = freshness.write_carried_forward
+
+            def record_carried_forward():
+                carried.extend(freshness.carried_dataset_ids)
+                write_carried_forward()
+
+            freshness.write_carried_forward = record_carried_forward
+            freshness.spread_datasets()
+            freshness.add_new_run()
+            datasets_to_check, resources_to_check = freshness.process_datasets(
+                hash_ids=forced_hash_ids
+            )
+            results, hash_results = freshness.check_urls(
+                resources_to_check,
+                "test",
+                results=results,
+                hash_results=hash_results,
+            )
+            resourcecls.populate_resourcedict(datasets)
+            datasets_lastmodified = freshness.process_results(
+                results, hash_results, resourcecls=resourcecls
+            )
+            freshness.update_dataset_latest_of_modifieds(
+                datasets_to_check, datasets_lastmodified
+            )
+            output = freshness.output_counts()
+            rows = []
+            for table in (DBDataset.__table__, DBResource.__table__):
+                rows.append(
+                    session.execute(
+                        select(table)
+                        .where(table.c.run_number == 1)
+                        .order_by(table.c.id)
+                    ).all()
+                )
+            return output, rows, carried
+
+    @staticmethod
+    def set_previous_errors(database):
+        # errors of the previous run must not be carried forward
+        with Database(**database, table_base=Base) as database:
+            session = database.get_session()
+            session.execute(
+                update(DBResource)
+                .where(DBResource.run_number == 0)
+                .values(
+                    error_category="client",
+                    error_status=404,
+                    error_raised="ClientResponseError",
+                )
+            )
+            session.commit()
+
+    def test_generate_dataset_incremental(
+        self,
+        monkeypatch,
+        configuration,
+        database,
+        now,
+        serializedbsession,
+        forced_hash_ids,
+        resourcecls,
+    ):
+        dbpath = database["database"]
+        self.set_previous_errors(database)
+        output, rows, carried = self.run_freshness(
+            configuration,
+            database,
+            now,
+            deserialize_results(serializedbsession),
+            deserialize_hashresults(serializedbsession),
+            forced_hash_ids,
+            list(deserialize_datasets(serializedbsession)),
+            resourcecls,
+        )
+        assert carried == []
+        remove(dbpath)
+        copyfile(join("tests", "fixtures", "day0", "test_freshness.db"), dbpath)
+        self.set_previous_errors(database)
+        monkeypatch.setitem(configuration, "incremental", True)
+        incremental_output, incremental_rows, carried = self.run_freshness(
+            configuration,
+            database,
+            now,
+            deserialize_results(serializedbsession),
+            deserialize_hashresults(serializedbsession),
+            forced_hash_ids,
+            list(deserialize_datasets(serializedbsession)),
+            resourcecls,
+        )
+        assert len(carried) == 62
+        assert incremental_output == output
+        assert incremental_rows == rows
@@ -0,0 +1,98 @@
+"""
+Unit tests for the freshness engine.
+
+"""
+
+from datetime import timedelta
+from os import remove
+from os.path import join
+
+import pytest
+from sqlalchemy import select
+
+from hdx.database import Database
+from hdx.freshness.app.freshnessengine import FreshnessEngine
+from hdx.freshness.database import Base
+from hdx.freshness.database.dbdataset import DBDataset
+from hdx.utilities.dateparse import parse_date
+
+
+class TestFreshnessEngine:
+    @pytest.fixture(scope="function")
+    def nodatabase(self):
+        dbpath = join("tests", "test_freshnessengine.db")
+        try:
+            remove(dbpath)
+        except FileNotFoundError:
+            pass
+        return {"dialect": "sqlite", "database": dbpath}
+
+    @pytest.fixture(scope="function")
+    def now(self):
+        return parse_date("2024-01-31 10:00:00")
+
+    def test_update_run(self, configuration, nodatabase, now):
+        engine = FreshnessEngine(configuration["aging"])
+        assert engine.calculate(now, now - timedelta(days=6), 7) == 0
+        assert engine.calculate(now, now - timedelta(days=7), 7) == 1
+        assert engine.calculate(now, now - timedelta(days=14), 7) == 2
+        assert engine.calculate(now, now - timedelta(days=21), 7) == 3
+        update_frequencies = (None, -2, 0, 1, 7, 30, 365)
+        with Database(**nodatabase, table_base=Base) as database:
+            session = database.get_session()
+            expected = {}
+            for run_number in (0, 1):
+                for update_frequency in update_frequencies:
+                    for days in range(0, 800, 3):
+                        dataset_id = f"{update_frequency}_{days}"
+                        latest_of_modifieds = now - timedelta(days=days, hours=1)
+                        session.add(
+                            DBDataset(
+                                run_number=run_number,
+                                id=dataset_id,
+                                update_frequency=update_frequency,
+                                last_modified=latest_of_modifieds,
+                                metadata_modified=latest_of_modifieds,
+                                latest_of_modifieds=latest_of_modifieds,
+                                what_updated="nothing",
+                                last_resource_updated="resource",
+                                last_resource_modified=latest_of_modifieds,
+                                fresh=-1,
+                                error=False,
+                            )
+                        )
+                        if (
+                            run_number == 1
+                            and update_frequency
+                            and update_frequency > 0
+                        ):
+                            expected[dataset_id] = engine.calculate(
+                                now, latest_of_modifieds, update_frequency
+                            )
+            session.commit()
+            freshness = engine.update_run(session, 1, now)
+            assert freshness == expected
+            assert sorted(set(freshness.values())) == [0, 1, 2, 3]
+
+            def get_fresh(run_number):
+                return dict(
+                    session.execute(
+                        select(DBDataset.id, DBDataset.fresh).where(
+                            DBDataset.run_number == run_number
+                        )
+                    ).all()
+                )
+
+            fresh = get_fresh(1)
+            for dataset_id, value in fresh.items():
+                assert value == expected.get(dataset_id, -1)
+            assert set(get_fresh(0).values()) == {-1}
+
+            freshness = engine.update_run(
+                session, 0, now, dataset_ids=["7_0", "7_21", "None_3"]
+            )
+            assert freshness == {"7_0": 0, "7_21": 3}
+            fresh = get_fresh(0)
+            assert fresh["7_21"] == 3
+            assert fresh["7_24"] == -1
+            assert fresh["None_3"] == -1
@@ -0,0 +1,94 @@
+"""
+Unit tests for the hash history.
+
+"""
+
+from datetime import timedelta
+from os import remove
+from os.path import join
+
+import pytest
+from sqlalchemy import delete, select
+
+from hdx.database import Database
+from hdx.freshness.app.hashhistory import HashHistory
+from hdx.freshness.database import Base
+from hdx.freshness.database.dbresource import DBResource
+from hdx.freshness.database.dbresourcehash import DBResourceHash
+from hdx.freshness.database.dbrun import DBRun
+from hdx.utilities.dateparse import parse_date
+
+
+class TestHashHistory:
+    @pytest.fixture(scope="function")
+    def nodatabase(self):
+        dbpath = join("tests", "test_hashhistory.db")
+        try:
+            remove(dbpath)
+        except FileNotFoundError:
+            pass
+        return {"dialect": "sqlite", "database": dbpath}
+
+    @pytest.fixture(scope="function")
+    def now(self):
+        return parse_date("2024-01-31 10:00:00")
+
+    def test_hash_history(self, nodatabase, now):
+        # resource id: md5_hash field for runs 0 to 3
+        history = {
+            "changing": ["a", "b", "b", "a"],
+            "nohash": [None] * 4,
+            "late": [None, None, "c", "c"],
+        }
+        with Database(**nodatabase, table_base=Base) as database:
+            session = database.get_session()
+            for run_number in range(4):
+                run_date = now - timedelta(days=4 - run_number)
+                session.add(DBRun(run_number=run_number, run_date=run_date))
+                for resource_id, hashes in history.items():
+                    session.add(
+                        DBResource(
+                            run_number=run_number,
+                            id=resource_id,
+                            name=resource_id,
+                            dataset_id="dataset",
+                            url=f"http://lala/{resource_id}",
+                            last_modified=run_date,
+                            latest_of_modifieds=run_date,
+                            what_updated="nothing",
+                            md5_hash=hashes[run_number],
+                        )
+                    )
+            session.commit()
+            hash_history = HashHistory(session)
+            hash_history.load(["changing", "nohash"])
+            assert hash_history.hashes == {("changing", "a"): 0, ("changing", "b"): 1}
+            rows = session.execute(
+                select(DBResourceHash).order_by(
+                    DBResourceHash.resource_id, DBResourceHash.hash
+                )
+            ).scalars()
+            assert [str(x) for x in rows] == [
+                "<ResourceHash(resource id=changing, hash=a, first seen run=0, last seen run=3)>",
+                "<ResourceHash(resource id=changing, hash=b, first seen run=1, last seen run=2)>",
+                "<ResourceHash(resource id=late, hash=c, first seen run=2, last seen run=3)>",
+            ]
+            # history survives cleaning of old runs and is not filled again
+            session.execute(delete(DBResource).where(DBResource.run_number < 3))
+            hash_history.load(["changing", "nohash", "late"])
+            assert hash_history.is_repeat("changing", "b") is True
+            assert hash_history.is_repeat("late", "c") is True
+            assert hash_history.is_repeat("nohash", "d") is False
+            hash_history.add("changing", "b", 4)
+            hash_history.add("nohash", "d", 4)
+            hash_history.write()
+            session.commit()
+            rows = session.execute(
+                select(DBResourceHash)
+                .where(DBResourceHash.last_seen_run == 4)
+                .order_by(DBResourceHash.resource_id)
+            ).scalars()
+            assert [str(x) for x in rows] == [
+                "<ResourceHash(resource id=changing, hash=b, first seen run=1, last seen run=4)>",
+                "<ResourceHash(resource id=nohash, hash=d, first seen run=4, last seen run=4)>",
+            ]
@@ -0,0 +1,88 @@
+"""
+Unit tests for the hash policy.
+
+"""
+
+from datetime import timedelta
+from os import remove
+from os.path import join
+
+import pytest
+
+from hdx.database import Database
+from hdx.freshness.app.hashpolicy import HashPolicy
+from hdx.freshness.database import Base
+from hdx.freshness.database.dbresource import DBResource
+from hdx.freshness.database.dbrun import DBRun
+from hdx.utilities.dateparse import parse_date
+
+
+class TestHashPolicy:
+    @pytest.fixture(scope="function")
+    def nodatabase(self):
+        dbpath = join("tests", "test_hashpolicy.db")
+        try:
+            remove(dbpath)
+        except FileNotFoundError:
+            pass
+        return {"dialect": "sqlite", "database": dbpath}
+
+    @pytest.fixture(scope="function")
+    def now(self):
+        return parse_date("2024-01-31 10:00:00")
+
+    def test_hash_policy(self, nodatabase, now):
+        # resource id: api field for runs 0 to 11
+        history = {
+            "stable": [False] * 12,
+            "newfile": [None] * 9 + [False] * 3,
+            "api": [None] * 8 + [True] * 4,
+            "mixed": [False] * 11 + [True],
+            "old": [False] * 10 + [None] * 2,
+        }
+        with Database(**nodatabase, table_base=Base) as database:
+            session = database.get_session()
+            for run_number in range(12):
+                run_date = now - timedelta(days=12 - run_number)
+                session.add(DBRun(run_number=run_number, run_date=run_date))
+                for resource_id, apis in history.items():
+                    session.add(
+                        DBResource(
+                            run_number=run_number,
+                            id=resource_id,
+                            name=resource_id,
+                            dataset_id="dataset",
+                            url=f"http://lala/{resource_id}",
+                            last_modified=run_date,
+                            latest_of_modifieds=run_date,
+                            what_updated="nothing",
+                            api=apis[run_number],
+                        )
+                    )
+            session.commit()
+            policy = HashPolicy(session, lookback_runs=10, stable_runs=10, api_runs=3)
+            policy.load(None)
+            assert policy.api_history == {}
+            policy.load(11)
+            assert policy.is_stable_file("stable") is True
+            assert policy.is_stable_file("newfile") is False
+            assert policy.is_stable_file("mixed") is False
+            assert policy.is_stable_file("old") is False
+            assert policy.is_known_api("api") is True
+            assert policy.is_known_api("mixed") is False
+            assert policy.needs_confirmation("stable") is False
+            assert policy.needs_confirmation("api") is False
+            assert policy.needs_confirmation("newfile") is True
+            assert policy.needs_confirmation("unknown") is True
+            assert policy.skip_hash("api", now - timedelta(days=89), now) is True
+            assert policy.skip_hash("api", now - timedelta(days=90), now) is False
+            assert policy.skip_hash("api", None, now) is False
+            assert policy.skip_hash("stable", now, now) is False
+            assert policy.last_confirmed["old"] == 9
+            assert policy.is_confirmation_due("stable") is False
+            assert policy.is_confirmation_due("unknown") is True
+            policy.confirm_runs = 3
+            assert policy.is_confirmation_due("old") is True
+            policy.confirm_runs = 1
+            assert policy.needs_confirmation("stable") is True
+            assert policy.needs_confirmation("api") is True
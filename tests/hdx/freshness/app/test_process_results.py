@@ -10,6 +10,8 @@ import pytest
 
 from hdx.data.dataset import Dataset
 from hdx.freshness.app.datafreshness import DataFreshness
+from hdx.freshness.app.hashpolicy import HashPolicy
+from hdx.freshness.database.whatupdated import WhatUpdated
 from hdx.utilities.dateparse import parse_date
 
 
@@ -18,21 +20,32 @@ class TestProcessResults:
     def session(self):
         class TestSession:
             @staticmethod
-            def execute(somethingin):
+            def execute(somethingin, *args):
                 result = Mock()
-                if somethingin.column_descriptions[0]["name"] == "DBResource":
+                if not hasattr(somethingin, "column_descriptions"):
+                    return result  # writes of hash history
+                name = somethingin.column_descriptions[0]["name"]
+                if name == "resource_id":  # no hash history
+                    result.all.return_value = []
+                elif name == "DBResource":
 
                     class DBResource:
                         dataset_id = "c1c85ecb-5e84-48c6-8ba9-15689a6c2fc4"
                         what_updated = ""
+                        what_updated_flags = 0
                         http_last_modified = None
+                        last_modified = parse_date(
+                            "2019-10-20 05:05:20", include_microseconds=True
+                        )
                         latest_of_modifieds = parse_date(
                             "2019-10-28 05:05:20", include_microseconds=True
                         )
                         md5_hash = "5600bafa19852afae3d7fd27955df0e6"
                         error = ""
+                        api = None
 
-                    result.scalar_one.return_value = DBResource()
+                    TestSession.dbresource = DBResource()
+                    result.scalar_one.return_value = TestSession.dbresource
                 else:
 
                     class DBDataset:
@@ -46,12 +59,33 @@ class TestProcessResults:
             def scalar(_):
                 return None  # None works as False for select(exists()...)
 
+            @staticmethod
+            def flush():
+                pass
+
+            @staticmethod
+            def get_bind():
+                bind = Mock()
+                bind.dialect.name = "sqlite"
+                return bind
+
             @staticmethod
             def commit():
                 pass
 
         return TestSession()
 
+    @pytest.fixture(scope="function")
+    def datasetcls(self):
+        class MyDataset:
+            revisions = []
+
+            @classmethod
+            def revise(cls, match, **kwargs):
+                cls.revisions.append((match, kwargs))
+
+        return MyDataset
+
     @pytest.fixture(scope="function")
     def now(self):
         return parse_date("2019-11-03 23:01:31.438713", include_microseconds=True)
@@ -259,11 +293,12 @@ class TestProcessResults:
                 "3adb573a-f056-41b7-8ee5-ec245676a7ce": (
                     "",
                     datetime(2019, 11, 3, 23, 1, 31, 438713, tzinfo=timezone.utc),
-                    ",hash",
+                    WhatUpdated.HASH,
                 )
             }
         }
         assert resourcecls.touched is True
+        assert session.dbresource.api is False
 
     def test_process_broken_results1(
         self,
@@ -292,7 +327,7 @@ class TestProcessResults:
                 "5cf4261f-b571-4bf4-9a5c-2998f49be722": (
                     error1,
                     datetime(2019, 10, 28, 5, 5, 20, tzinfo=timezone.utc),
-                    "",
+                    WhatUpdated.NOTHING,
                 )
             }
         }
@@ -325,7 +360,7 @@ class TestProcessResults:
                 "5cf4261f-b571-4bf4-9a5c-2998f49be722": (
                     error2,
                     datetime(2019, 10, 28, 5, 5, 20, tzinfo=timezone.utc),
-                    "",
+                    WhatUpdated.NOTHING,
                 )
             }
         }
@@ -358,7 +393,7 @@ class TestProcessResults:
                 "5cf4261f-b571-4bf4-9a5c-2998f49be722": (
                     error3,
                     datetime(2019, 10, 28, 5, 5, 20, tzinfo=timezone.utc),
-                    "",
+                    WhatUpdated.NOTHING,
                 )
             }
         }
@@ -391,8 +426,104 @@ class TestProcessResults:
                 "5cf4261f-b571-4bf4-9a5c-2998f49be722": (
                     error4,
                     datetime(2019, 10, 28, 5, 5, 20, tzinfo=timezone.utc),
+                    WhatUpdated.NOTHING,
+                )
+            }
+        }
+        assert resourcecls.broken is False
+
+    def test_process_known_api(
+        self, configuration, session, now, datasets, results, resourcecls
+    ):
+        freshness = DataFreshness(
+            configuration=configuration,
+            session=session,
+            datasets=datasets,
+            now=now,
+            do_touch=True,
+        )
+        resource_id = "3adb573a-f056-41b7-8ee5-ec245676a7ce"
+        freshness.hash_policy = HashPolicy(session)
+        freshness.hash_policy.api_history = {resource_id: (0, 3)}
+        resourcecls.populate_resourcedict(datasets)
+        resourcecls.touched = False
+        freshness.process_results(results, {}, resourcecls=resourcecls)
+        assert freshness.resource_what_updated.counts == {"api": 1}
+        assert resourcecls.touched is False
+        assert session.dbresource.api is None
+
+    def test_process_stable_file(
+        self, configuration, session, now, datasets, results, resourcecls
+    ):
+        freshness = DataFreshness(
+            configuration=configuration,
+            session=session,
+            datasets=datasets,
+            now=now,
+            do_touch=True,
+        )
+        resource_id = "3adb573a-f056-41b7-8ee5-ec245676a7ce"
+        freshness.hash_policy = HashPolicy(session)
+        freshness.hash_policy.api_history = {resource_id: (10, 0)}
+        resourcecls.populate_resourcedict(datasets)
+        resourcecls.touched = False
+        datasets_lastmodified = freshness.process_results(
+            results, {}, resourcecls=resourcecls
+        )
+        assert datasets_lastmodified == {
+            "c1c85ecb-5e84-48c6-8ba9-15689a6c2fc4": {
+                resource_id: (
                     "",
+                    datetime(2019, 11, 3, 23, 1, 31, 438713, tzinfo=timezone.utc),
+                    WhatUpdated.HASH,
                 )
             }
         }
+        assert resourcecls.touched is True
+        # unconfirmed so not counted as a run in which resource was not an API
+        assert session.dbresource.api is None
+
+    def test_process_results_batch(
+        self,
+        configuration,
+        session,
+        now,
+        datasets,
+        results,
+        broken_results1,
+        resourcecls,
+        datasetcls,
+    ):
+        freshness = DataFreshness(
+            configuration=configuration,
+            session=session,
+            datasets=datasets,
+            now=now,
+            do_touch=True,
+        )
+        freshness.writeback_batch = True
+        resourcecls.touched = False
+        resourcecls.broken = False
+        freshness.process_results(
+            {**results, **broken_results1},
+            results,
+            resourcecls=resourcecls,
+            datasetcls=datasetcls,
+        )
+        assert datasetcls.revisions == [
+            (
+                {"id": "c1c85ecb-5e84-48c6-8ba9-15689a6c2fc4"},
+                {
+                    "update__resources__3adb573a-f056-41b7-8ee5-ec245676a7ce": {
+                        "last_modified": "2019-11-03T23:01:31.438713"
+                    },
+                    "update__resources__5cf4261f-b571-4bf4-9a5c-2998f49be722": {
+                        "broken_link": True
+                    },
+                },
+            )
+        ]
+        assert freshness.resource_last_modified_count == 1
+        assert freshness.resource_broken_count == 1
+        assert resourcecls.touched is False
         assert resourcecls.broken is False
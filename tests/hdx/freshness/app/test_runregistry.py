@@ -0,0 +1,74 @@
+"""
+Unit tests for the run registry.
+
+"""
+
+from os import remove
+from os.path import join
+
+import pytest
+from sqlalchemy import inspect, select
+
+from hdx.database import Database
+from hdx.freshness.app.runregistry import RunRegistry
+from hdx.freshness.database import Base
+from hdx.freshness.database.dbresource import DBResource
+from hdx.freshness.database.dbrun import DBRun
+from hdx.freshness.utils.bulkwriter import BulkWriter
+from hdx.utilities.dateparse import parse_date
+
+
+class TestRunRegistry:
+    @pytest.fixture(scope="function")
+    def nodatabase(self):
+        dbpath = join("tests", "test_runregistry.db")
+        try:
+            remove(dbpath)
+        except FileNotFoundError:
+            pass
+        return {"dialect": "sqlite", "database": dbpath}
+
+    def test_run_registry(self, nodatabase):
+        now = parse_date("2024-01-31 10:00:00")
+        with Database(**nodatabase, table_base=Base) as database:
+            session = database.get_session()
+            session.add(DBRun(run_number=0, run_date=now))
+            bulkwriter = BulkWriter(session)
+            registry = RunRegistry(session, 0)
+            rows = {}
+            for resource_id in ("registered", "unregistered"):
+                row = {
+                    "run_number": 0,
+                    "id": resource_id,
+                    "name": resource_id,
+                    "dataset_id": "dataset",
+                    "url": f"http://lala/{resource_id}",
+                    "last_modified": now,
+                    "latest_of_modifieds": now,
+                    "what_updated": "firstrun",
+                }
+                bulkwriter.add(DBResource, row)
+                rows[resource_id] = row
+            registry.add(DBResource, rows["registered"])
+            bulkwriter.write()
+            session.commit()
+
+            dbresource = registry.get(DBResource, "registered")
+            assert dbresource.md5_hash is None
+            assert inspect(dbresource).detached is True
+            registry.attach(DBResource)
+            assert registry.get(DBResource, "registered") is dbresource
+            dbresource.md5_hash = "1234"
+            registry.detach()
+            session.commit()
+            assert inspect(dbresource).detached is True
+            assert dbresource.md5_hash == "1234"
+            session.expire_all()
+            md5_hash = session.scalar(
+                select(DBResource.md5_hash).where(DBResource.id == "registered")
+            )
+            assert md5_hash == "1234"
+
+            dbresource = registry.get(DBResource, "unregistered")
+            assert inspect(dbresource).persistent is True
+            assert dbresource.url == "http://lala/unregistered"
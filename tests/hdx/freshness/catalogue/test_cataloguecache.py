@@ -0,0 +1,127 @@
+from os import remove
+from os.path import join
+
+import pytest
+from sqlalchemy import select
+
+from hdx.database import Database
+from hdx.freshness.catalogue import Base
+from hdx.freshness.catalogue.cataloguecache import CatalogueCache
+from hdx.freshness.catalogue.dbcatalogueddataset import DBCataloguedDataset
+
+
+class FakeConfiguration:
+    def __init__(self, datasets):
+        self.datasets = datasets
+        self.calls = []
+        self.read_only = False
+        self.on_page = None
+
+    def set_read_only(self, read_only):
+        self.read_only = read_only
+
+    def call_remoteckan(self, action, data):
+        assert action == "package_search"
+        assert self.read_only is True
+        if data["rows"] == 0:
+            return {"count": len(self.datasets), "results": []}
+        self.calls.append(data)
+        if self.on_page:
+            self.on_page(data)
+        datasets = list(self.datasets.values())
+        fq = data.get("fq")
+        if fq:
+            since = fq.split("[")[1].split("Z")[0]
+            datasets = [x for x in datasets if x["metadata_modified"] >= since]
+        if data.get("fl") == "id":
+            datasets = [{"id": x["id"]} for x in datasets]
+        start = data["start"]
+        return {"results": datasets[start : start + data["rows"]]}
+
+
+def make_dataset(number, metadata_modified):
+    return {
+        "id": f"id{number}",
+        "name": f"dataset{number}",
+        "metadata_modified": metadata_modified,
+        "resources": [{"id": f"resource{number}", "url": "http://a.org/a.csv"}],
+    }
+
+
+class TestCatalogueCache:
+    @pytest.fixture(scope="function")
+    def database(self):
+        dbpath = join("tests", "test_cataloguecache.db")
+        try:
+            remove(dbpath)
+        except FileNotFoundError:
+            pass
+        return {"dialect": "sqlite", "database": dbpath}
+
+    def test_sync(self, configuration, database):
+        datasets = {
+            f"id{i}": make_dataset(i, f"2024-01-0{i + 1}T10:00:00.123456")
+            for i in range(5)
+        }
+        fakeconfiguration = FakeConfiguration(datasets)
+        with Database(**database, table_base=Base) as database:
+            session = database.get_session()
+            catalogue = CatalogueCache(session, fakeconfiguration, page_size=2)
+            catalogue.sync()
+            assert fakeconfiguration.read_only is False
+            assert [x["start"] for x in fakeconfiguration.calls] == [0, 2, 4]
+            assert "fq" not in fakeconfiguration.calls[0]
+            assert catalogue.get_last_modified() == "2024-01-05T10:00:00.123456"
+
+            fakeconfiguration.calls = []
+            datasets["id4"] = make_dataset(4, "2024-01-06T09:00:00.000000")
+            datasets["id4"]["name"] = "changed"
+            datasets["id5"] = make_dataset(5, "2024-01-07T09:00:00.000000")
+            del datasets["id1"]
+            catalogue.sync()
+            fq = fakeconfiguration.calls[0]["fq"]
+            assert fq == "metadata_modified:[2024-01-05T10:00:00Z TO *]"
+            # 2 pages of changes (2 datasets) then 3 pages of ids
+            assert len(fakeconfiguration.calls) == 5
+            assert fakeconfiguration.calls[-1]["fl"] == "id"
+            ids = session.scalars(
+                select(DBCataloguedDataset.id).order_by(DBCataloguedDataset.id)
+            ).all()
+            assert ids == ["id0", "id2", "id3", "id4", "id5"]
+
+            pages = list(catalogue.get_pages(3))
+            assert [len(x) for x in pages] == [3, 2]
+            dataset = pages[1][0]
+            assert dataset["name"] == "changed"
+            assert dataset.get_resources()[0]["id"] == "resource4"
+
+    def test_reconcile_changed(self, configuration, database):
+        datasets = {
+            f"id{i}": make_dataset(i, f"2024-01-0{i + 1}T10:00:00.123456")
+            for i in range(5)
+        }
+        fakeconfiguration = FakeConfiguration(datasets)
+        with Database(**database, table_base=Base) as database:
+            session = database.get_session()
+            catalogue = CatalogueCache(session, fakeconfiguration, page_size=2)
+            catalogue.sync()
+
+            def delete_dataset(data):
+                # id3 moves back to the first page of ids after it has been fetched
+                # so it would be removed from the cache if the count was not checked
+                if data.get("fl") == "id" and data["start"] == 2:
+                    datasets.pop("id0", None)
+
+            fakeconfiguration.on_page = delete_dataset
+            del datasets["id1"]
+            catalogue.sync()
+            ids = session.scalars(
+                select(DBCataloguedDataset.id).order_by(DBCataloguedDataset.id)
+            ).all()
+            assert ids == ["id0", "id1", "id2", "id3", "id4"]
+            fakeconfiguration.on_page = None
+            catalogue.sync()
+            ids = session.scalars(
+                select(DBCataloguedDataset.id).order_by(DBCataloguedDataset.id)
+            ).all()
+            assert ids == ["id2", "id3", "id4"]
@@ -0,0 +1,94 @@
+from os.path import join
+from uuid import UUID
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.schema import CreateTable
+
+from hdx.freshness.database.compacttypes import (
+    HashBytes,
+    UUIDString,
+    set_compact_types,
+)
+from hdx.freshness.database.dbdataset import DBDataset
+from hdx.freshness.database.dbresource import DBResource
+from hdx.freshness.database.dbresourcehash import DBResourceHash
+
+
+class TestCompactTypes:
+    @pytest.fixture(scope="function")
+    def compact_types(self):
+        set_compact_types(True)
+        yield
+        set_compact_types(False)
+
+    def test_ddl(self, compact_types):
+        ddl = str(
+            CreateTable(DBResource.__table__).compile(dialect=postgresql.dialect())
+        )
+        assert "id UUID NOT NULL" in ddl
+        assert "dataset_id UUID NOT NULL" in ddl
+        assert "md5_hash BYTEA" in ddl
+        ddl = str(
+            CreateTable(DBResourceHash.__table__).compile(dialect=postgresql.dialect())
+        )
+        assert "resource_id UUID NOT NULL" in ddl
+        assert "hash BYTEA NOT NULL" in ddl
+        ddl = str(CreateTable(DBResource.__table__).compile(dialect=sqlite.dialect()))
+        assert "id VARCHAR NOT NULL" in ddl
+        assert "md5_hash VARCHAR" in ddl
+        set_compact_types(False)
+        ddl = str(
+            CreateTable(DBResource.__table__).compile(dialect=postgresql.dialect())
+        )
+        assert "id VARCHAR NOT NULL" in ddl
+        assert "md5_hash VARCHAR" in ddl
+
+    def test_values(self, compact_types):
+        md5_hash = "5600bafa19852afae3d7fd27955df0e6"
+        hash_bytes = bytes.fromhex(md5_hash)
+        hash_type = HashBytes()
+        dialect = postgresql.dialect()
+        assert hash_type.process_bind_param(md5_hash, dialect) == hash_bytes
+        assert hash_type.process_bind_param(None, dialect) is None
+        assert hash_type.process_result_value(hash_bytes, dialect) == md5_hash
+        result = hash_type.process_result_value(memoryview(hash_bytes), dialect)
+        assert result == md5_hash
+        dialect = sqlite.dialect()
+        assert hash_type.process_bind_param(md5_hash, dialect) == md5_hash
+        assert hash_type.process_result_value(md5_hash, dialect) == md5_hash
+        resource_id = "3adb573a-f056-41b7-8ee5-ec245676a7ce"
+        uuid_type = UUIDString()
+        result = uuid_type.process_result_value(UUID(resource_id), dialect)
+        assert result == resource_id
+        assert uuid_type.process_result_value(resource_id, dialect) == resource_id
+
+    def test_round_trip(self, compact_types):
+        # Postgres rejects values that are not uuids or hex in uuid and bytea columns
+        dialect = postgresql.dialect()
+        engine = create_engine(
+            f"sqlite:///{join('tests', 'fixtures', 'dayN', 'test_freshness.db')}"
+        )
+        with engine.connect() as connection:
+            for model, where in (
+                (DBDataset, DBDataset.what_updated == "no resources"),
+                (DBResource, DBResource.md5_hash.is_not(None)),
+            ):
+                table = model.__table__
+                row = connection.execute(select(table).where(where)).mappings().first()
+                assert row is not None
+                for column in table.columns:
+                    value = row[column.name]
+                    if value is None:
+                        continue
+                    if isinstance(column.type, UUIDString):
+                        stored = UUID(value)
+                    elif isinstance(column.type, HashBytes):
+                        stored = column.type.process_bind_param(value, dialect)
+                        assert len(stored) == 16
+                    else:
+                        continue
+                    result = column.type.process_result_value(stored, dialect)
+                    assert result == value
+        engine.dispose()
@@ -0,0 +1,57 @@
+from os import remove
+from os.path import join
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+
+from hdx.database import Database
+from hdx.freshness.database import Base
+from hdx.freshness.database.dbresource import DBResource
+from hdx.freshness.database.partitions import (
+    create_run_partitions,
+    get_partition_range,
+    get_partitioned_tables,
+    partition_tables,
+    run_tables,
+)
+
+
+class TestPartitions:
+    @pytest.fixture(scope="function")
+    def database(self):
+        dbpath = join("tests", "test_partitions.db")
+        try:
+            remove(dbpath)
+        except FileNotFoundError:
+            pass
+        return {"dialect": "sqlite", "database": dbpath}
+
+    def test_get_partition_range(self):
+        assert get_partition_range(0, 30) == (0, 30)
+        assert get_partition_range(29, 30) == (0, 30)
+        assert get_partition_range(2071, 30) == (2070, 2100)
+
+    def test_partition_tables(self):
+        dialect = postgresql.dialect()
+        ddl = str(CreateTable(DBResource.__table__).compile(dialect=dialect))
+        assert "PARTITION BY" not in ddl
+        partition_tables()
+        try:
+            ddl = str(CreateTable(DBResource.__table__).compile(dialect=dialect))
+            assert ddl.strip().endswith("PARTITION BY RANGE (run_number)")
+        finally:
+            for table in run_tables:
+                table.dialect_options["postgresql"]["partition_by"] = None
+
+    def test_sqlite(self, database):
+        try:
+            with Database(
+                **database, table_base=Base, prepare_fn=partition_tables
+            ) as db:
+                session = db.get_session()
+                assert get_partitioned_tables(session) == []
+                create_run_partitions(session, 5, 30)
+        finally:
+            for table in run_tables:
+                table.dialect_options["postgresql"]["partition_by"] = None
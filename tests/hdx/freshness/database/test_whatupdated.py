@@ -0,0 +1,29 @@
+from hdx.freshness.database.whatupdated import WhatUpdated
+
+
+class TestWhatUpdated:
+    def test_render(self):
+        assert WhatUpdated.NOTHING.render() == "nothing"
+        assert WhatUpdated.NO_RESOURCES.render() == "no resources"
+        flags = WhatUpdated.HASH | WhatUpdated.FILESTORE | WhatUpdated.REVIEW_DATE
+        assert flags.render() == "filestore,review date,hash"
+        assert WhatUpdated.INTERNAL.render() == "internal-nothing"
+        flags = WhatUpdated.INTERNAL | WhatUpdated.FIRSTRUN | WhatUpdated.HASH
+        assert flags.render() == "internal-firstrun,hash"
+
+    def test_parse(self):
+        assert WhatUpdated.parse("nothing") == WhatUpdated.NOTHING
+        assert WhatUpdated.parse("firstrun") == WhatUpdated.FIRSTRUN
+        assert WhatUpdated.parse("internal-firstrun,http header,hash") == (
+            WhatUpdated.INTERNAL
+            | WhatUpdated.FIRSTRUN
+            | WhatUpdated.HTTP_HEADER
+            | WhatUpdated.HASH
+        )
+        assert WhatUpdated.parse("metadata") == WhatUpdated.NOTHING
+        for flags in (
+            WhatUpdated.SAME_HASH | WhatUpdated.ERROR,
+            WhatUpdated.INTERNAL | WhatUpdated.REPEAT_HASH | WhatUpdated.API,
+            WhatUpdated.SCRIPT_UPDATE,
+        ):
+            assert WhatUpdated.parse(flags.render()) == flags
@@ -3,10 +3,24 @@ from os.path import join
 from shutil import copyfile
 
 import pytest
+from sqlalchemy import func, inspect, select, update
 
 from hdx.database import Database
 from hdx.freshness.database import Base
+from hdx.freshness.database.dbdataset import DBDataset
+from hdx.freshness.database.dbdatasetversion import DBDatasetVersion
+from hdx.freshness.database.dbresource import DBResource
+from hdx.freshness.database.dbresourceversion import DBResourceVersion
+from hdx.freshness.database.runviews import dbdatasetruns, dbresourceruns
+from hdx.freshness.dbactions.__main__ import get_run_range
 from hdx.freshness.dbactions.dbclean import DBClean
+from hdx.freshness.dbactions.dbfold import DBFold
+from hdx.freshness.dbactions.dbmigrate import (
+    DBMigrate,
+    dbmigrations,
+    get_compact_conversions,
+)
+from hdx.freshness.dbactions.dbrefresh import DBRefresh
 from hdx.utilities.compare import assert_files_same
 from hdx.utilities.dateparse import parse_date
 from hdx.utilities.path import temp_dir
@@ -37,6 +51,16 @@ class TestDBClean:
         copyfile(join(self.fixtures, dbfile), dbpath)
         return {"dialect": "sqlite", "database": dbpath}
 
+    @pytest.fixture(scope="function")
+    def database_dayN(self):
+        dbpath = join("tests", "test_dbrefresh.db")
+        try:
+            remove(dbpath)
+        except FileNotFoundError:
+            pass
+        copyfile(join("tests", "fixtures", "dayN", "test_freshness.db"), dbpath)
+        return {"dialect": "sqlite", "database": dbpath}
+
     def check_results(
         self,
         folder,
@@ -144,3 +168,161 @@ class TestDBClean:
                     898,
                     fail_on_run_difference=False,
                 )
+
+    def test_fold(self, database_brokenrun1351):
+        with temp_dir(
+            "test_dbclean_fold",
+            delete_on_success=True,
+            delete_on_failure=False,
+        ) as folder:
+            with Database(**database_brokenrun1351, table_base=Base) as database:
+                session = database.get_session()
+
+                def get_rows(table):
+                    return session.execute(
+                        select(table).order_by(table.c.run_number, table.c.id)
+                    ).all()
+
+                dbdatasets = get_rows(DBDataset.__table__)
+                dbresources = get_rows(DBResource.__table__)
+                dbfold = DBFold(session)
+                assert dbfold.run() is True
+                assert get_rows(dbdatasetruns) == dbdatasets
+                assert get_rows(dbresourceruns) == dbresources
+                run_numbers = session.scalars(
+                    select(DBDataset.run_number).distinct()
+                ).all()
+                assert len(run_numbers) == 2
+                count = session.scalar(select(func.count(DBDatasetVersion.id)))
+                assert count == 38
+                count = session.scalar(select(func.count(DBResourceVersion.id)))
+                assert count == 86
+                assert dbfold.run() is True
+                assert get_rows(dbresourceruns) == dbresources
+
+                cleaner = DBClean(session)
+                self.check_results(
+                    folder,
+                    cleaner,
+                    "runs_broken1351.csv",
+                    "2023-02-27",
+                    2072,
+                    898,
+                    fail_on_run_difference=False,
+                )
+                kept_run_numbers = {x.run_number for x in cleaner.get_runs()}
+                dbdatasets = [x for x in dbdatasets if x.run_number in kept_run_numbers]
+                assert get_rows(dbdatasetruns) == dbdatasets
+
+    def test_migrate(self, database):
+        with Database(**database, table_base=Base) as database:
+            session = database.get_session()
+            engine = session.get_bind()
+            indexes = inspect(engine).get_indexes("dbresources")
+            assert indexes == []
+            migrator = DBMigrate(session)
+            assert migrator.run() is True
+            inspector = inspect(engine)
+            indexes = inspector.get_indexes("dbresources")
+            assert sorted(x["name"] for x in indexes) == [
+                "ix_dbresources_id_md5_hash",
+                "ix_dbresources_run_number_dataset_id",
+                "ix_dbresources_run_number_error_category",
+                "ix_dbresources_run_number_when_checked_error",
+            ]
+            indexes = inspector.get_indexes("dbdatasets")
+            assert sorted(x["name"] for x in indexes) == [
+                "ix_dbdatasets_run_number_fresh",
+                "ix_dbdatasets_run_number_what_updated_flags",
+            ]
+            versions = session.execute(select(dbmigrations.c.version)).all()
+            assert versions == [(1,), (2,), (3,)]
+            assert migrator.run() is True
+            versions = session.execute(select(dbmigrations.c.version)).all()
+            assert versions == [(1,), (2,), (3,)]
+            migrator = DBMigrate(session, compact_types=True)
+            assert migrator.get_migrations(engine.dialect) == DBMigrate.migrations
+            with engine.connect() as connection:
+                conversions = get_compact_conversions(connection)
+            assert conversions["dbresources"] == [
+                "ALTER COLUMN id TYPE uuid USING id::uuid",
+                "ALTER COLUMN dataset_id TYPE uuid USING dataset_id::uuid",
+                "ALTER COLUMN md5_hash TYPE bytea USING decode(md5_hash, 'hex')",
+            ]
+            assert conversions["dbdatasets"] == [
+                "ALTER COLUMN id TYPE uuid USING id::uuid",
+            ]
+
+    def test_refresh(self, configuration, database):
+        aging = configuration["aging"]
+        with Database(**database, table_base=Base) as database:
+            session = database.get_session()
+
+            def get_fresh():
+                return session.execute(
+                    select(DBDataset.run_number, DBDataset.id, DBDataset.fresh)
+                ).all()
+
+            refresher = DBRefresh(session, aging)
+            assert len(refresher.get_runs()) == 2067
+            assert len(refresher.get_runs(100, 105)) == 6
+            assert refresher.run() == {}
+            fresh = get_fresh()
+            halved = {
+                frequency: {status: max(days // 2, 1) for status, days in x.items()}
+                for frequency, x in aging.items()
+            }
+            refresher = DBRefresh(session, halved, dry_run=True)
+            assert refresher.run(100, 105) == {(2, 3): 5}
+            assert get_fresh() == fresh
+            transitions = refresher.run(None, 400)
+            assert sum(transitions.values()) == 38
+            assert get_fresh() == fresh
+            refresher = DBRefresh(session, halved)
+            assert refresher.run(None, 400) == transitions
+            assert refresher.run(None, 400) == {}
+            refreshed = get_fresh()
+            changed = [x for x, y in zip(fresh, refreshed) if x != y]
+            assert len(changed) == 38
+
+    def test_refresh_unchanged(self, configuration, database_dayN):
+        # datasets with no resources have no freshness to refresh
+        with Database(**database_dayN, table_base=Base) as database:
+            session = database.get_session()
+            refresher = DBRefresh(session, configuration["aging"], dry_run=True)
+            assert refresher.run() == {}
+            # datasets whose resources all errored still have a freshness
+            dataset_id, fresh = session.execute(
+                select(DBDataset.id, DBDataset.fresh).where(
+                    DBDataset.run_number == 1,
+                    DBDataset.error.is_(True),
+                    DBDataset.fresh.is_not(None),
+                )
+            ).first()
+            wrong_fresh = (fresh + 1) % 4
+            session.execute(
+                update(DBDataset)
+                .where(DBDataset.run_number == 1, DBDataset.id == dataset_id)
+                .values(fresh=wrong_fresh)
+            )
+            session.commit()
+            refresher = DBRefresh(session, configuration["aging"])
+            assert refresher.run() == {(wrong_fresh, fresh): 1}
+            assert (
+                session.scalar(
+                    select(DBDataset.fresh).where(
+                        DBDataset.run_number == 1, DBDataset.id == dataset_id
+                    )
+                )
+                == fresh
+            )
+
+    def test_get_run_range(self):
+        assert get_run_range(None) == (None, None)
+        assert get_run_range("100") == (100, 100)
+        assert get_run_range("100-200") == (100, 200)
+        assert get_run_range("100-") == (100, None)
+        assert get_run_range("-200") == (None, 200)
+        for runs in ("-", "a", "100-200-300", "100:200"):
+            with pytest.raises(ValueError, match="Invalid runs"):
+                get_run_range(runs)
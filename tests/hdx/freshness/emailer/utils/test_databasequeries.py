@@ -3,14 +3,129 @@ Unit tests for database queries code.
 
 """
 
+from datetime import timedelta
+from os import remove
+from os.path import join
+from shutil import copyfile
+
+import pytest
+from sqlalchemy import func, select
+
 from hdx.database import Database
 from hdx.freshness.database import Base
+from hdx.freshness.database.dbdataset import DBDataset
+from hdx.freshness.database.dbinfodataset import DBInfoDataset
+from hdx.freshness.database.dborganization import DBOrganization
+from hdx.freshness.database.dbresource import DBResource
+from hdx.freshness.database.dbrun import DBRun
+from hdx.freshness.database.whatupdated import WhatUpdated
+from hdx.freshness.dbactions.dbfold import DBFold
 from hdx.freshness.emailer.utils.databasequeries import DatabaseQueries
 from hdx.freshness.emailer.utils.hdxhelper import HDXHelper
+from hdx.freshness.utils.retrieval import Retrieval
 from hdx.utilities.dateparse import parse_date
 
 
 class TestDatabaseQueries:
+    @pytest.fixture(scope="function")
+    def nodatabase(self):
+        dbpath = join("tests", "test_databasequeries.db")
+        try:
+            remove(dbpath)
+        except FileNotFoundError:
+            pass
+        return {"dialect": "sqlite", "database": dbpath}
+
+    @pytest.fixture(scope="function")
+    def database_dayN(self):
+        dbpath = join("tests", "test_databasequeries_dayN.db")
+        try:
+            remove(dbpath)
+        except FileNotFoundError:
+            pass
+        copyfile(join("tests", "fixtures", "dayN", "test_freshness.db"), dbpath)
+        return {"dialect": "sqlite", "database": dbpath}
+
+    @pytest.fixture(scope="function")
+    def errors(self):
+        toolarge = Retrieval.toolargeerror
+        mismatch = "File mimetype text/html does not match HDX format csv!"
+        notfound = "code=404 message=Non-retryable response code raised=aiohttp.ClientResponseError url=xxx"
+        # the outermost exception is the last one given
+        payload = 'code= message=, message="Exception during hashing: code= message=Response payload is not completed raised=aiohttp.client_exceptions.ClientPayloadError url=xxx" raised=aiohttp.client_exceptions.ClientResponseError url=xxx'
+        timeout = "code= message=asyncio.TimeoutError raised=asyncio.exceptions.TimeoutError url=xxx"
+        return toolarge, mismatch, notfound, payload, timeout
+
+    @pytest.fixture(scope="function")
+    def database_errors(self, nodatabase, errors):
+        # run 0 and run 1 with dataset id: resource errors in run 1
+        run_dates = [
+            parse_date("2024-01-01 09:00:00"),
+            parse_date("2024-01-02 09:00:00"),
+        ]
+        dataset_errors = {
+            "dataset1": [None, errors[0], errors[1], errors[2]],
+            "dataset2": [errors[3], errors[4]],
+        }
+        with Database(**nodatabase, table_base=Base) as database:
+            session = database.get_session()
+            session.add(DBOrganization(id="org", name="org", title="Org"))
+            for run_number, run_date in enumerate(run_dates):
+                session.add(DBRun(run_number=run_number, run_date=run_date))
+            for dataset_id, resource_errors in dataset_errors.items():
+                session.add(
+                    DBInfoDataset(
+                        id=dataset_id,
+                        name=dataset_id,
+                        title=dataset_id,
+                        private=False,
+                        organization_id="org",
+                    )
+                )
+                run_date = run_dates[1]
+                session.add(
+                    DBDataset(
+                        run_number=1,
+                        id=dataset_id,
+                        update_frequency=7,
+                        last_modified=run_date,
+                        metadata_modified=run_date,
+                        latest_of_modifieds=run_date,
+                        what_updated="nothing",
+                        what_updated_flags=int(WhatUpdated.NOTHING),
+                        last_resource_updated=f"{dataset_id}-0",
+                        last_resource_modified=run_date,
+                        fresh=0,
+                        error=False,
+                    )
+                )
+                for i, error in enumerate(resource_errors):
+                    if error is None:
+                        category = status = raised = None
+                    else:
+                        category, status, raised = Retrieval.get_error_code(error)
+                    session.add(
+                        DBResource(
+                            run_number=1,
+                            id=f"{dataset_id}-{i}",
+                            name=f"{dataset_id}-{i}",
+                            dataset_id=dataset_id,
+                            url="http://lala",
+                            last_modified=run_date,
+                            metadata_modified=run_date,
+                            latest_of_modifieds=run_date,
+                            what_updated="nothing",
+                            what_updated_flags=int(WhatUpdated.NOTHING),
+                            when_checked=run_date,
+                            error=error,
+                            error_category=category,
+                            error_status=status,
+                            error_raised=raised,
+                        )
+                    )
+            session.commit()
+        return nodatabase
+
     def test_get_cur_prev_runs(self, configuration, database_failure):
         now = parse_date("2017-02-01 19:07:30.333492", include_microseconds=True)
         with Database(**database_failure, table_base=Base) as database:
@@ -44,3 +159,114 @@ class TestDatabaseQueries:
                 session=session, now=now, hdxhelper=hdxhelper
             )
             assert databasequeries.run_numbers == list()
+
+    def test_get_datasets_time_period_folded(self, configuration, nodatabase):
+        first_run_date = parse_date("2024-01-01 09:00:00")
+        now = first_run_date + timedelta(days=20, hours=10)
+        # dataset id: run in which dataset date last changed
+        dataset_date_changes = {"unchanged": 1, "changed": 18}
+        with Database(**nodatabase, table_base=Base) as database:
+            session = database.get_session()
+            session.add(DBOrganization(id="org", name="org", title="Org"))
+            for dataset_id in dataset_date_changes:
+                session.add(
+                    DBInfoDataset(
+                        id=dataset_id,
+                        name=dataset_id,
+                        title=dataset_id,
+                        private=False,
+                        organization_id="org",
+                    )
+                )
+            for run_number in range(21):
+                run_date = first_run_date + timedelta(days=run_number)
+                session.add(DBRun(run_number=run_number, run_date=run_date))
+                # updated every 5 days within update frequency of 7 days
+                if run_number % 5 == 0:
+                    what_updated = WhatUpdated.FILESTORE
+                else:
+                    what_updated = WhatUpdated.NOTHING
+                for dataset_id, changed_run in dataset_date_changes.items():
+                    if run_number < changed_run:
+                        dataset_date = "[2023-01-01T00:00:00 TO 2023-12-31T23:59:59]"
+                    else:
+                        dataset_date = "[2024-01-01T00:00:00 TO 2024-12-31T23:59:59]"
+                    session.add(
+                        DBDataset(
+                            run_number=run_number,
+                            id=dataset_id,
+                            dataset_date=dataset_date,
+                            update_frequency=7,
+                            last_modified=run_date,
+                            metadata_modified=run_date,
+                            latest_of_modifieds=run_date,
+                            what_updated=what_updated.render(),
+                            what_updated_flags=int(what_updated),
+                            last_resource_updated="resource",
+                            last_resource_modified=run_date,
+                            fresh=0,
+                            error=False,
+                        )
+                    )
+            session.commit()
+            hdxhelper = HDXHelper(site_url="", users=list(), organizations=list())
+            databasequeries = DatabaseQueries(
+                session=session, now=now, hdxhelper=hdxhelper
+            )
+            datasets = databasequeries.get_datasets_time_period()
+            assert [x["id"] for x in datasets] == ["unchanged"]
+            assert DBFold(session).run() is True
+            assert session.scalar(select(func.min(DBDataset.run_number))) == 19
+            databasequeries = DatabaseQueries(
+                session=session, now=now, hdxhelper=hdxhelper
+            )
+            assert databasequeries.get_datasets_time_period() == datasets
+
+    def test_get_broken(self, configuration, database_errors, errors):
+        now = parse_date("2024-01-02 19:00:00")
+        with Database(**database_errors, table_base=Base) as database:
+            session = database.get_session()
+            hdxhelper = HDXHelper(site_url="", users=list(), organizations=list())
+            databasequeries = DatabaseQueries(
+                session=session, now=now, hdxhelper=hdxhelper
+            )
+            datasets = databasequeries.get_broken()
+            # files too large to hash and server errors are not broken
+            assert sorted(datasets) == ["ClientResponseError", "Format Mismatch"]
+
+            def get_resources(error_msg):
+                return {
+                    dataset_name: [(x["id"], x["error"]) for x in dataset["resources"]]
+                    for dataset_name, dataset in datasets[error_msg]["Org"].items()
+                }
+
+            # client errors are grouped by the outermost exception raised
+            assert get_resources("ClientResponseError") == {
+                "dataset1": [("dataset1-3", errors[2])],
+                "dataset2": [("dataset2-0", errors[3])],
+            }
+            assert get_resources("Format Mismatch") == {
+                "dataset1": [("dataset1-2", errors[1])],
+            }
+            dataset = datasets["Format Mismatch"]["Org"]["dataset1"]
+            assert dataset["organization_id"] == "org"
+            assert dataset["update_frequency"] == 7
+            assert "error_category" not in dataset
+
+    def test_get_datasets_noresources(self, configuration, database_dayN):
+        now = parse_date("2017-12-20 10:00:00")
+        with Database(**database_dayN, table_base=Base) as database:
+            session = database.get_session()
+            hdxhelper = HDXHelper(site_url="", users=list(), organizations=list())
+            databasequeries = DatabaseQueries(
+                session=session, now=now, hdxhelper=hdxhelper
+            )
+            datasets = databasequeries.get_datasets_noresources()
+            assert len(datasets) == 1
+            dataset = datasets[0]
+            assert dataset["id"] == "f10a7dab-39f4-4351-a7ae-21f832fa61d2"
+            assert dataset["name"] == "hotosm_nam_buildings"
+            assert dataset["organization_title"] == (
+                "Humanitarian OpenStreetMap Team (HOT)"
+            )
+            assert dataset["what_updated"] == "no resources"
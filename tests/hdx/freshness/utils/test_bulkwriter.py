@@ -0,0 +1,104 @@
+from os import remove
+from os.path import join
+
+import pytest
+from sqlalchemy import func, select
+
+from hdx.database import Database
+from hdx.freshness.database import Base
+from hdx.freshness.database.dbinfodataset import DBInfoDataset
+from hdx.freshness.database.dborganization import DBOrganization
+from hdx.freshness.database.dbresource import DBResource
+from hdx.freshness.database.dbrun import DBRun
+from hdx.freshness.utils.bulkwriter import BulkWriter
+from hdx.utilities.dateparse import parse_date
+
+
+class TestBulkWriter:
+    @pytest.fixture(scope="function")
+    def database(self):
+        dbpath = join("tests", "test_bulkwriter.db")
+        try:
+            remove(dbpath)
+        except FileNotFoundError:
+            pass
+        return {"dialect": "sqlite", "database": dbpath}
+
+    def test_write(self, database):
+        now = parse_date("2024-01-02 12:00:00.123456", include_microseconds=True)
+        with Database(**database, table_base=Base) as database:
+            session = database.get_session()
+            session.add(DBRun(run_number=0, run_date=now))
+            session.add(DBOrganization(id="org", name="org", title="Org"))
+            session.add(
+                DBInfoDataset(
+                    id="dataset",
+                    name="dataset",
+                    title="Dataset",
+                    private=False,
+                    organization_id="org",
+                )
+            )
+            bulkwriter = BulkWriter(session, batch_size=3)
+            assert bulkwriter.use_copy() is False
+            for i in range(7):
+                row = {
+                    "run_number": 0,
+                    "id": f"resource{i}",
+                    "name": f"resource{i}",
+                    "dataset_id": "dataset",
+                    "url": f"https://example.org/{i}.csv",
+                    "last_modified": now,
+                    "metadata_modified": now,
+                    "latest_of_modifieds": now,
+                    "what_updated": "firstrun",
+                }
+                if i == 0:
+                    row["md5_hash"] = "1234"
+                bulkwriter.add(DBResource, row)
+            bulkwriter.write()
+            session.commit()
+            assert bulkwriter.rows == {}
+            count = session.scalar(select(func.count(DBResource.id)))
+            assert count == 7
+            dbresource = session.scalar(
+                select(DBResource).where(DBResource.id == "resource0")
+            )
+            assert dbresource.md5_hash == "1234"
+            assert dbresource.last_modified == now
+            dbresource = session.scalar(
+                select(DBResource).where(DBResource.id == "resource6")
+            )
+            assert dbresource.md5_hash is None
+
+    def test_upsert(self, database):
+        with Database(**database, table_base=Base) as database:
+            session = database.get_session()
+            session.add(DBOrganization(id="org1", name="org1", title="Org 1"))
+            session.add(DBOrganization(id="org2", name="org2", title="Org 2"))
+            session.commit()
+            bulkwriter = BulkWriter(session, batch_size=2)
+            bulkwriter.add_upsert(
+                DBOrganization, {"id": "org1", "name": "org1", "title": "Org 1"}
+            )
+            bulkwriter.add_upsert(
+                DBOrganization, {"id": "org2", "name": "org2", "title": "Old"}
+            )
+            bulkwriter.add_upsert(
+                DBOrganization, {"id": "org2", "name": "org2", "title": "New"}
+            )
+            bulkwriter.add_upsert(
+                DBOrganization, {"id": "org3", "name": "org3", "title": "Org 3"}
+            )
+            bulkwriter.write()
+            session.commit()
+            assert bulkwriter.upserts == {}
+            session.expire_all()
+            dborganizations = session.scalars(
+                select(DBOrganization).order_by(DBOrganization.id)
+            ).all()
+            assert [str(x) for x in dborganizations] == [
+                "<Organization(id=org1, name=org1, title=Org 1)>",
+                "<Organization(id=org2, name=org2, title=New)>",
+                "<Organization(id=org3, name=org3, title=Org 3)>",
+            ]
@@ -0,0 +1,65 @@
+import random
+import time
+from threading import Lock
+
+from hdx.freshness.utils.pagefetcher import PageFetcher
+
+
+class TestPageFetcher:
+    @staticmethod
+    def make_get_page(items, delay=0.0):
+        state = {"active": 0, "max_active": 0, "starts": []}
+        lock = Lock()
+
+        def get_page(start, rows):
+            with lock:
+                state["active"] += 1
+                state["max_active"] = max(state["max_active"], state["active"])
+                state["starts"].append(start)
+            time.sleep(random.uniform(0, delay))
+            with lock:
+                state["active"] -= 1
+            return items[start : start + rows]
+
+        return get_page, state
+
+    def test_in_order(self):
+        items = list(range(95))
+        get_page, state = self.make_get_page(items, delay=0.02)
+        pages = PageFetcher(get_page, 95, 10, threads=3, rate=1000)
+        result = list(pages)
+        assert [len(x) for x in result] == [10] * 9 + [5]
+        assert [y for x in result for y in x] == items
+        assert state["max_active"] <= 3
+        assert sorted(state["starts"]) == list(range(0, 100, 10))
+
+    def test_lookahead(self):
+        items = list(range(100))
+        get_page, state = self.make_get_page(items)
+        pages = iter(PageFetcher(get_page, 100, 10, threads=2, rate=1000))
+        assert next(pages) == list(range(10))
+        time.sleep(0.1)
+        assert len(state["starts"]) == 5
+        pages.close()
+
+    def test_more_than_count(self):
+        items = list(range(47))
+        get_page, state = self.make_get_page(items)
+        result = list(PageFetcher(get_page, 30, 10, threads=2, rate=1000))
+        assert [y for x in result for y in x] == items
+        assert state["starts"][-2:] == [30, 40]
+
+    def test_no_count(self):
+        items = list(range(20))
+        get_page, state = self.make_get_page(items)
+        result = list(PageFetcher(get_page, 0, 10, threads=1, rate=1000))
+        assert result == [list(range(10)), list(range(10, 20))]
+        assert state["starts"] == [0, 10, 20]
+
+    def test_rate(self):
+        items = list(range(50))
+        get_page, _ = self.make_get_page(items)
+        start = time.monotonic()
+        list(PageFetcher(get_page, 50, 10, threads=5, rate=20))
+        # 6 requests, the first immediate and the rest 1/20 s apart
+        assert time.monotonic() - start >= 0.25
@@ -3,12 +3,191 @@ Unit tests for the retrieval class.
 
 """
 
+import asyncio
+import hashlib
+import socket
+import threading
 from datetime import datetime, timezone
 
+import pytest
+from aiohttp import web
+
 from hdx.freshness.utils.retrieval import Retrieval
 
 
 class TestRetrieve:
+    chunk = b"a,b,c\n" * 1024
+    nochunks = 16
+    range_requests = []
+    chunked_requests = []
+
+    @pytest.fixture(scope="class")
+    def server(self):
+        full = self.chunk * self.nochunks
+        half = len(full) // 2
+
+        async def interrupted(request, etag, body):
+            # Send half the file then drop the connection on the first attempt
+            headers = {
+                "Content-Type": "text/csv",
+                "Accept-Ranges": "bytes",
+                "ETag": etag,
+            }
+            if_range = request.headers.get("If-Range")
+            if request.http_range.start is not None:
+                self.range_requests.append((request.path, request.http_range.start))
+                if if_range == etag:
+                    start = request.http_range.start
+                    headers["Content-Range"] = (
+                        f"bytes {start}-{len(body) - 1}/{len(body)}"
+                    )
+                    return web.Response(status=206, body=body[start:], headers=headers)
+                return web.Response(body=body, headers=headers)
+            headers["Content-Length"] = str(len(body))
+            response = web.StreamResponse(headers=headers)
+            await response.prepare(request)
+            await response.write(body[:half])
+            request.transport.abort()
+            return response
+
+        async def resumable(request):
+            return await interrupted(request, '"v1"', full)
+
+        async def changed(request):
+            if request.http_range.start is None:
+                return await interrupted(request, '"v1"', full)
+            return await interrupted(request, '"v2"', full[::-1])
+
+        async def chunked(request):
+            self.chunked_requests.append(request.query.get("id"))
+            response = web.StreamResponse(headers={"Content-Type": "text/csv"})
+            response.enable_chunked_encoding()
+            await response.prepare(request)
+            for _ in range(self.nochunks):
+                await response.write(self.chunk)
+            await response.write_eof()
+            return response
+
+        app = web.Application()
+        app.router.add_get("/chunked.csv", chunked)
+        app.router.add_get("/resumable.csv", resumable)
+        app.router.add_get("/changed.csv", changed)
+        runner = web.AppRunner(app)
+        loop = asyncio.new_event_loop()
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", port)
+        loop.run_until_complete(site.start())
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{port}"
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    def test_streaming_max_size(self, server):
+        url = f"{server}/chunked.csv"
+        size = len(self.chunk) * self.nochunks
+        urls = [(url, "1", "csv"), (url, "2", "xlsx")]
+        retrieval = Retrieval("test", max_sizes={"xlsx": size - 1})
+        result = retrieval.retrieve(urls)
+        expected_hash = hashlib.md5(self.chunk * self.nochunks).hexdigest()
+        assert result["1"][2] is None
+        assert result["1"][4] == expected_hash
+        assert result["2"] == (url, "xlsx", Retrieval.toolargeerror, None, None, None)
+        retrieval = Retrieval("test", max_sizes={"default": size - 1, "csv": size})
+        result = retrieval.retrieve(urls)
+        assert result["1"][4] == expected_hash
+        assert result["2"][2] == Retrieval.toolargeerror
+
+    def test_same_url(self, server):
+        url1 = f"{server}/chunked.csv?id=a"
+        url2 = f"{server}/chunked.csv?id=b"
+        urls = [
+            (url1, "1", "csv"),
+            (url2, "2", "csv"),
+            (url1, "3", "csv"),
+            (url1, "4", "csv"),
+            (url1, "5", "json"),
+        ]
+        self.chunked_requests.clear()
+        result = Retrieval("test").retrieve(urls)
+        assert sorted(self.chunked_requests) == ["a", "a", "b"]
+        assert result["1"] == result["3"] == result["4"]
+        assert result["1"][4] == result["2"][4] == result["5"][4]
+        assert result["1"][2] is None
+        assert result["5"][1] == "json"
+        assert (
+            result["5"][2]
+            == "File mimetype text/csv does not match HDX format json! File signature b'a,b,' does not match HDX format json!"
+        )
+
+    def test_hashing_threads(self, server):
+        url = f"{server}/chunked.csv"
+        urls = [(url, "1", "csv")]
+        retrieval = Retrieval("test", hashing_threads=2)
+        retrieval.hash_batch_size = len(self.chunk) * 3
+        result = retrieval.retrieve(urls)
+        assert result["1"][4] == hashlib.md5(self.chunk * self.nochunks).hexdigest()
+        assert retrieval.executor is None
+
+    def test_hashing_threads_shutdown(self, monkeypatch):
+        retrieval = Retrieval("test", hashing_threads=2)
+
+        async def fetch(metadata, session):
+            raise ValueError("lala")
+
+        monkeypatch.setattr(retrieval, "fetch", fetch)
+        with pytest.raises(ValueError):
+            asyncio.run(retrieval.check_urls([("http://lala", "1", "csv")]))
+        assert retrieval.executor is None
+
+    def test_resume(self, server):
+        full = self.chunk * self.nochunks
+        url1 = f"{server}/resumable.csv"
+        url2 = f"{server}/changed.csv"
+        urls = [(url1, "1", "csv"), (url2, "2", "csv")]
+        result = Retrieval("test").retrieve(urls)
+        assert sorted(self.range_requests) == [
+            ("/changed.csv", len(full) // 2),
+            ("/resumable.csv", len(full) // 2),
+        ]
+        assert result["1"][2] is None
+        assert result["1"][4] == hashlib.md5(full).hexdigest()
+        assert result["2"][2] is None
+        assert result["2"][4] == hashlib.md5(full[::-1]).hexdigest()
+
+    def test_get_error_code(self):
+        assert Retrieval.get_error_code(Retrieval.toolargeerror) == (
+            "toolarge",
+            None,
+            None,
+        )
+        error = "File mimetype text/html does not match HDX format csv!"
+        assert Retrieval.get_error_code(error) == ("mismatch", None, None)
+        error = "code=404 message=Non-retryable response code raised=aiohttp.ClientResponseError url=xxx"
+        assert Retrieval.get_error_code(error) == (
+            "client",
+            404,
+            "ClientResponseError",
+        )
+        error = "code= message=Cannot connect to host lala:443 ssl:default [Name or service not known] raised=aiohttp.client_exceptions.ClientConnectorError url=xxx"
+        assert Retrieval.get_error_code(error) == (
+            "client",
+            None,
+            "ClientConnectorError",
+        )
+        error = "code= message=asyncio.TimeoutError raised=asyncio.exceptions.TimeoutError url=xxx"
+        assert Retrieval.get_error_code(error) == ("server", None, "TimeoutError")
+        error = "code= message=file://lala:10 raised=aiohttp.client_exceptions.NonHttpUrlClientError url=file://lala:10"
+        assert Retrieval.get_error_code(error) == (
+            "client",
+            None,
+            "NonHttpUrlClientError",
+        )
+
     def test_retrieve(self):
         url1 = "http://info.cern.ch/hypertext/WWW/TheProject.html"
         url2 = "https://github.com/mcarans/hdx-data-freshness/raw/d1616d76c3b6b8ef5029eb6964b93cde688efd53/tests/fixtures/day0/notfound"
@@ -0,0 +1,87 @@
+import time
+from threading import Lock
+
+import pytest
+
+from hdx.freshness.utils.writeback import WriteBackQueue
+
+
+class TestWriteBackQueue:
+    def test_outcomes(self):
+        state = {"active": 0, "max_active": 0, "calls": {}}
+        lock = Lock()
+
+        def make_job(key, fails=0, result=True, exception=ValueError):
+            def job():
+                with lock:
+                    state["active"] += 1
+                    state["max_active"] = max(state["max_active"], state["active"])
+                    calls = state["calls"].get(key, 0) + 1
+                    state["calls"][key] = calls
+                time.sleep(0.02)
+                with lock:
+                    state["active"] -= 1
+                if calls <= fails:
+                    raise exception(key)
+                return result
+
+            return job
+
+        queue = WriteBackQueue(
+            threads=3, rate=1000, retries=2, interval=0.01, exceptions=(ValueError,)
+        )
+        for i in range(6):
+            queue.submit("touch", f"a{i}", make_job(f"a{i}"))
+        queue.submit("touch", "fresh", make_job("fresh", result=False))
+        queue.submit("touch", "flaky", make_job("flaky", fails=2))
+        queue.submit("mark broken", "down", make_job("down", fails=5))
+        report = queue.wait()
+        assert sorted(report["touch"]["done"]) == [f"a{i}" for i in range(6)] + [
+            "flaky"
+        ]
+        assert report["touch"]["skipped"] == ["fresh"]
+        assert report["mark broken"] == {"failed": ["down"]}
+        assert state["calls"]["flaky"] == 3
+        assert state["calls"]["down"] == 3
+        assert 1 < state["max_active"] <= 3
+
+    def test_inline(self):
+        queue = WriteBackQueue(threads=0, rate=1000, retries=0)
+        done = []
+        queue.submit("touch", "a", lambda: done.append("a") or True)
+        assert done == ["a"]
+        assert queue.wait() == {"touch": {"done": ["a"]}}
+
+    def test_unexpected_exception(self):
+        queue = WriteBackQueue(
+            threads=2, rate=1000, retries=1, exceptions=(ValueError,)
+        )
+
+        def job():
+            raise KeyError("a")
+
+        queue.submit("touch", "a", job)
+        with pytest.raises(KeyError):
+            queue.wait()
+
+    def test_cancel_queued(self):
+        queue = WriteBackQueue(threads=1, rate=2, exceptions=(ValueError,))
+        done = []
+
+        def job():
+            raise KeyError("a")
+
+        queue.submit("touch", "a", job)
+        for key in ("b", "c", "d"):
+            queue.submit("touch", key, lambda x=key: done.append(x) or True)
+        with pytest.raises(KeyError):
+            queue.wait()
+        assert len(done) <= 1
+
+    def test_rate(self):
+        queue = WriteBackQueue(threads=4, rate=20)
+        start = time.monotonic()
+        for i in range(6):
+            queue.submit("touch", str(i), lambda: True)
+        queue.wait()
+        assert time.monotonic() - start >= 0.25